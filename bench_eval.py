@@ -0,0 +1,265 @@
+#!/usr/bin/python3
+
+import io
+import os
+import sys
+import time
+import shutil
+import tempfile
+import timeit
+import functools
+import imp_to_python
+import imp_optimize
+import imp_batch
+from imp_lexer import *
+from imp_parser import *
+import imp
+
+'''
+Evaluation benchmarks, comparing the engines imp.py can run a program with.
+
+    python3 bench_eval.py [batch] [cache] [counting] [factorial] [files] [kernels] [loop] [optimize] [statements]
+                          [variables] [iterations]
+
+loop runs a hello.imp-style counting loop, summing instead of multiplying so the numbers stay machine-sized:
+
+    n := 10000000; s := 0; while n > 0 do s := s + n; n := n - 1 end
+
+The optional iteration count defaults to 10^7. factorial runs hello.imp itself with larger n; the product grows
+into a huge integer, so after a few thousand iterations the time goes into bignum multiplication and not into the
+engine, which is why the loop benchmark is the one to scale up.
+
+batch runs a program over a sweep of initial environments, with imp_batch and with a loop of eval calls.
+
+cache times imp_to_python.load on a long generated program: cold (nothing cached, so lex, parse, translate and
+compile), from the disk cache, and from the memory cache.
+
+optimize runs a loop full of constant subexpressions with every engine, before and after imp_optimize.
+
+counting runs a counting loop that close_counting_loops replaces by its closed form, before and after imp_optimize.
+
+files runs a corpus of generated programs with imp.run_batch, the run-batch mode of imp.py, with 1, 2, 4 and
+more worker processes up to the number of CPUs, and reports the programs run per second.
+
+kernels runs loop kernels with invariant expressions and products of the loop counter with every engine, optimized
+without and with the loop passes (hoist_invariants and reduce_strength).
+
+statements parses and runs straight-line programs of up to 100k statements, and runs them again as the nested
+CompoundStatement chain the parser used to build, with the recursion limit raised far enough for the chain.
+
+variables runs a loop that reads and writes many variables per iteration, where slot resolution pays off most,
+and times a bare read and write of one variable in a dict, a list and an array('q').
+'''
+
+def counting_loop(n):
+    return 'n := %d; s := 0; while n > 0 do s := s + n; n := n - 1 end' % n
+
+def factorial(n):
+    return 'n := %d; p := 1; while n > 0 do p := p * n; n := n - 1 end' % n
+
+def time_engines(code, repeat=1):
+    ast = imp_parse(imp_lex(code)).value
+    times = {}
+    envs = {}
+    for name in sorted(imp.engines):
+        best = None
+        for i in range(repeat):
+            env = {}
+            start = time.perf_counter()
+            imp.engines[name](ast, env)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        times[name] = best
+        envs[name] = env
+    for env in envs.values():
+        if env != envs['tree']:
+            raise RuntimeError('engines disagree on the final environment')
+    return times
+
+def report(label, times):
+    tree = times['tree']
+    parts = ['%s %8.3f s (%5.1fx)' % (name, times[name], tree / times[name]) for name in sorted(times)]
+    sys.stdout.write('%-28s %s\n' % (label, '  '.join(parts)))
+
+def bench_loop(iterations=10000000):
+    for n in sorted(set([iterations // 100, iterations // 10, iterations])):
+        report('counting loop %d' % n, time_engines(counting_loop(n)))
+
+def bench_factorial():
+    for n in [100, 1000, 10000]:
+        report('factorial %d' % n, time_engines(factorial(n), repeat=3))
+
+def constant_loop(n):
+    return ('n := %d; s := 0; while n > 0 and not not (2 * 3 > 5) do '
+            's := s + (2 * 3) * 1 + n * (4 - 3) + 0; if 1 > 2 then s := s - 1 end; n := n - (1 + 0) end' % n)
+
+def bench_optimize():
+    ast = imp_parse(imp_lex(constant_loop(100000))).value
+    optimized = imp_optimize.optimize(ast)
+    for name in sorted(imp.engines):
+        times = []
+        for program in [ast, optimized]:
+            start = time.perf_counter()
+            imp.engines[name](program, {})
+            times.append(time.perf_counter() - start)
+        sys.stdout.write('%-9s plain %7.3f s  optimized %7.3f s  %5.2fx\n' %
+                         (name, times[0], times[1], times[0] / times[1]))
+
+loop_kernels = {
+    'invariant': 'i := 0; s := 0; while i < %d do s := s + a * b + c * (a - b); i := i + 1 end',
+    'invariant bound': 'n := %d; i := 0; while i < (n + 1) * 2 - n do s := s + i; i := i + 1 end',
+    'strided': 'i := 0; s := 0; while i < %d do s := s + i * 4 + i * 4 * (i * 4); i := i + 1 end',
+    'both': 'i := 0; s := 0; while i < %d do s := s + i * 8 + a * b; t := t + i * 8 - a * b; i := i + 1 end',
+}
+
+def bench_kernels(n=200000):
+    for kernel, code in sorted(loop_kernels.items()):
+        ast = imp_parse(imp_lex(code % n)).value
+        programs = [imp_optimize.optimize(ast, imp_optimize.expression_passes), imp_optimize.optimize(ast)]
+        for name in sorted(imp.engines):
+            times = []
+            for program in programs:
+                start = time.perf_counter()
+                imp.engines[name](program, {})
+                times.append(time.perf_counter() - start)
+            sys.stdout.write('%-16s %-9s expressions %7.3f s  loops %7.3f s  %5.2fx\n' %
+                             (kernel, name, times[0], times[1], times[0] / times[1]))
+
+def bench_counting():
+    for n in [1000, 100000, 1000000]:
+        ast = imp_parse(imp_lex('i := 0; s := 0; while i < %d do s := s + 3; t := t - a * 2; i := i + 1 end' % n)).value
+        optimized = imp_optimize.optimize(ast)
+        for name in sorted(imp.engines):
+            times = []
+            for program in [ast, optimized]:
+                start = time.perf_counter()
+                imp.engines[name](program, {})
+                times.append(time.perf_counter() - start)
+            sys.stdout.write('%8d %-9s plain %9.5f s  closed %9.5f s  %9.1fx\n' %
+                             (n, name, times[0], times[1], times[0] / times[1]))
+
+def bench_files(count=2000):
+    directory = tempfile.mkdtemp()
+    try:
+        filenames = []
+        for i in range(count):
+            filenames.append(os.path.join(directory, 'program%d.imp' % i))
+            with open(filenames[-1], 'w') as file:
+                file.write(counting_loop(2000 + i % 100))
+        cpus = os.cpu_count() or 1
+        for workers in sorted(set([1, 2, 4, cpus])):
+            start = time.perf_counter()
+            imp.run_batch(filenames, io.StringIO(), workers=workers)
+            elapsed = time.perf_counter() - start
+            sys.stdout.write('%2d workers (%d CPUs)  %d programs %7.3f s  %7.1f programs/s\n' %
+                             (workers, cpus, count, elapsed, count / elapsed))
+    finally:
+        shutil.rmtree(directory)
+
+def variable_loop(n):
+    return ('i := 0; a := 1; b := 2; c := 3; d := 4; '
+            'while i < %d do a := b + c; b := a - c + i; c := b - a; d := a + c - d; i := i + 1 end' % n)
+
+def bench_variables():
+    for n in [10000, 100000]:
+        report('variable loop %d' % n, time_engines(variable_loop(n)))
+    setup = 'from array import array; env = {"x": 5, "y": 6}; slots = [5, 6]; ints = array("q", [5, 6])'
+    for name, statement in [('dict', 'env["x"] = env["y"] + 1'), ('list', 'slots[0] = slots[1] + 1'),
+                            ('array q', 'ints[0] = ints[1] + 1')]:
+        best = min(timeit.repeat(statement, setup, number=1000000, repeat=5))
+        sys.stdout.write('%-8s read and write %6.1f ns\n' % (name, best * 1000.0))
+
+def sweep_program():
+    return ('p := 1; s := 0; while n > 0 do p := p * 2; if n - (n / 3) * 3 < 1 then s := s + n end; '
+            'n := n - 1 end')
+
+def bench_batch():
+    ast = imp_parse(imp_lex(sweep_program())).value
+    for lanes, spread in [(1000, 1), (10000, 1), (10000, 64)]:
+        # spread is how far the initial n of the lanes, and so their trip counts, differ
+        envs = [{'n': 32 + lane % spread} for lane in range(lanes)]
+        start = time.perf_counter()
+        for env in [dict(env) for env in envs]:
+            ast.eval(env)
+        scalar = time.perf_counter() - start
+        start = time.perf_counter()
+        imp_batch.run_batch(ast, [dict(env) for env in envs])
+        batch = time.perf_counter() - start
+        sys.stdout.write('%6d lanes, n spread %3d  eval loop %7.3f s  batch %7.3f s  %5.1fx\n' %
+                         (lanes, spread, scalar, batch, scalar / batch))
+
+def statement_program(count):
+    statements = []
+    for i in range(count):
+        if i % 3 == 0:
+            statements.append('while x%d > 0 do x%d := x%d - 1; y := y + %d end' % (i, i, i, i))
+        else:
+            statements.append('x%d := %d * (y + %d)' % (i + 1, i % 7, i))
+    return '; '.join(statements)
+
+def bench_cache():
+    directory = tempfile.mkdtemp()
+    try:
+        for count in [100, 1000, 10000]:
+            source = statement_program(count)
+            imp_to_python.memory_cache.clear()
+            times = []
+            for clear_memory in [True, True, False]:
+                if clear_memory:
+                    imp_to_python.memory_cache.clear()
+                start = time.perf_counter()
+                imp_to_python.load(source, directory)
+                times.append(time.perf_counter() - start)
+            sys.stdout.write('%6d statements  cold %8.4f s  disk cache %8.4f s  memory cache %8.4f s\n' %
+                             (count, times[0], times[1], times[2]))
+    finally:
+        shutil.rmtree(directory)
+
+def straight_line_program(count):
+    return '; '.join('x%d := x%d + %d' % (i % 50, (i + 7) % 50, i) for i in range(count))
+
+def bench_statements():
+    limit = sys.getrecursionlimit()
+    try:
+        for count in [1000, 10000, 100000]:
+            tokens = imp_lex(straight_line_program(count))
+            start = time.perf_counter()
+            block = imp_parse(tokens).value
+            parse = time.perf_counter() - start
+            chain = functools.reduce(CompoundStatement, block.statements)
+            sys.setrecursionlimit(max(limit, count + 1000))
+            times = []
+            for program in [block, chain]:
+                best = None
+                for i in range(3):
+                    start = time.perf_counter()
+                    program.eval({})
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                times.append(best)
+            sys.stdout.write('%6d statements  parse %7.3f s  eval block %7.4f s  chain %7.4f s  %5.2fx\n' %
+                             (count, parse, times[0], times[1], times[1] / times[0]))
+    finally:
+        sys.setrecursionlimit(limit)
+
+benchmarks = {
+    'batch': bench_batch,
+    'cache': bench_cache,
+    'counting': bench_counting,
+    'factorial': bench_factorial,
+    'files': bench_files,
+    'kernels': bench_kernels,
+    'loop': bench_loop,
+    'optimize': bench_optimize,
+    'statements': bench_statements,
+    'variables': bench_variables,
+}
+
+if __name__ == '__main__':
+    names = [arg for arg in sys.argv[1:] if not arg.isdigit()] or sorted(benchmarks)
+    counts = [int(arg) for arg in sys.argv[1:] if arg.isdigit()]
+    for name in names:
+        if name == 'loop' and counts:
+            bench_loop(counts[0])
+        else:
+            benchmarks[name]()
@@ -0,0 +1,177 @@
+#!/usr/bin/python3
+
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import lexer
+from imp_lexer import *
+
+'''
+Lexer throughput on generated IMP sources.
+
+    python3 bench_lexer.py [megabytes ...]
+    python3 bench_lexer.py --memory [megabytes]
+    python3 bench_lexer.py --buffer [megabytes]
+    python3 bench_lexer.py --identifiers [megabytes]
+
+Each size is lexed with imp_lex and the tokens-per-second rate is reported. With --memory a program of the given
+size (100 MB by default) is written to a temporary file and lexed in child processes, once with imp_lex on the
+whole text and once by draining imp_lex_stream, and the peak RSS of each child is reported. Two more children
+also parse the program: one lexes it into a list with imp_lex_stream first, the other does what imp.py does and
+lexes it into a TokenBuffer. Parsing is slow, so give --memory a size of a few megabytes to include them; they
+are skipped above 16 MB.
+With --buffer the memory held by a token list and by a TokenBuffer for the same program are compared.
+With --identifiers an identifier-heavy program is lexed with the keyword table and with the old per-keyword
+expressions.
+'''
+
+def generate_program(size):
+    # Loops shaped like hello.imp with enough distinct names and comments to exercise every token rule
+    lines = []
+    length = 0
+    i = 0
+    while length < size:
+        block = ('# block %d\n'
+                 'n%d := %d;\n'
+                 'p%d := 1;\n'
+                 'while n%d > 0 and not p%d >= 1000000 do\n'
+                 '  p%d := p%d * (n%d + 1) / 2;\n'
+                 '  n%d := n%d - 1\n'
+                 'end;\n') % ((i,) * 11)
+        lines.append(block)
+        length += len(block)
+        i += 1
+    lines.append('done := 1\n')
+    return ''.join(lines)
+
+def bench_lex(text, lex=imp_lex):
+    start = time.perf_counter()
+    tokens = lex(text)
+    elapsed = time.perf_counter() - start
+    return len(tokens), elapsed
+
+def write_program(filename, size):
+    with open(filename, 'w') as file:
+        written = 0
+        while written < size:
+            if written:
+                file.write(';\n') # keep the concatenated parts one parsable program
+            part = generate_program(min(size - written, 1048576))
+            file.write(part)
+            written += len(part)
+
+def child_lex(mode, filename):
+    count = 0
+    if mode == 'lex':
+        with open(filename) as file:
+            count = len(imp_lex(file.read()))
+    elif mode == 'stream':
+        with open(filename) as file:
+            for token in imp_lex_stream(file):
+                count += 1
+    else:
+        from imp_parser import imp_parse
+        with open(filename) as file:
+            if mode == 'stream+parse':
+                tokens = list(imp_lex_stream(file))
+            else:
+                tokens = imp_lex_buffer(file.read())
+        if not imp_parse(tokens):
+            raise RuntimeError('benchmark program did not parse')
+        count = len(tokens)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    sys.stdout.write('%d %d\n' % (count, peak))
+
+def bench_memory(size):
+    fd, filename = tempfile.mkstemp(suffix='.imp')
+    os.close(fd)
+    try:
+        write_program(filename, size)
+        modes = ['lex', 'stream']
+        if size <= 16 * 1048576:
+            modes += ['stream+parse', 'imp.py']
+        for mode in modes:
+            output = subprocess.check_output([sys.executable, __file__, '--child', mode, filename])
+            count, peak = [int(field) for field in output.split()]
+            sys.stdout.write('%-12s  %6.1f MB source  %9d tokens  peak RSS %8.1f MB\n' %
+                             (mode, size / 1048576.0, count, peak / 1024.0))
+    finally:
+        os.remove(filename)
+
+def bench_token_memory(size):
+    # Memory held by the tokens alone; the source text is shared by both representations
+    text = generate_program(size)
+    for name, lex in [('list', imp_lex), ('TokenBuffer', imp_lex_buffer)]:
+        tracemalloc.start()
+        tokens = lex(text)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        start = time.perf_counter()
+        keywords = 0
+        for pos in range(len(tokens)):
+            if tokens[pos][1] is RESERVED:
+                keywords += 1
+        elapsed = time.perf_counter() - start
+        sys.stdout.write('%-12s %9d tokens  %8.1f MB held  %6.1f bytes/token  tag scan %6.3f s\n' %
+                         (name, len(tokens), current / 1048576.0, current / float(len(tokens)), elapsed))
+    start = time.perf_counter()
+    codes = tokens.tag_codes(RESERVED)
+    keywords = sum(1 for code in tokens.codes if code in codes)
+    elapsed = time.perf_counter() - start
+    sys.stdout.write('%-12s %9d tokens  %36s tag scan %6.3f s\n' % ('  codes', len(tokens), '', elapsed))
+
+def generate_identifiers(size):
+    # Mostly identifiers, many of them starting with a keyword, to stress identifier and keyword recognition
+    words = ['order', 'endx', 'iffy', 'done', 'note', 'total', 'doubled', 'thence', 'printer', 'forward']
+    lines = []
+    length = 0
+    i = 0
+    while length < size:
+        line = '%s%d := %s + %s%d * %s;\n' % (words[i % 10], i, words[(i + 3) % 10],
+                                                words[(i + 7) % 10], i, words[(i + 1) % 10])
+        lines.append(line)
+        length += len(line)
+        i += 1
+    lines.append('x := 0\n')
+    return ''.join(lines)
+
+def legacy_token_exprs():
+    # The token expressions as they were before keywords moved into a table: one regex per keyword, tried first
+    words = ['and', 'or', 'not', 'if', 'then', 'else', 'while', 'do', 'end', 'for', 'print', 'scan']
+    return token_exprs[:-2] + [(word, RESERVED) for word in words] + token_exprs[-2:]
+
+def bench_identifiers(size):
+    text = generate_identifiers(size)
+    legacy = legacy_token_exprs()
+    for name, lex in [('keyword regexes', lambda text: lexer.lex(text, legacy)),
+                      ('keyword table', imp_lex)]:
+        count, elapsed = bench_lex(text, lex)
+        sys.stdout.write('%-16s %6.1f MB  %9d tokens  %7.3f s  %12.0f tokens/s\n' %
+                         (name, len(text) / 1048576.0, count, elapsed, count / elapsed))
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--identifiers']:
+        megabytes = float(sys.argv[2]) if len(sys.argv) > 2 else 4
+        bench_identifiers(int(megabytes * 1048576))
+        sys.exit(0)
+    if sys.argv[1:2] == ['--buffer']:
+        megabytes = float(sys.argv[2]) if len(sys.argv) > 2 else 4
+        bench_token_memory(int(megabytes * 1048576))
+        sys.exit(0)
+    if sys.argv[1:2] == ['--child']:
+        child_lex(sys.argv[2], sys.argv[3])
+        sys.exit(0)
+    if sys.argv[1:2] == ['--memory']:
+        megabytes = float(sys.argv[2]) if len(sys.argv) > 2 else 100
+        bench_memory(int(megabytes * 1048576))
+        sys.exit(0)
+    sizes = [float(arg) for arg in sys.argv[1:]] or [1, 4, 16]
+    for megabytes in sizes:
+        text = generate_program(int(megabytes * 1024 * 1024))
+        count, elapsed = bench_lex(text)
+        sys.stdout.write('%6.1f MB  %9d tokens  %7.3f s  %12.0f tokens/s\n' %
+                         (len(text) / 1048576.0, count, elapsed, count / elapsed))
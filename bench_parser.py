@@ -0,0 +1,428 @@
+#!/usr/bin/python3
+
+import gc
+import os
+import sys
+import random
+import time
+import shutil
+import tempfile
+import pickle
+import subprocess
+import tracemalloc
+import concurrent.futures
+import imp_parser
+import imp_parallel_parser
+import imp_optimize
+import imp_intern
+import imp_parse_cache
+import imp_serialize
+import imp_incremental
+from imp_lexer import *
+from imp_parser import *
+
+'''
+Parser benchmarks.
+
+    python3 bench_parser.py [deep] [incremental] [intern] [ll1] [memory] [packrat] [parallel] [pratt] [serialize]
+                            [startup] [throughput]
+
+packrat parses conditions nested in more and more parentheses, with and without the packrat memo table. Without
+it every nesting level re-parses the arithmetic expression inside it, so the time grows quadratically with the
+depth; with it the time grows linearly.
+
+throughput parses a handful of small programs over and over, with the shared grammar and with the grammar rebuilt
+before every parse.
+
+pratt parses long a + b * c - ... chains with the Exp stack built by precedence() and with the OperatorPrecedence
+parser that aexp uses.
+
+ll1 parses statement-heavy programs with the combinator and the ll1 statement backends.
+
+parallel parses statement programs of up to 1.1 million tokens serially and with imp_parse_parallel, with 1, 2,
+4 and more workers up to the number of CPUs. The pool is started before the clock starts; the time to split the
+tokens, send the chunks and join the statements is included.
+
+memory parses programs of up to a million AST nodes and reports the memory the tree holds on to, traced from before
+the parse to after it with the tokens already built, per node and as the sys.getsizeof of the node objects, and the
+time one eval of the program takes.
+
+intern parses generated programs that repeat a few statement shapes, as plain trees and interned through an
+imp_intern.NodeFactory: the memory the tree holds on to, the time interning takes, and the time to compare two
+parses of the program and to hash every statement of it.
+
+serialize writes and reads statement programs of up to 100k statements with pickle and with imp_serialize, and
+reports the size and the times to write, to read from bytes, and to read from a file (which imp_serialize maps
+into memory). imp_serialize switches the garbage collector off while it reads (see imp_parallel_parser), so pickle
+is timed both ways.
+
+startup runs imp.py on statement programs of up to 100k statements in a fresh process, with --no-cache, cold (the
+program is parsed and written to an empty parse cache) and warm (it is read from the cache), and times
+imp_parse_cache.load the same three ways inside one process.
+
+deep finds the nesting depth at which the combinator parser runs out of stack, then parses blocks and parentheses
+nested 1000 and 10000 deep with the stack backend, reporting the time and the peak memory traced while parsing.
+
+incremental makes random edits to statement programs of 1k to 50k lines, one statement a line, and reparses them
+with imp_incremental.reparse: a character typed or deleted, a statement pasted in, a few characters cut out. Each
+edit is undone again right away, which is timed too, so the program stays much the same throughout. It reports the
+median, 99th percentile and maximum time per reparse against the time a full lex and parse of the program takes,
+and the time parsed.ast then takes to put the top level BlockStatement together. The final result is checked
+against a full parse.
+'''
+
+def nested_condition(depth):
+    condition = 'x < 1'
+    for i in range(depth):
+        condition = '(%s and (y%d < %d or not z > 2))' % (condition, i, i)
+    return 'if %s then y := 1 end' % condition
+
+def parenthesised_condition(depth):
+    return 'if %sx < 1%s then y := 1 end' % ('(' * depth, ')' * depth)
+
+def time_parse(tokens, repeat=5, **options):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = imp_parse(tokens, **options)
+        elapsed = time.perf_counter() - start
+        if not result:
+            raise RuntimeError('benchmark program did not parse')
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def bench_packrat():
+    for name, generate in [('parenthesised', parenthesised_condition), ('nested and/or', nested_condition)]:
+        for depth in [4, 8, 16, 32, 48]:
+            tokens = imp_lex(generate(depth))
+            plain = time_parse(tokens, memo=False)
+            packrat = time_parse(tokens, memo=True)
+            sys.stdout.write('%-14s depth %3d  %6d tokens  no memo %8.4f s  packrat %8.4f s  %6.1fx\n' %
+                             (name, depth, len(tokens), plain, packrat, plain / packrat))
+
+small_programs = [
+    'n := 5; p := 1; while n > 0 do p := p * n; n := n - 1 end',
+    'x := 1; y := 2',
+    'if x < 1 and y >= 2 then z := (x + y) * 3 else z := 0 end',
+    'i := 0; s := 0; while i < 10 do s := s + i; i := i + 1 end',
+]
+
+def rebuild_grammar():
+    # What every imp_parse call used to do: throw the grammar away and build it again
+    for value in vars(imp_parser).values():
+        if hasattr(value, 'cache_clear'):
+            value.cache_clear()
+
+def bench_throughput(seconds=1.0):
+    token_lists = [imp_lex(code) for code in small_programs]
+    for name, before_parse in [('shared grammar', None), ('rebuilt grammar', rebuild_grammar)]:
+        parses = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            for tokens in token_lists:
+                if before_parse:
+                    before_parse()
+                imp_parse(tokens)
+            parses += len(token_lists)
+        elapsed = time.perf_counter() - start
+        sys.stdout.write('%-16s %8d parses  %10.0f parses/s\n' % (name, parses, parses / elapsed))
+
+def operator_chain(length):
+    operators = ['+', '*', '-', '/']
+    parts = ['a0']
+    for i in range(1, length):
+        parts.append(operators[i % 4])
+        parts.append('a%d' % i if i % 3 else str(i))
+    return ' '.join(parts)
+
+def time_parser(parser, tokens, repeat=5):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = parser(tokens, 0)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+def bench_pratt():
+    exp_parser = precedence(aexp_term(), aexp_precedence_levels, process_binop)
+    sys.setrecursionlimit(20000) # comparing the left-nested trees recurses once per operator
+    for length in [1, 10, 100, 1000, 3000]:
+        tokens = imp_lex(operator_chain(length))
+        expected, exp_time = time_parser(exp_parser, tokens)
+        actual, pratt_time = time_parser(aexp(), tokens)
+        if expected.value != actual.value or actual.pos != len(tokens):
+            raise RuntimeError('operator precedence parser disagrees with the Exp stack')
+        sys.stdout.write('chain of %5d operands  Exp stack %8.4f s  OperatorPrecedence %8.4f s  %5.1fx\n' %
+                         (length, exp_time, pratt_time, exp_time / pratt_time))
+
+def statement_program(count):
+    # Straight-line assignments with ifs and whiles mixed in; while statements are the last alternative tried
+    statements = []
+    for i in range(count):
+        if i % 4 == 0:
+            statements.append('while x%d > 0 do x%d := x%d - 1; y := y + 1 end' % (i, i, i))
+        elif i % 4 == 1:
+            statements.append('if x%d < y then z := z + 1 else z := z - 1 end' % i)
+        else:
+            statements.append('x%d := %d' % (i, i))
+    return '; '.join(statements)
+
+def bench_ll1():
+    for count in [100, 1000, 10000]:
+        tokens = imp_lex(statement_program(count))
+        combinator = time_parse(tokens, repeat=3, backend='combinator')
+        ll1 = time_parse(tokens, repeat=3, backend='ll1')
+        sys.stdout.write('%6d statements  %7d tokens  combinator %8.4f s  ll1 %8.4f s  %5.2fx\n' %
+                         (count, len(tokens), combinator, ll1, combinator / ll1))
+
+def bench_parallel():
+    cpus = os.cpu_count() or 1
+    for count in [10000, 100000]:
+        tokens = imp_lex_buffer(statement_program(count))
+        start = time.perf_counter()
+        expected = imp_parse(tokens)
+        serial = time.perf_counter() - start
+        sys.stdout.write('%6d statements  %8d tokens  serial %7.3f s\n' % (count, len(tokens), serial))
+        for workers in sorted(set([1, 2, 4, cpus])):
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+                executor.submit(len, '').result() # starts the pool
+                start = time.perf_counter()
+                result = imp_parallel_parser.imp_parse_parallel(tokens, workers, executor=executor)
+                elapsed = time.perf_counter() - start
+            if result.value != expected.value:
+                raise RuntimeError('parallel parse disagrees with the serial one')
+            sys.stdout.write('%42s %2d workers (%d CPUs) %7.3f s  %5.2fx\n' %
+                             ('', workers, cpus, elapsed, serial / elapsed))
+
+def nested_blocks(depth):
+    return 'while x < 1 do if y > 2 then ' * depth + 'x := 1' + ' end end' * depth
+
+def nested_parentheses(depth):
+    return 'x := %s1%s; if %sx%s < 1 then y := 1 end' % ('(' * depth, ')' * depth, '(' * depth, ')' * depth)
+
+def deepest_combinator_parse(generate):
+    # Largest depth (to within 10%) the recursive combinator parser handles before a RecursionError
+    depth = 8
+    while True:
+        try:
+            imp_parse(imp_lex(generate(depth)))
+        except RecursionError:
+            return depth * 10 // 11
+        depth = depth * 11 // 10 + 1
+
+def bench_deep():
+    for name, generate in [('nested blocks', nested_blocks), ('parentheses', nested_parentheses)]:
+        sys.stdout.write('%-14s combinator parser fails beyond depth ~%d\n' % (name, deepest_combinator_parse(generate)))
+        for depth in [1000, 10000]:
+            tokens = imp_lex(generate(depth))
+            tracemalloc.start()
+            start = time.perf_counter()
+            result = imp_parse(tokens, backend='stack')
+            elapsed = time.perf_counter() - start
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            if not result:
+                raise RuntimeError('benchmark program did not parse')
+            sys.stdout.write('%-14s depth %5d  %7d tokens  stack parser %7.3f s  peak %7.1f MB\n' %
+                             (name, depth, len(tokens), elapsed, peak / 1048576.0))
+            del result
+
+def expression_program(count):
+    # Eight nodes a statement: the assignment, three operators, three variables and a literal
+    return '; '.join('x%d := y%d * (z + %d) - w' % (i % 100, i % 37, i) for i in range(count))
+
+def bench_memory():
+    for count in [1250, 12500, 125000]:
+        tokens = imp_lex(expression_program(count))
+        gc.collect()
+        tracemalloc.start()
+        program = imp_parse(tokens, backend='stack').value
+        gc.collect()
+        held = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        nodes = 0
+        size = 0
+        pending = [program]
+        while pending:
+            node = pending.pop()
+            nodes += 1
+            size += sys.getsizeof(node) + (sys.getsizeof(node.__dict__) if hasattr(node, '__dict__') else 0)
+            pending.extend(imp_optimize.children(node))
+        start = time.perf_counter()
+        program.eval({})
+        elapsed = time.perf_counter() - start
+        sys.stdout.write('%8d nodes  tree %7.1f MB  %5.1f bytes/node  objects %5.1f bytes/node  eval %7.3f s\n' %
+                         (nodes, held / 1048576.0, held / nodes, size / nodes, elapsed))
+
+def repetitive_program(count):
+    # A few shapes of statement over a few variables, as generated code tends to be
+    shapes = ['x%d := (y + %d) * (z - 1)', 'if x%d > %d then y := y + 1 else z := z - 1 end',
+              'while x%d < %d do x%d := x%d + 1 end']
+    statements = []
+    for i in range(count):
+        shape = shapes[i % len(shapes)]
+        statements.append(shape % ((i % 10, i % 5) + (i % 10,) * (shape.count('%') - 2)))
+    return '; '.join(statements)
+
+def held_memory(build):
+    # What build() returns, and the memory still traced once it has returned
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, held
+
+def time_call(function, repeat=3):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def bench_intern():
+    for count in [1000, 10000, 100000]:
+        tokens = imp_lex(repetitive_program(count))
+        plain, plain_held = held_memory(lambda: imp_parse(tokens, backend='stack').value)
+        other = imp_parse(tokens, backend='stack').value
+        intern_time = time_call(lambda: imp_intern.intern_tree(other), repeat=1)
+        factory = imp_intern.NodeFactory()
+        interned, interned_held = held_memory(lambda: factory.intern(imp_parse(tokens, backend='stack').value))
+        other_interned = factory.intern(other)
+        sys.stdout.write('%6d statements  plain %7.2f MB  interned %7.2f MB (%d nodes)  intern %6.3f s\n' %
+                         (count, plain_held / 1048576.0, interned_held / 1048576.0, len(factory), intern_time))
+        for name, first, second in [('plain', plain, other), ('interned', interned, other_interned)]:
+            equal = time_call(lambda: first == second)
+            hashed = time_call(lambda: [hash(statement) for statement in first.statements])
+            sys.stdout.write('%24s %-8s  compare two parses %9.6f s  hash every statement %9.6f s\n' %
+                             ('', name, equal, hashed))
+
+def bench_serialize():
+    directory = tempfile.mkdtemp()
+    filename = os.path.join(directory, 'program')
+    try:
+        for count in [1000, 10000, 100000]:
+            program = imp_parse(imp_lex(statement_program(count)), backend='stack').value
+            formats = [('pickle', lambda: pickle.dumps(program, pickle.HIGHEST_PROTOCOL), pickle.loads, pickle.load),
+                       ('pickle, gc off', lambda: pickle.dumps(program, pickle.HIGHEST_PROTOCOL),
+                        lambda data: paused(pickle.loads, data), lambda file: paused(pickle.load, file)),
+                       ('imp_serialize', lambda: imp_serialize.dumps(program), imp_serialize.loads,
+                        imp_serialize.load)]
+            for name, dumps, loads, load in formats:
+                data = dumps()
+                write_time = time_call(dumps)
+                read_time = time_call(lambda: loads(data))
+                with open(filename, 'wb') as file:
+                    file.write(data)
+                def read_file():
+                    with open(filename, 'rb') as file:
+                        return load(file)
+                file_time = time_call(read_file)
+                if read_file() != program:
+                    raise RuntimeError('%s does not read back what it wrote' % name)
+                sys.stdout.write('%6d statements  %-14s %9d bytes  write %7.3f s  read %7.3f s  from file %7.3f s\n' %
+                                 (count, name, len(data), write_time, read_time, file_time))
+    finally:
+        shutil.rmtree(directory)
+
+def paused(function, argument):
+    with imp_parallel_parser.collector_paused():
+        return function(argument)
+
+def bench_startup():
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'imp.py')
+    directory = tempfile.mkdtemp()
+    environment = dict(os.environ, IMP_CACHE_DIR=os.path.join(directory, 'cache'))
+    cache_dir = os.path.join(directory, 'cache', 'ast')
+    try:
+        for count in [1000, 10000, 100000]:
+            filename = os.path.join(directory, 'program.imp')
+            with open(filename, 'w') as file:
+                file.write(statement_program(count))
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            times = []
+            for options in [['--no-cache'], [], []]:
+                start = time.perf_counter()
+                subprocess.run([sys.executable, script, filename] + options, env=environment, check=True,
+                               stdout=subprocess.DEVNULL)
+                times.append(time.perf_counter() - start)
+            sys.stdout.write('%6d statements  imp.py  no cache %7.3f s  cold %7.3f s  warm %7.3f s  %5.1fx\n' %
+                             (count, times[0], times[1], times[2], times[0] / times[2]))
+            with open(filename) as file:
+                source = file.read()
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            times = []
+            for use_disk in [False, True, True]:
+                start = time.perf_counter()
+                imp_parse_cache.load(source, cache_dir=cache_dir, use_disk=use_disk)
+                times.append(time.perf_counter() - start)
+            sys.stdout.write('%6d statements  load    no cache %7.3f s  cold %7.3f s  warm %7.3f s  %5.1fx\n' %
+                             (count, times[0], times[1], times[2], times[0] / times[2]))
+    finally:
+        shutil.rmtree(directory)
+
+def line_program(count):
+    # statement_program with one statement a line: count statements take count * 5 / 4 lines
+    return statement_program(count).replace('; ', ';\n')
+
+def random_edit(rand, source):
+    # An offset, a number of characters removed there and the text inserted instead
+    offset = rand.randint(0, len(source))
+    kind = rand.random()
+    if kind < 0.4:
+        return offset, 0, rand.choice(['1', 'x', ' ', '+'])
+    if kind < 0.7:
+        return offset, min(1, len(source) - offset), ''
+    if kind < 0.85:
+        return offset, 0, 'y := y * 2;\n'
+    return offset, min(rand.randint(2, 10), len(source) - offset), ''
+
+def bench_incremental(edits=500):
+    rand = random.Random(0)
+    for count in [800, 8000, 40000]:
+        source = line_program(count)
+        start = time.perf_counter()
+        tokens = imp_lex(source)
+        imp_parse(tokens)
+        full_time = time.perf_counter() - start
+        parsed = imp_incremental.parse_source(source)
+        times = []
+        for i in range(edits):
+            offset, removed, inserted = random_edit(rand, parsed.source)
+            undo = (offset, len(inserted), parsed.source[offset:offset + removed])
+            for edit in [(offset, removed, inserted), undo]:
+                start = time.perf_counter()
+                parsed = imp_incremental.reparse(parsed, *edit)
+                times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        ast = parsed.ast
+        ast_time = time.perf_counter() - start
+        if parsed.source != source or ast != imp_parse(imp_lex(source)).value:
+            raise RuntimeError('incremental parse differs from a full parse')
+        times.sort()
+        sys.stdout.write('%6d lines  full parse %7.3f s  reparse median %8.5f s  99%% %8.5f s  max %8.5f s  '
+                         'ast %8.5f s\n' % (source.count('\n') + 1, full_time, times[len(times) // 2],
+                                             times[len(times) * 99 // 100], times[-1], ast_time))
+
+benchmarks = {
+    'deep': bench_deep,
+    'incremental': bench_incremental,
+    'intern': bench_intern,
+    'll1': bench_ll1,
+    'memory': bench_memory,
+    'packrat': bench_packrat,
+    'parallel': bench_parallel,
+    'pratt': bench_pratt,
+    'serialize': bench_serialize,
+    'startup': bench_startup,
+    'throughput': bench_throughput,
+}
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or sorted(benchmarks)
+    for name in names:
+        benchmarks[name]()
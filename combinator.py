@@ -21,6 +21,10 @@ class Parser:
 		return Alternate(self, other)
 	def __xor__(self, function):
 		return Process(self, function)
+	def first(self):
+		#FIRST set: the tokens this parser can start with, as (value, tag) pairs or bare tags for any token with that
+		#tag, plus None if it can succeed without consuming anything. Used by Dispatch to build its table.
+		raise RuntimeError('no FIRST set for ' + self.__class__.__name__)
 #Reserved will be used to parse reserved words and operators; it will accept tokens with a specific value and tag
 #Remember, tokens are just value-tag pairs. token[0] is the value, token[1] is the tag
 
@@ -30,19 +34,24 @@ class Reserved(Parser):
 		self.value = value
 		self.tag = tag
 	def __call__(self,tokens, pos): #what does this mean ? pos < len(...) and \ the syntax is very different
-		if pos < len(tokens) and \
-			tokens[pos][0] == self.value and \
-			tokens[pos][1] is self.tag:
-			return Result(tokens[pos][0], pos+1)
-		else:
-			return None
+		if pos < len(tokens):
+			token = tokens[pos] #index once, tokens may be a TokenBuffer that builds the tuple on demand
+			if token[1] is self.tag and token[0] == self.value:
+				return Result(token[0], pos+1)
+		return None
+	def first(self):
+		return set([(self.value, self.tag)])
 class Tag(Parser):
 	def __init__(self, tag):
 		self.tag = tag
 	def __call__(self, tokens, pos):
-		if pos < len(tokens) and tokens[pos][1] is self.tag:
-			return Result(tokens[pos][0], pos + 1)
-		else : return None
+		if pos < len(tokens):
+			token = tokens[pos]
+			if token[1] is self.tag:
+				return Result(token[0], pos + 1)
+		return None
+	def first(self):
+		return set([self.tag])
 
 class Concat(Parser):
 	def __init__(self, left, right):
@@ -56,6 +65,12 @@ class Concat(Parser):
 				combined_value = (left_result.value, right_result.value)
 				return Result(combined_value, right_result.pos)
 		return None
+	def first(self):
+		first = self.left.first()
+		if None in first:
+			first.discard(None)
+			first |= self.right.first()
+		return first
 
 #The Alternate combinator is similar. It also takes left and right parsers. It starts by applying the left parser. 
 #If successful, that result is returned. If unsuccessful, it applies the right parser and returns its result.
@@ -71,6 +86,8 @@ class Alternate(Parser):
 		else :
 			right_result = self.right(tokens, pos)
 			return right_result
+	def first(self):
+		return self.left.first() | self.right.first()
 
 #Opt is useful for optional text, such as the else-clause of an if-statement. It takes one parser as input. 
 #If that parser is successful when applied, the result is returned normally. If it fails, a successful result is still returned, 
@@ -85,6 +102,8 @@ class Opt(Parser):
 		if result:
 			return result
 		else: return (Result(None, pos))
+	def first(self):
+		return self.parser.first() | set([None])
 
 #Rep applies its input parser repeatedly until it fails. This is useful for generating lists of things. 
 #Note that Rep will successfully match an empty list and consume no tokens if its parser fails the first time it's applied.
@@ -100,6 +119,8 @@ class Rep(Parser):
 			pos = result.pos
 			result = self.parser(tokens, pos)
 		return Result(results, pos)
+	def first(self):
+		return self.parser.first() | set([None])
 
 #Process is a useful combinator which allows us to manipulate result values. Its input is a parser and a function. 
 #When the parser is applied successfully, the result value is passed to the function, and the return value from the 
@@ -113,8 +134,10 @@ class Process(Parser):
 	def __call__(self, tokens, pos):
 		result = self.parser(tokens, pos)
 		if result:
-			result.value = self.function(result.value)
-			return result
+			#a new Result rather than updating the old one, which Memo may have cached
+			return Result(self.function(result.value), result.pos)
+	def first(self):
+		return self.parser.first()
 
 '''
 Lazy is a less obviously useful combinator. Instead of taking an input parser, it takes a zero-argument 
@@ -133,6 +156,56 @@ class Lazy(Parser):
 		if not self.parser:
 			self.parser = self.parser_func()
 		return self.parser(tokens, pos)
+	def first(self):
+		if not self.parser:
+			self.parser = self.parser_func()
+		return self.parser.first()
+
+'''
+Packrat parsing. Alternate and Exp backtrack freely, so the same parser can end up being applied at the same
+position many times: bexp_relop parses a whole aexp before failing on the missing relational operator, and
+bexp_group then parses the same aexp again one token further in. Nested parentheses multiply this.
+
+Memo wraps a parser and remembers its Result (or failure) for each position, so the second attempt is a
+dictionary lookup. The memo table belongs to a single parse, not to the parser: it lives on the Packrat context
+wrapped around the token sequence of the parse, so grammars can be shared between parses and threads. Packrat
+only delegates indexing to the tokens and never copies them, so a compact TokenBuffer stays compact while it is
+parsed. On any other token sequence Memo simply applies its parser, which makes packrat mode opt-in. Memo
+entries are keyed by the Memo's key, which defaults to the Memo object itself; giving equivalent Memo objects the
+same key (the name of the rule they wrap, say) lets them share entries. The table is bounded by max_entries and is
+emptied when it fills up.
+'''
+
+class Packrat:
+	def __init__(self, tokens, max_entries=1000000):
+		self.tokens = tokens # not copied, so a TokenBuffer stays compact
+		self.memo = {}
+		self.max_entries = max_entries
+	def __len__(self):
+		return len(self.tokens)
+	def __getitem__(self, index):
+		return self.tokens[index]
+	def remember(self, key, result):
+		if len(self.memo) >= self.max_entries:
+			self.memo.clear()
+		self.memo[key] = result
+
+class Memo(Parser):
+	def __init__(self, parser, key=None):
+		self.parser = parser
+		self.key = key if key is not None else self
+	def __call__(self, tokens, pos):
+		memo = getattr(tokens, 'memo', None)
+		if memo is None:
+			return self.parser(tokens, pos)
+		key = (self.key, pos)
+		if key in memo:
+			return memo[key]
+		result = self.parser(tokens, pos)
+		tokens.remember(key, result)
+		return result
+	def first(self):
+		return self.parser.first()
 
 '''
  Phrase, takes a single input parser, applies it, and returns its result normally. 
@@ -150,6 +223,8 @@ class Phrase(Parser):
 			return result 
 		else :
 			return None
+	def first(self):
+		return self.parser.first()
 '''
 The last combinator is unfortunately the most complicated. Exp is fairly specialized; it's used to match 
 an expression which consists of a list of elements separated by something. Here's an example with compound statements:
@@ -187,16 +262,89 @@ class Exp(Parser):
         self.parser = parser
         self.seperator = seperator
     def __call__(self, tokens, pos):
+        # Same as repeatedly applying (self.seperator + self.parser ^ process_next) from result.pos, without
+        # building that parser again on every call
         result = self.parser(tokens, pos)
-        def process_next(parsed):
-            (sepfunc, right) = parsed
-            return sepfunc(result.value,right)
-        next_parser = self.seperator + self.parser ^ process_next
-        next_result = result
-        while next_result:
-            next_result = next_parser(tokens, result.pos)
-            if next_result:
-                result = next_result
-        return result            
+        while result:
+            sep_result = self.seperator(tokens, result.pos)
+            if not sep_result:
+                break
+            right_result = self.parser(tokens, sep_result.pos)
+            if not right_result:
+                break
+            result = Result(sep_result.value(result.value, right_result.value), right_result.pos)
+        return result
+    def first(self):
+        return self.parser.first()
 			
 
+
+'''
+OperatorPrecedence does the job of a stack of Exp parsers, one per precedence level, in a single parser
+(precedence climbing, a form of Pratt parsing). Each level of Exp has to fail through every tighter level before
+it sees its own operators, so even a lone integer passes through all of them. OperatorPrecedence looks the
+operator after each value up in a table instead. precedence_levels lists the operators from the tightest level to
+the loosest, combine(op) returns the function joining the left and right values, and operators are the tokens
+tagged tag. All operators are left associative, so the right operand of an operator only takes operators of
+tighter levels. The values built are exactly those of the Exp stack.
+'''
+
+class OperatorPrecedence(Parser):
+	def __init__(self, value_parser, precedence_levels, combine, tag):
+		self.value_parser = value_parser
+		self.tag = tag
+		self.levels = {}
+		self.combiners = {}
+		for level, operators in enumerate(precedence_levels):
+			for op in operators:
+				self.levels[op] = level
+				self.combiners[op] = combine(op)
+		self.loosest = len(precedence_levels) - 1
+	def __call__(self, tokens, pos):
+		return self.parse(tokens, pos, self.loosest)
+	def first(self):
+		return self.value_parser.first()
+	def parse(self, tokens, pos, max_level):
+		result = self.value_parser(tokens, pos)
+		if not result:
+			return None
+		value = result.value
+		pos = result.pos
+		while pos < len(tokens):
+			text, tag = tokens[pos]
+			level = self.levels.get(text, max_level + 1)
+			if tag is not self.tag or level > max_level:
+				break
+			right_result = self.parse(tokens, pos + 1, level - 1)
+			if not right_result:
+				break
+			value = self.combiners[text](value, right_result.value)
+			pos = right_result.pos
+		return Result(value, pos)
+
+'''
+Dispatch is an LL(1) replacement for a chain of Alternates whose alternatives all start with different tokens.
+Instead of trying each alternative in turn it looks at the next token and applies the one alternative that can
+start with it, found in a table built from the alternatives' FIRST sets. A token is looked up as a (value, tag)
+pair first and then by its tag alone, so keywords can be told apart from each other while any identifier
+selects the alternative starting with Tag(ID). Alternatives that overlap, or that can match nothing, cannot be
+dispatched on one token and are rejected when the table is built.
+'''
+
+class Dispatch(Parser):
+	def __init__(self, alternatives):
+		self.table = {}
+		for parser in alternatives:
+			for key in parser.first():
+				if key is None or key in self.table:
+					raise RuntimeError('alternatives are not LL(1) at %s' %(key,))
+				self.table[key] = parser
+	def __call__(self, tokens, pos):
+		if pos < len(tokens):
+			token = tokens[pos]
+			parser = self.table.get(token) or self.table.get(token[1])
+			if parser:
+				return parser(tokens, pos)
+		return None
+	def first(self):
+		return set(self.table)
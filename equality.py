@@ -4,10 +4,37 @@ or of a (direct, indirect or virtual) subclass thereof. If object is not an obje
 always returns false. If classinfo is a tuple of type objects (or recursively, other such tuples), return true if object 
 is an instance of any of the types. If classinfo is not a type or tuple of types and such tuples, a TypeError exception is raised.
 
+Node classes declare their fields as __slots__, in the order their __init__ takes them, so a node carries no
+per-instance __dict__. _fields collects the slots of a class and its bases, and _values, generated from it for
+each class, returns the values of the fields as a tuple; equality, hashing, repr and pickling all work from those,
+so two nodes are equal when they are of the same class and their fields are equal.
 '''
+def values_function(fields):
+	#lambda self: (self.a, self.b, ...), much faster than a getattr per field
+	return eval('lambda self: (%s)' %''.join('self.%s, ' %field for field in fields))
+
 class Equality:
+	__slots__ = ()
+	_fields = ()
+	def __init_subclass__(cls, **kwargs):
+		super().__init_subclass__(**kwargs)
+		cls._fields = tuple(field for klass in reversed(cls.__mro__) for field in klass.__dict__.get('__slots__', ()))
+		cls._values = values_function(cls._fields)
 	def __eq__(self,other):
-		return isinstance(other, self.__class__) and \
-				self.__dict__ == other.__dict__
+		return self is other or (isinstance(other, self.__class__) and \
+				self._values() == other._values())
 	def __ne__(self,other):
-		return not self.__eq__(other)
\ No newline at end of file
+		return not self.__eq__(other)
+	def __hash__(self):
+		return hash((self.__class__, self._values()))
+	def __repr__(self):
+		#Class (field, field, ...), with the items of a tuple field (the statements of a block) listed in place
+		parts = []
+		for value in self._values():
+			if isinstance(value, tuple):
+				parts.extend('%s' %item for item in value)
+			else:
+				parts.append('%s' %(value,))
+		return ('%s (%s)' %(self.__class__.__name__, ', '.join(parts)))
+	def __reduce__(self):
+		return (self.__class__, self._values())
@@ -1,26 +1,221 @@
 #!/usr/bin/python3
 \
+import io
+import os
 import sys
+import json
+import time
+import signal
+import argparse
+import contextlib
+import concurrent.futures
 from imp_parser import *
 from imp_lexer import *
+import imp_vm
+import imp_closures
+import imp_to_python
+import imp_slots
+import imp_optimize
+import imp_parallel_parser
+import imp_parse_cache
 
-def usage():
-    sys.stderr.write('Usage: imp filename\n')
-    sys.exit(1)
+def eval_tree(ast, env):
+    ast.eval(env)
+
+def eval_vm(ast, env):
+    imp_vm.run(imp_vm.compile_program(ast), env)
+
+def eval_closures(ast, env):
+    imp_closures.compile_closures(ast)(env)
+
+def eval_python(ast, env):
+    imp_to_python.run(ast, env)
+
+def eval_slots(ast, env):
+    imp_slots.resolve(ast).eval(env)
+
+# tree walks the AST with the eval methods in imp_ast, vm compiles it to bytecode and runs that (see imp_vm),
+# closures compiles every node into a specialized Python closure (see imp_closures), python translates the program
+# into a Python function (see imp_to_python), slots walks the AST like tree but with the variables resolved to list
+# slots (see imp_slots)
+engines = {
+    'closures': eval_closures,
+    'python': eval_python,
+    'slots': eval_slots,
+    'tree': eval_tree,
+    'vm': eval_vm,
+}
+
+def argument_parser():
+    parser = argparse.ArgumentParser(prog='imp', description='Run an IMP program. imp run-batch --help runs many.')
+    parser.add_argument('filename')
+    parser.add_argument('--engine', choices=sorted(engines), default='tree',
+                        help='how to run the program (default: tree)')
+    parser.add_argument('-O', '--optimize', action='store_true',
+                        help='fold constants and remove dead code before running (see imp_optimize)')
+    parser.add_argument('--parse-workers', type=int, default=None, metavar='N',
+                        help='parse a large program in N processes (see imp_parallel_parser); not with '
+                             '--engine=python, which parses only programs it has not compiled before, serially')
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false',
+                        help='parse and compile the program even if it is cached, and cache nothing')
+    return parser
+
+def run_text(text, env, engine='tree', optimize=False, parse_workers=None, use_cache=True):
+    # Runs the program in text on env; False if it does not parse. A division by zero raises with env as the
+    # program left it. With parse_workers the program is parsed in that many processes (see imp_parallel_parser).
+    # The python engine parses only programs it has not compiled before, serially. Unless use_cache is False, parsed
+    # programs are cached on disk (see imp_parse_cache) and so are compiled ones (see imp_to_python.load).
+    if engine == 'python':
+        # Compiled programs are cached by their source, so a script run before is not even parsed again
+        program = imp_to_python.load(text, use_disk=use_cache, optimize=optimize)
+        if not program:
+            return False
+        run = lambda: program(env)
+    else:
+        # The parser backtracks, so it needs every token at hand; a TokenBuffer holds them in a fraction of the memory
+        # of a token list (see bench_lexer.py --memory)
+        if parse_workers:
+            parse = lambda text: imp_parallel_parser.imp_parse_parallel(imp_lex_buffer(text), parse_workers)
+        else:
+            parse = imp_parse_cache.parse_serial
+        ast = imp_parse_cache.load(text, parse, use_disk=use_cache)
+        if ast is None:
+            return False
+        if optimize:
+            ast = imp_optimize.optimize(ast)
+        run = lambda: engines[engine](ast, env)
+    try:
+        run()
+    finally:
+        if optimize:
+            imp_optimize.strip_temporaries(env)
+    return True
+
+# imp.py run-batch runs many programs in a pool of worker processes, one job per file, and writes a JSON object per
+# line as each job finishes:
+#
+#     {"file": "a.imp", "env": {"n": 0, "p": 120}, "seconds": 0.0012}
+#
+# A job that fails has an "error" too ("parse error", "division by zero", "timed out", or the class and message of
+# any other exception), and the env the program had reached. A job whose worker process fails has only the file and
+# the error. What the programs print is kept out of the JSON lines, in an "output" field.
+
+def batch_argument_parser():
+    parser = argparse.ArgumentParser(prog='imp run-batch', description='Run many IMP programs in parallel.')
+    parser.add_argument('source', help='a directory, searched for .imp files, or a manifest listing one file a line')
+    parser.add_argument('--engine', choices=sorted(engines), default='tree',
+                        help='how to run the programs (default: tree)')
+    parser.add_argument('-O', '--optimize', action='store_true',
+                        help='optimize the programs before running them (see imp_optimize)')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='number of worker processes (default: one per CPU)')
+    parser.add_argument('--timeout', type=float, default=None,
+                        help='seconds each program may run before it is stopped (default: no limit)')
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false',
+                        help='parse and compile every program even if it is cached, and cache nothing')
+    return parser
+
+def batch_files(source):
+    # The .imp files under the directory source, or the files listed in the manifest source; blank lines and
+    # lines starting with # are skipped and relative paths are taken from the manifest's directory
+    if os.path.isdir(source):
+        filenames = []
+        for directory, subdirectories, files in os.walk(source):
+            subdirectories.sort()
+            filenames += [os.path.join(directory, name) for name in sorted(files) if name.endswith('.imp')]
+        return filenames
+    with open(source) as manifest:
+        lines = [line.strip() for line in manifest]
+    base = os.path.dirname(source)
+    return [os.path.join(base, line) for line in lines if line and not line.startswith('#')]
+
+class JobTimeout(Exception):
+    pass
+
+def raise_timeout(signum, frame):
+    raise JobTimeout()
+
+def error_message(e):
+    return '%s: %s' % (e.__class__.__name__, e) if str(e) else e.__class__.__name__
+
+def run_job(filename, engine='tree', optimize=False, timeout=None, use_cache=True):
+    # Runs one file in a worker process and returns its JSON result as a dict
+    result = {'file': filename}
+    env = {}
+    output = io.StringIO()
+    start = time.perf_counter()
+    # The timeout is an interval timer in the worker itself, so a program stuck in a loop stops without the
+    # worker being killed. Without SIGALRM (on Windows) programs run without a limit.
+    timed = timeout and hasattr(signal, 'SIGALRM')
+    if timed:
+        signal.signal(signal.SIGALRM, raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        with open(filename) as file:
+            text = file.read()
+        with contextlib.redirect_stdout(output):
+            if not run_text(text, env, engine, optimize, use_cache=use_cache):
+                result['error'] = 'parse error'
+    except ZeroDivisionError:
+        result['error'] = 'division by zero'
+    except JobTimeout:
+        result['error'] = 'timed out'
+    except (OSError, RuntimeError) as e:
+        result['error'] = str(e) or e.__class__.__name__
+    except Exception as e:
+        # Anything else a program can raise, such as an OverflowError from a division too large for a float, fails
+        # this job and not the whole batch
+        result['error'] = error_message(e)
+    finally:
+        if timed:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    result['env'] = env
+    result['seconds'] = round(time.perf_counter() - start, 6)
+    if output.getvalue():
+        result['output'] = output.getvalue()
+    return result
+
+def run_batch(filenames, out, engine='tree', optimize=False, workers=None, timeout=None, use_cache=True):
+    # Runs every file in filenames and writes their results to out as JSON lines, in the order the jobs finish.
+    # Returns the number of jobs that failed.
+    failures = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        jobs = dict((executor.submit(run_job, filename, engine, optimize, timeout, use_cache), filename)
+                    for filename in filenames)
+        for job in concurrent.futures.as_completed(jobs):
+            try:
+                result = job.result()
+            except Exception as e:
+                # The worker died or the job could not be sent to it or back (BrokenProcessPool, a pickling error)
+                result = {'file': jobs[job], 'error': error_message(e)}
+            failures += 'error' in result
+            out.write(json.dumps(result) + '\n')
+            out.flush()
+    return failures
 
 if __name__ == '__main__':
-    if len(sys.argv) != 2:
-        usage()
-    filename = sys.argv[1]
-    text = open(filename).read()
-    tokens = imp_lex(text)
-    parse_result = imp_parse(tokens)
-    if not parse_result:
+    if hasattr(sys, 'set_int_max_str_digits'):
+        # Final values such as a large factorial run past the default limit on printing an int
+        sys.set_int_max_str_digits(0)
+    if sys.argv[1:2] == ['run-batch']:
+        parser = batch_argument_parser()
+        args = parser.parse_args(sys.argv[2:])
+        if not os.path.exists(args.source):
+            parser.error('no such file or directory: ' + args.source)
+        failures = run_batch(batch_files(args.source), sys.stdout, args.engine, args.optimize, args.workers,
+                             args.timeout, args.use_cache)
+        sys.exit(1 if failures else 0)
+
+    parser = argument_parser()
+    args = parser.parse_args()
+    if args.parse_workers and args.engine == 'python':
+        parser.error('--parse-workers cannot be used with --engine=python')
+    with open(args.filename) as file:
+        text = file.read()
+    env = {}
+    if not run_text(text, env, args.engine, args.optimize, args.parse_workers, args.use_cache):
         sys.stderr.write('Parse error!\n')
         sys.exit(1)
-    ast = parse_result.value
-    env = {}
-    ast.eval(env)
 
     sys.stdout.write('Final variable values:\n')
     for name in env:
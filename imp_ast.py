@@ -16,8 +16,10 @@ We can also group expressions together with parenthesis (like (x + 2) * 3. This
  as a different way to parse the expression.
 
 We will define three classes for these forms, plus a base class for arithmetic expressions in general. For now, the classes
-won't do much except contain data. We will include a __repr__ method, so we can print out the AST for debugging. 
-All AST classes will subclass Equality so we can check if two AST objects are the same. This helps with testing.
+won't do much except contain data. Each class lists its fields in __slots__, so a node is a fixed-size object
+without a per-instance dictionary; a program of a million nodes takes a fraction of the memory it would otherwise.
+All AST classes will subclass Equality, which builds __repr__ (so we can print out the AST for debugging), equality
+and hashing from those fields, so we can check if two AST objects are the same. This helps with testing.
 
 
 The environment is also easy. IMP only has global variables, so we can model the environment with a simple Python dictionary. 
@@ -33,31 +35,29 @@ from equality import *
 
 #Arithematic Expression
 class Aexp(Equality):
-	pass
+	__slots__ = ()
 
 #Boolean Expression
 class Bexp(Equality):
-	pass
+	__slots__ = ()
 
 #Statement 
 class Statement(Equality):
-	pass
+	__slots__ = ()
 
 #Integer Aexp --     Literal integer constants, such as 42
 class IntAexp(Aexp):
+	__slots__ = ('i',)
 	def __init__(self, i):
 		self.i = i
-	def __repr__(self):
-		return ('IntrAexp(%d)' %self.i)
 	def eval(self, env):
 		return self.i
 
 #Var / String --     Variables, such as x
 class VarAexp(Aexp):
+	__slots__ = ('name',)
 	def __init__(self, name):
 		self.name = name
-	def __repr__(self):
-		return ('VarAexp(%s)' %self.name)
 	def eval(self, env):
 		if self.name in env:
 			return env[self.name]
@@ -66,12 +66,11 @@ class VarAexp(Aexp):
 
 #Two operation Arithematic Exp  --  Binary operations, such as x + 42. These are made out of other arithmetic expressions.
 class BinopAexp(Aexp):
+	__slots__ = ('op', 'left', 'right')
 	def __init__(self, op, left, right):
 		self.op = op
 		self.left = left
 		self.right =right
-	def __repr__(self):
-		return ('BinopAexp (%s, %s, %s)' %(self.op, self.left, self.right))
 	def eval(self, env):
 		left_value = self.left.eval(env)
 		right_value = self.right.eval(env)
@@ -86,18 +85,18 @@ class BinopAexp(Aexp):
 				value = left_value/right_value
 			except ZeroDivisionError:
 				print("Division by zero!")
+				raise
 		else : 
 			raise RuntimeError('unknown operator: '+self.op)
 		return value
 
 #Relational Operator Noolean Expression
 class RelopBexp(Bexp):
+	__slots__ = ('op', 'left', 'right')
 	def __init__(self, op, left, right):
 		self.op = op
 		self.right = right
 		self.left = left
-	def __repr__(self):
-		return ('RelopBexp (%s, %s, %s)' %(self.op, self.left, self.right))
 	def eval(self, env):
 		left_value = self.left.eval(env)
 		right_value = self.right.eval(env)
@@ -105,7 +104,7 @@ class RelopBexp(Bexp):
 			value = left_value > right_value
 		elif self.op == '<':
 			value = left_value < right_value
-		elif self.op == '==':
+		elif self.op == '==' or self.op == '=': #the lexer and parser spell equality =
 			value = left_value == right_value
 		elif self.op == '!=':
 			value = left_value != right_value
@@ -117,78 +116,121 @@ class RelopBexp(Bexp):
 			raise RuntimeError('unknown operator: '+ self.op)
 		return value
 
+#Boolean constant -- what a condition such as 1 < 2 folds to (see imp_optimize); the parser never builds one
+class BoolBexp(Bexp):
+	__slots__ = ('value',)
+	def __init__(self, value):
+		self.value = value
+	def eval(self, env):
+		return self.value
+
 class AndBexp(Bexp):
+	__slots__ = ('left', 'right')
 	def __init__(self, left, right):
 		self.left = left
 		self.right = right
-	def __repr__(self):
-		return ('AndBexp (%s, %s)' %(self.left, self.right))
 	def eval(self, env):
 		left_value = self.left.eval(env)
 		right_value = self.right.eval(env)
 		return (left_value and right_value)
 
 class OrBexp(Bexp):
+	__slots__ = ('left', 'right')
 	def __init__(self, left,right):
 		self.left = left
 		self.right = right
-	def __repr__(self):
-		return ('OrBexp (%s, %s)' %(self.left, self.right))
 	def eval(self, env):
 		left_value = self.left.eval(env)
 		right_value = self.right.eval(env)
 		return (left_value or right_value)
 
 class NotBexp(Bexp):
+	__slots__ = ('exp',)
 	def __init__(self, exp):
 		self.exp = exp
-	def __repr__(self):
-		return ('NotBexp (%s)' %(self.exp))
 	def eval(self, env):
 		value = self.exp.eval(env)
 		return (not value)
 
 class AssignStatement(Statement):
+	__slots__ = ('name', 'aexp')
 	def __init__(self, name, aexp):
 		self.name = name
 		self.aexp = aexp
-	def __repr__(self):
-		return ('AssignStatement (%s, %s)' %(self.name, self.exp))
 	def eval(self, env):
 		value = self.aexp.eval(env)
 		env[self.name] = value
 
 class CompoundStatement(Statement):
+	__slots__ = ('first', 'second')
 	def __init__(self, first, second):
 		self.first = first
 		self.second = second
-	def __repr__(self):
-		return ('CompoundStatement (%s, %s)' %(self.first, self.second))
 	def eval(self, env):
 		self.first.eval(env)
 		self.second.eval(env)
 
+#Statement sequence -- s1; s2; ...; sn as one node with a tuple of the statements, which is what the parsers build
+#for a list of two or more statements. A chain of CompoundStatements costs a Python frame per statement to evaluate
+#and runs into the recursion limit on long programs; eval here is a plain loop.
+class BlockStatement(Statement):
+	__slots__ = ('statements',)
+	def __init__(self, statements):
+		self.statements = statements
+	def eval(self, env):
+		for statement in self.statements:
+			statement.eval(env)
+
+def statement_sequence(statements):
+	#The statement running statements in order: the statement itself if there is only one
+	if len(statements) == 1:
+		return statements[0]
+	return BlockStatement(tuple(statements))
+
+def sequence(node):
+	#The statements node runs in order, looking through BlockStatements and CompoundStatement chains, nested or
+	#not, without recursing once per statement
+	statements = []
+	pending = [node]
+	while pending:
+		node = pending.pop()
+		if isinstance(node, CompoundStatement):
+			pending.append(node.second)
+			pending.append(node.first)
+		elif isinstance(node, BlockStatement):
+			pending.extend(reversed(node.statements))
+		else:
+			statements.append(node)
+	return statements
+
+def normalize(node):
+	#node with every statement sequence turned into one flat BlockStatement, so that trees built from
+	#CompoundStatements and from BlockStatements compare equal when they run the same statements
+	if isinstance(node, (CompoundStatement, BlockStatement)):
+		return statement_sequence([normalize(statement) for statement in sequence(node)])
+	if not isinstance(node, Equality):
+		return node
+	return node.__class__(*[normalize(value) for value in node._values()])
+
 class IfStatement(Statement):
+	__slots__ = ('condition', 'true_statement', 'false_statement')
 	def __init__(self, condition, true_statement, false_statement):
 		self.condition = condition
 		self.true_statement = true_statement
 		self.false_statement = false_statement
-	def __repr__(self):
-		return ('IfStatement (%s, %s, %s)' %(self.condition, self.true_statement, self.false_statement))
 	def eval(self, env):
 		condition_value = self.condition.eval(env)
 		if condition_value:
 			self.true_statement.eval(env)
 		else :
-			if false_value:
-				self.false_value.eval(env)
+			if self.false_statement:
+				self.false_statement.eval(env)
 
 class WhileStatement(Statement):
+	__slots__ = ('condition', 'body')
 	def __init__(self, condition, body):
 		self.condition = condition
 		self.body = body
-	def __repr__(self):
-		return ('WhileStatement (%s, %s)' %(self.condition, self.body))
 	def eval(self, env):
 		condition_value = self.condition.eval(env)
 		while condition_value:
@@ -197,11 +239,10 @@ class WhileStatement(Statement):
 
 
 class ForStatement(Statement):
+	__slots__ = ('condition', 'body')
 	def __init__(self, condition, body):
 		self. condition = condition
 		self.body = body
-	def __repr__(self):
-		return ('forStatement (%s, %s)' %(self.condition, self.body))
 	def eval(self,env):
 		condition_value = self.condition.eval(env)
 		while condition_value:
@@ -209,10 +250,9 @@ class ForStatement(Statement):
 			condition_value = self.condition.eval(env)
 
 class PrintStatement(Statement):
+	__slots__ = ('body',)
 	def __init__(self, body):
 		self.body = body
-	def __repr__(self):
-		return ('PrintStatement (%s)' %(self.body)) 
 	def eval(self,env):
 		print (self.body.eval(env))
 
@@ -0,0 +1,189 @@
+#!/usr/bin/python3
+
+import operator
+from imp_ast import *
+
+'''
+Batch evaluation: one program run over many initial environments at once, such as a sweep over the initial n of a
+program. Running ast.eval(env) for every environment walks the tree once per environment, so a sweep over 10000
+environments pays for every method call and every operator comparison 10000 times. Here the environments are
+lanes of one batch and the tree is walked once for all of them: every node is evaluated for a whole list of lanes
+in one go, with the arithmetic done by map over the operand lists.
+
+The variables are held by column: a list per variable with one value per lane, False in the lanes where the
+variable is unassigned. As in imp_slots and imp_vm, False reads as 0 and every value the program assigns or
+prints is a real number (a bare variable is copied as x + 0), so the lanes still holding False at the end are
+exactly the ones where the variable was never assigned.
+
+Lanes part ways at conditions. Each statement is run for the list of lanes that reach it: an if splits its lanes
+by the condition and runs each branch for its own part, and a while keeps running its body for the lanes whose
+condition still holds, letting the others go on past the loop one by one as their condition fails. A division by
+zero stops only the lanes it happens in, which keep the variables they had, as eval would leave them; the others
+run on.
+
+    errors = run_batch(ast, envs)
+
+runs the program on every env in the list envs, leaving each one as ast.eval(env) would, and returns the
+ZeroDivisionError that stopped each lane, or None. With the environments already in columns:
+
+    batch = BatchEvaluator(columns, size)
+    batch.run(ast)
+
+A print statement prints the value of every lane that reaches it, in lane order, so its output is interleaved
+differently from running the environments one after the other.
+'''
+
+binops = {'+': operator.add, '-': operator.sub, '*': operator.mul}
+relops = {'<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge, '=': operator.eq,
+          '==': operator.eq, '!=': operator.ne}
+
+class BatchEvaluator:
+    def __init__(self, columns, size):
+        self.columns = columns # variable name -> list of one value per lane, False where unassigned
+        self.size = size
+        self.errors = {} # lane -> the ZeroDivisionError that stopped it
+
+    def run(self, ast):
+        self.statement(ast, list(range(self.size)))
+
+    def values(self, name, lanes):
+        column = self.columns.get(name)
+        if column is None:
+            return [False] * len(lanes)
+        if len(lanes) == self.size:
+            return column[:]
+        return [column[lane] for lane in lanes]
+
+    def alive(self, lanes, values, failed):
+        # Drops the lanes that failed while errors grew past failed entries, with their values
+        if len(self.errors) == failed:
+            return lanes, values
+        kept = [(lane, value) for lane, value in zip(lanes, values) if lane not in self.errors]
+        return [lane for lane, value in kept], [value for lane, value in kept]
+
+    def statement(self, node, lanes):
+        # Runs node for lanes and returns the ones that were not stopped by a division by zero. Lane lists are kept
+        # in ascending order, so a list as long as the batch is every lane in order and whole columns copy at once.
+        if not lanes:
+            return lanes
+        if isinstance(node, AssignStatement):
+            failed = len(self.errors)
+            lanes, values = self.alive(lanes, self.value(node.aexp, lanes), failed)
+            column = self.columns.get(node.name)
+            if column is None:
+                column = self.columns[node.name] = [False] * self.size
+            if len(lanes) == self.size:
+                column[:] = values
+            else:
+                for lane, value in zip(lanes, values):
+                    column[lane] = value
+            return lanes
+        if isinstance(node, (CompoundStatement, BlockStatement)):
+            for statement in sequence(node):
+                lanes = self.statement(statement, lanes)
+            return lanes
+        if isinstance(node, IfStatement):
+            true_lanes, false_lanes = self.split(node.condition, lanes)
+            lanes = self.statement(node.true_statement, true_lanes)
+            if node.false_statement:
+                false_lanes = self.statement(node.false_statement, false_lanes)
+            # Two ascending runs, which sorted merges in linear time
+            return sorted(lanes + false_lanes)
+        if isinstance(node, (WhileStatement, ForStatement)):
+            finished = []
+            while lanes:
+                lanes, done = self.split(node.condition, lanes)
+                finished += done
+                lanes = self.statement(node.body, lanes)
+            return sorted(finished)
+        if isinstance(node, PrintStatement):
+            failed = len(self.errors)
+            lanes, values = self.alive(lanes, self.value(node.body, lanes), failed)
+            for value in values:
+                print(value)
+            return lanes
+        raise RuntimeError('cannot evaluate statement: %s' % node.__class__.__name__)
+
+    def split(self, condition, lanes):
+        # The lanes where condition holds and the ones where it does not, leaving out the ones it stops
+        failed = len(self.errors)
+        lanes, values = self.alive(lanes, self.bexp(condition, lanes), failed)
+        true_lanes = [lane for lane, value in zip(lanes, values) if value]
+        if len(true_lanes) == len(lanes):
+            return true_lanes, []
+        return true_lanes, [lane for lane, value in zip(lanes, values) if not value]
+
+    def value(self, node, lanes):
+        # An expression that is stored or printed; False must not escape from an unassigned variable
+        values = self.aexp(node, lanes)
+        if isinstance(node, VarAexp):
+            return [value + 0 for value in values]
+        return values
+
+    def aexp(self, node, lanes):
+        # The value of node in each of lanes. A lane that fails gets the value 0, and is in errors from then on.
+        if isinstance(node, IntAexp):
+            return [node.i] * len(lanes)
+        if isinstance(node, VarAexp):
+            return self.values(node.name, lanes)
+        if isinstance(node, BinopAexp):
+            left = self.aexp(node.left, lanes)
+            right = self.aexp(node.right, lanes)
+            if node.op in binops:
+                return list(map(binops[node.op], left, right))
+            if node.op == '/':
+                try:
+                    return list(map(operator.truediv, left, right))
+                except ZeroDivisionError:
+                    return self.divide(lanes, left, right)
+            raise RuntimeError('unknown operator: ' + node.op)
+        raise RuntimeError('cannot evaluate expression: %s' % node.__class__.__name__)
+
+    def divide(self, lanes, left, right):
+        values = []
+        for lane, left_value, right_value in zip(lanes, left, right):
+            try:
+                values.append(left_value / right_value)
+            except ZeroDivisionError as e:
+                if lane not in self.errors:
+                    print("Division by zero!")
+                    self.errors[lane] = e
+                values.append(0)
+        return values
+
+    def bexp(self, node, lanes):
+        if isinstance(node, RelopBexp):
+            if node.op not in relops:
+                raise RuntimeError('unknown operator: ' + node.op)
+            return list(map(relops[node.op], self.aexp(node.left, lanes), self.aexp(node.right, lanes)))
+        if isinstance(node, AndBexp):
+            # Both sides are evaluated, as in AndBexp.eval
+            left = self.bexp(node.left, lanes)
+            return [left_value and right_value for left_value, right_value in zip(left, self.bexp(node.right, lanes))]
+        if isinstance(node, OrBexp):
+            left = self.bexp(node.left, lanes)
+            return [left_value or right_value for left_value, right_value in zip(left, self.bexp(node.right, lanes))]
+        if isinstance(node, NotBexp):
+            return [not value for value in self.bexp(node.exp, lanes)]
+        if isinstance(node, BoolBexp):
+            return [node.value] * len(lanes)
+        raise RuntimeError('cannot evaluate condition: %s' % node.__class__.__name__)
+
+def columns_from_envs(envs):
+    columns = {}
+    for lane, env in enumerate(envs):
+        for name, value in env.items():
+            if name not in columns:
+                columns[name] = [False] * len(envs)
+            columns[name][lane] = value
+    return columns
+
+def run_batch(ast, envs):
+    # Runs ast on every env in envs and returns, per env, the ZeroDivisionError that stopped it or None
+    batch = BatchEvaluator(columns_from_envs(envs), len(envs))
+    batch.run(ast)
+    for name, column in batch.columns.items():
+        for env, value in zip(envs, column):
+            if value is not False:
+                env[name] = value
+    return [batch.errors.get(lane) for lane in range(len(envs))]
@@ -0,0 +1,224 @@
+#!/usr/bin/python3
+
+import operator
+from imp_ast import *
+
+'''
+Closure compilation: a lighter alternative to the bytecode VM in imp_vm.
+
+compile_closures walks the AST once and turns every node into a Python closure taking the environment, with all
+the decisions eval makes on every call already taken. BinopAexp('+', VarAexp('n'), IntAexp(3)) becomes
+
+    lambda env: env.get('n', 0) + 3
+
+so the operator is no longer looked up by string comparison, the constant is no longer a method call, and the
+variable test is a single dict.get. Operands that are plain variables or constants are folded into the closure of
+the operator using them, which is where most of the calls go in a loop like the one in hello.imp. A
+BlockStatement becomes one loop over a tuple of statement closures.
+
+The environment is the same dictionary eval uses, and the closures behave exactly like eval, including evaluating
+both sides of and and or.
+
+    program = compile_closures(ast)
+    program(env)
+'''
+
+def compile_closures(ast):
+    return statement(ast)
+
+def statement(node):
+    if isinstance(node, AssignStatement):
+        if isinstance(node.aexp, BinopAexp) and node.aexp.op in arithmetic_operators:
+            return assign_binop(node.name, node.aexp)
+        return assign_statement(node.name, aexp(node.aexp))
+    if isinstance(node, (CompoundStatement, BlockStatement)):
+        return block([statement(part) for part in sequence(node)])
+    if isinstance(node, IfStatement):
+        return if_statement(bexp(node.condition), statement(node.true_statement),
+                            statement(node.false_statement) if node.false_statement else None)
+    if isinstance(node, (WhileStatement, ForStatement)):
+        return while_statement(bexp(node.condition), statement(node.body))
+    if isinstance(node, PrintStatement):
+        return print_statement(aexp(node.body))
+    raise RuntimeError('cannot compile statement: %s' % node.__class__.__name__)
+
+def assign_statement(name, value):
+    def assign(env):
+        env[name] = value(env)
+    return assign
+
+# The + - * of an assignment like n := n - 1 are applied in place through the operator module, which saves the call
+# to the closure of the operator
+arithmetic_operators = {'+': operator.add, '-': operator.sub, '*': operator.mul}
+
+def assign_binop(name, node):
+    apply = arithmetic_operators[node.op]
+    left, right = node.left, node.right
+    if isinstance(left, VarAexp) and isinstance(right, IntAexp):
+        n, i = left.name, right.i
+        def assign_var_int(env):
+            env[name] = apply(env.get(n, 0), i)
+        return assign_var_int
+    if isinstance(left, VarAexp) and isinstance(right, VarAexp):
+        n, m = left.name, right.name
+        def assign_var_var(env):
+            env[name] = apply(env.get(n, 0), env.get(m, 0))
+        return assign_var_var
+    return assign_statement(name, aexp(node))
+
+def block(statements):
+    statements = tuple(statements)
+    if len(statements) == 2:
+        first, second = statements
+        def pair(env):
+            first(env)
+            second(env)
+        return pair
+    def run_block(env):
+        for statement in statements:
+            statement(env)
+    return run_block
+
+def if_statement(condition, true_statement, false_statement):
+    if false_statement is None:
+        def if_then(env):
+            if condition(env):
+                true_statement(env)
+        return if_then
+    def if_then_else(env):
+        if condition(env):
+            true_statement(env)
+        else:
+            false_statement(env)
+    return if_then_else
+
+def while_statement(condition, body):
+    def while_loop(env):
+        while condition(env):
+            body(env)
+    return while_loop
+
+def print_statement(value):
+    def print_value(env):
+        print(value(env))
+    return print_value
+
+# Arithmetic expressions
+
+def aexp(node):
+    if isinstance(node, IntAexp):
+        i = node.i
+        return lambda env: i
+    if isinstance(node, VarAexp):
+        name = node.name
+        return lambda env: env.get(name, 0)
+    if isinstance(node, BinopAexp):
+        if node.op not in binops:
+            raise RuntimeError('unknown operator: ' + node.op)
+        return specialize(binops[node.op], node.left, node.right, aexp)
+    raise RuntimeError('cannot compile expression: %s' % node.__class__.__name__)
+
+def specialize(forms, left, right, compile_operand):
+    # forms holds one closure factory per kind of operand pair, see binops; plain variables and constants are
+    # handed over as names and values instead of closures
+    if isinstance(left, VarAexp) and isinstance(right, IntAexp) and 'var_int' in forms:
+        return forms['var_int'](left.name, right.i)
+    if isinstance(left, VarAexp) and isinstance(right, VarAexp) and 'var_var' in forms:
+        return forms['var_var'](left.name, right.name)
+    if isinstance(left, IntAexp) and isinstance(right, VarAexp) and 'int_var' in forms:
+        return forms['int_var'](left.i, right.name)
+    return forms['any'](compile_operand(left), compile_operand(right))
+
+def divide(left_value, right_value):
+    try:
+        return left_value / right_value
+    except ZeroDivisionError:
+        print("Division by zero!")
+        raise
+
+binops = {
+    '+': {
+        'var_int': lambda n, i: lambda env: env.get(n, 0) + i,
+        'var_var': lambda n, m: lambda env: env.get(n, 0) + env.get(m, 0),
+        'int_var': lambda i, n: lambda env: i + env.get(n, 0),
+        'any': lambda l, r: lambda env: l(env) + r(env),
+    },
+    '-': {
+        'var_int': lambda n, i: lambda env: env.get(n, 0) - i,
+        'var_var': lambda n, m: lambda env: env.get(n, 0) - env.get(m, 0),
+        'int_var': lambda i, n: lambda env: i - env.get(n, 0),
+        'any': lambda l, r: lambda env: l(env) - r(env),
+    },
+    '*': {
+        'var_int': lambda n, i: lambda env: env.get(n, 0) * i,
+        'var_var': lambda n, m: lambda env: env.get(n, 0) * env.get(m, 0),
+        'int_var': lambda i, n: lambda env: i * env.get(n, 0),
+        'any': lambda l, r: lambda env: l(env) * r(env),
+    },
+    '/': {
+        'any': lambda l, r: lambda env: divide(l(env), r(env)),
+    },
+}
+
+# Boolean expressions
+
+def bexp(node):
+    if isinstance(node, RelopBexp):
+        if node.op not in relops:
+            raise RuntimeError('unknown operator: ' + node.op)
+        return specialize(relops[node.op], node.left, node.right, aexp)
+    if isinstance(node, AndBexp):
+        left, right = bexp(node.left), bexp(node.right)
+        def and_exp(env):
+            left_value = left(env)
+            right_value = right(env)
+            return left_value and right_value
+        return and_exp
+    if isinstance(node, OrBexp):
+        left, right = bexp(node.left), bexp(node.right)
+        def or_exp(env):
+            left_value = left(env)
+            right_value = right(env)
+            return left_value or right_value
+        return or_exp
+    if isinstance(node, NotBexp):
+        exp = bexp(node.exp)
+        return lambda env: not exp(env)
+    if isinstance(node, BoolBexp):
+        value = node.value
+        return lambda env: value
+    raise RuntimeError('cannot compile condition: %s' % node.__class__.__name__)
+
+relops = {
+    '<': {
+        'var_int': lambda n, i: lambda env: env.get(n, 0) < i,
+        'var_var': lambda n, m: lambda env: env.get(n, 0) < env.get(m, 0),
+        'any': lambda l, r: lambda env: l(env) < r(env),
+    },
+    '<=': {
+        'var_int': lambda n, i: lambda env: env.get(n, 0) <= i,
+        'var_var': lambda n, m: lambda env: env.get(n, 0) <= env.get(m, 0),
+        'any': lambda l, r: lambda env: l(env) <= r(env),
+    },
+    '>': {
+        'var_int': lambda n, i: lambda env: env.get(n, 0) > i,
+        'var_var': lambda n, m: lambda env: env.get(n, 0) > env.get(m, 0),
+        'any': lambda l, r: lambda env: l(env) > r(env),
+    },
+    '>=': {
+        'var_int': lambda n, i: lambda env: env.get(n, 0) >= i,
+        'var_var': lambda n, m: lambda env: env.get(n, 0) >= env.get(m, 0),
+        'any': lambda l, r: lambda env: l(env) >= r(env),
+    },
+    '=': {
+        'var_int': lambda n, i: lambda env: env.get(n, 0) == i,
+        'var_var': lambda n, m: lambda env: env.get(n, 0) == env.get(m, 0),
+        'any': lambda l, r: lambda env: l(env) == r(env),
+    },
+    '!=': {
+        'var_int': lambda n, i: lambda env: env.get(n, 0) != i,
+        'var_var': lambda n, m: lambda env: env.get(n, 0) != env.get(m, 0),
+        'any': lambda l, r: lambda env: l(env) != r(env),
+    },
+}
+relops['=='] = relops['=']
@@ -0,0 +1,227 @@
+#!/usr/bin/python3
+
+import lexer
+from imp_ast import *
+from imp_lexer import *
+from imp_parser import *
+
+'''
+Incremental lexing and parsing for editors, where a program changes a few characters at a time and lexing and
+parsing all of it again after every keystroke takes longer the longer the file gets.
+
+    parsed = parse_source(text)
+    parsed = reparse(parsed, offset, removed, inserted)
+
+parse_source lexes and parses a whole program once. reparse takes the previous result, which holds the previous
+tokens and AST, and an edit: the removed characters at offset are replaced by inserted. It returns the result for
+the edited text and leaves the previous one as it was. parsed.ast is what imp_parse(imp_lex(parsed.source)).value
+is, or None where that parse fails, and parsed.tokens is what imp_lex returns, except that characters that start
+no token are left out instead of stopping the program.
+
+The text is kept cut into segments, each running from just after a ; up to and including the next ;, or the end of
+the text. The lexer starts afresh after every ;, since no token runs on past one, so a segment is lexed on its own.
+As in imp_parallel_parser, a ; outside every if, while and for block can only separate two statements of the top
+level list, so a segment that opens no block it does not close and closes none it did not open holds one top level
+statement, and is parsed on its own too. Segments are cut at every such ;.
+
+reparse lexes again from the start of the segment the edit begins in, cutting the new text into segments as it goes,
+until it reaches a ; past the edit where the previous text had a cut. The text after that point is the same, so from
+there on the previous segments are reused as they are, tokens, statements and all, and so are the ones before the
+edit; only the new segments are parsed. When the edit leaves a block open or an end without its block, the new
+segment still ends at that ;, with the blocks it leaves open or closes recorded in it, so the edit costs no more than
+any other. parsed.ast then joins the tokens of the unbalanced segments with the segments between them into the
+statements they make up and parses those, or gives None straight away if the blocks do not balance over the whole
+program.
+
+Segments are stored in chunks of about chunk_size, each with its length in characters, so that finding the segment
+an edit starts in and splicing in the new ones touch one chunk and the list of chunks, not every segment. A reparse
+takes time in proportion to the top level statements the edit touches, plus copying the list of chunks.
+'''
+
+chunk_size = 256
+
+class Segment:
+    __slots__ = ('length', 'tokens', 'valid', 'depth', 'low', 'statement')
+    def __init__(self, length, tokens, valid, depth, low):
+        self.length = length # in characters, including the ; that ends the segment
+        self.tokens = tokens # list of (text, tag)
+        self.valid = valid # whether every character is part of a token
+        self.depth = depth # blocks opened less blocks closed
+        self.low = low # the fewest blocks open at any point, relative to the start: 0, or negative after a stray end
+        self.statement = parse_segment(tokens) if valid and self.balanced() else None
+
+    def balanced(self):
+        return self.depth == 0 and self.low == 0
+
+    def error(self):
+        # Whether the segment keeps the whole program from parsing, whatever the segments around it
+        return not self.valid or self.balanced() and self.statement is None
+
+def parse_segment(tokens):
+    # The statement in the tokens of a segment, less the ; that ends it
+    if tokens and tokens[-1] == (';', RESERVED):
+        tokens = tokens[:-1]
+    if not tokens:
+        return None
+    result = imp_parse(tokens)
+    return result.value if result else None
+
+class ParsedSource:
+    def __init__(self, source, chunks, lengths, errors, unbalanced):
+        self.source = source
+        self.chunks = chunks # lists of consecutive segments
+        self.lengths = lengths # the total length of the segments of each chunk
+        self.errors = errors # how many segments are errors
+        self.unbalanced = unbalanced # how many segments are not balanced
+        self._statements = None
+
+    @property
+    def segments(self):
+        return [segment for chunk in self.chunks for segment in chunk]
+
+    @property
+    def tokens(self):
+        return [token for segment in self.segments for token in segment.tokens]
+
+    @property
+    def ast(self):
+        if self.errors:
+            return None
+        if self._statements is None:
+            self._statements = self.statements()
+        return statement_sequence(self._statements) if self._statements else None
+
+    def statements(self):
+        # The top level statements, or [] if the program does not parse
+        if not self.unbalanced:
+            return [segment.statement for segment in self.segments]
+        statements = []
+        group = [] # consecutive segments inside a block opened by the first of them
+        depth = 0
+        for segment in self.segments:
+            if depth == 0 and segment.balanced():
+                statements.append(segment.statement)
+                continue
+            if depth + segment.low < 0:
+                return []
+            group.append(segment)
+            depth += segment.depth
+            if depth == 0:
+                value = parse_segment([token for segment in group for token in segment.tokens])
+                if value is None:
+                    return []
+                statements.extend(sequence(value))
+                group = []
+        return [] if group else statements
+
+    def locate(self, offset):
+        # The chunk and index of the segment offset is in, and where that segment starts. A segment is found for
+        # the offset just after the end of the text too, the last one.
+        start = 0
+        for chunk_index, length in enumerate(self.lengths):
+            if start + length > offset or chunk_index == len(self.lengths) - 1:
+                break
+            start += length
+        chunk = self.chunks[chunk_index]
+        index = 0
+        while index < len(chunk) - 1 and start + chunk[index].length <= offset:
+            start += chunk[index].length
+            index += 1
+        return chunk_index, index, start
+
+def lex_segments(source, pos, stop=None):
+    # Cuts source into segments from pos, which must be the start of a segment, yielding each one. stop(end) is
+    # asked at every ; whether to end a segment there and stop.
+    regex, tags = lexer.compile_token_exprs(token_exprs)
+    start = pos
+    tokens = []
+    valid = True
+    depth = low = 0
+    while pos < len(source):
+        match = regex.match(source, pos)
+        if not match:
+            valid = False
+            pos += 1
+            continue
+        pos = match.end()
+        tag = tags[match.lastgroup]
+        if not tag:
+            continue
+        text = match.group()
+        tag = keywords.get(text, tag)
+        tokens.append((text, tag))
+        if tag is RESERVED:
+            if text == 'if' or text == 'while' or text == 'for':
+                depth += 1
+            elif text == 'end':
+                depth -= 1
+                low = min(low, depth)
+            elif text == ';':
+                if stop is not None and stop(pos):
+                    yield Segment(pos - start, tokens, valid, depth, low)
+                    return
+                if depth == 0 and low == 0:
+                    yield Segment(pos - start, tokens, valid, depth, low)
+                    start = pos
+                    tokens = []
+                    valid = True
+    yield Segment(pos - start, tokens, valid, depth, low)
+
+def make_chunks(segments):
+    chunks = [segments[start:start + chunk_size] for start in range(0, len(segments), chunk_size)]
+    return chunks, [sum(segment.length for segment in chunk) for chunk in chunks]
+
+def count(segments):
+    # How many of segments are errors, and how many are not balanced
+    return (sum(1 for segment in segments if segment.error()),
+            sum(1 for segment in segments if not segment.balanced()))
+
+def parse_source(source):
+    segments = list(lex_segments(source, 0))
+    chunks, lengths = make_chunks(segments)
+    return ParsedSource(source, chunks, lengths, *count(segments))
+
+def reparse(parsed, offset, removed, inserted):
+    old_source = parsed.source
+    if not 0 <= offset <= offset + removed <= len(old_source):
+        raise RuntimeError('edit out of range: %d characters at %d of %d' % (removed, offset, len(old_source)))
+    source = old_source[:offset] + inserted + old_source[offset + removed:]
+    chunks = parsed.chunks
+    first_chunk, first_index, start = parsed.locate(offset)
+    # Past the edit, a position in the new text is shift characters after the same one in the old text
+    edit_end = offset + len(inserted)
+    shift = len(inserted) - removed
+    # The old segments replaced so far: those before segment index of chunk last_chunk, which starts at old_end
+    cursor = [first_chunk, first_index, start, False]
+    def resynchronized(end):
+        if end < edit_end:
+            return False
+        last_chunk, index, old_end, stopped = cursor
+        while old_end < end - shift and index < len(chunks[last_chunk]):
+            old_end += chunks[last_chunk][index].length
+            index += 1
+            if index == len(chunks[last_chunk]) and last_chunk < len(chunks) - 1:
+                last_chunk += 1
+                index = 0
+        stopped = old_end == end - shift and index < len(chunks[last_chunk])
+        cursor[:] = [last_chunk, index, old_end, stopped]
+        return stopped
+    new = list(lex_segments(source, start, resynchronized))
+    last_chunk, last_index, old_end, stopped = cursor
+    if not stopped:
+        # Lexed up to the end of the text: every old segment from the first one on is replaced
+        last_chunk = len(chunks) - 1
+        last_index = len(chunks[last_chunk])
+    replaced = [segment for chunk in chunks[first_chunk:last_chunk + 1] for segment in chunk]
+    replaced = replaced[first_index:len(replaced) - len(chunks[last_chunk]) + last_index]
+    middle = chunks[first_chunk][:first_index] + new + chunks[last_chunk][last_index:]
+    if len(middle) < chunk_size // 2 and last_chunk < len(chunks) - 1:
+        # Keeps chunks from shrinking away to nothing
+        last_chunk += 1
+        middle += chunks[last_chunk]
+    middle_chunks, middle_lengths = make_chunks(middle)
+    (old_errors, old_unbalanced), (new_errors, new_unbalanced) = count(replaced), count(new)
+    return ParsedSource(source,
+                        chunks[:first_chunk] + middle_chunks + chunks[last_chunk + 1:],
+                        parsed.lengths[:first_chunk] + middle_lengths + parsed.lengths[last_chunk + 1:],
+                        parsed.errors - old_errors + new_errors, parsed.unbalanced - old_unbalanced + new_unbalanced)
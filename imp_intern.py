@@ -0,0 +1,108 @@
+#!/usr/bin/python3
+
+import sys
+from imp_ast import *
+from imp_optimize import children
+
+'''
+Hash-consing for imp_ast trees. Generated programs repeat the same subexpressions over and over (x + 1, n > 0,
+i := i + 1), and the parser builds a new set of nodes for every occurrence. A NodeFactory keeps one node for each
+distinct structure, so building a node that already exists hands back the existing one, and a whole tree interned
+through the same factory shares every repeated subtree:
+
+    factory = NodeFactory()
+    program = factory.intern(imp_parse(imp_lex(code)).value)
+    assignment = factory.node(AssignStatement, 'x', factory.node(IntAexp, 1))
+
+The nodes a factory builds are instances of subclasses of the imp_ast classes, with the same names, so every
+isinstance test, engine and pass treats them as the plain nodes they stand for. Each one carries the structural hash
+of its fields, computed once when it is built from children that already carry theirs, so hashing a subtree and
+keying a dict by it is O(1). Two nodes from the same factory are equal exactly when they are the same object, so
+equality between them is decided without looking at their children: the same object is equal, a different hash is
+not, and only nodes from different factories with the same hash are compared field by field. An interned node still
+compares equal to a plain node of the same structure, and pickles as a plain node.
+
+Interned trees are DAGs, which is fine because nothing changes a node once it is built. Variable names are interned
+with sys.intern as well, so every x in the program is the same string.
+'''
+
+class Interned:
+    # Mixed in ahead of the imp_ast class by interned_class; _base is that class and _hash the structural hash
+    __slots__ = ()
+    def __init__(self, *values):
+        super().__init__(*values)
+        self._hash = hash((self._base, self._values()))
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if isinstance(other, Interned) and self._hash != other._hash:
+            return False
+        return isinstance(other, self._base) and self._values() == other._values()
+    def __ne__(self, other):
+        return not self.__eq__(other)
+    def __hash__(self):
+        return self._hash
+    def __reduce__(self):
+        return (self._base, self._values())
+
+interned_classes = {} # imp_ast class -> its interned subclass
+
+def interned_class(cls):
+    if cls not in interned_classes:
+        interned = type(cls.__name__, (Interned, cls), {'__slots__': ('_hash',), '_base': cls})
+        interned._fields = cls._fields
+        interned._values = cls._values
+        interned_classes[cls] = interned
+    return interned_classes[cls]
+
+def plain_class(node):
+    return getattr(node, '_base', node.__class__)
+
+class NodeFactory:
+    def __init__(self):
+        self.nodes = {} # (class, field values, their types) -> the one node with that structure
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def node(self, cls, *values):
+        # The node cls(*values), where every node among values already comes from this factory
+        # The types keep IntAexp(1) and IntAexp(1.0), or IntAexp(True), apart
+        key = (cls, values, tuple(map(type, values)))
+        node = self.nodes.get(key)
+        if node is None:
+            node = self.nodes[key] = interned_class(cls)(*values)
+        return node
+
+    def intern(self, ast):
+        # The interned copy of the tree ast, built bottom up without recursing, so that trees as deep as the stack
+        # parser builds are fine: the nodes in pre-order, visiting each one once, reversed put every node after
+        # its children
+        order = []
+        seen = set()
+        pending = [ast]
+        while pending:
+            node = pending.pop()
+            if id(node) not in seen:
+                seen.add(id(node))
+                order.append(node)
+                pending.extend(children(node))
+        done = {} # id(node) -> interned node, for the nodes of ast
+        for node in reversed(order):
+            values = []
+            for value in node._values():
+                if isinstance(value, Equality):
+                    value = done[id(value)]
+                elif isinstance(value, tuple):
+                    value = tuple([done[id(item)] for item in value])
+                elif type(value) is str:
+                    value = sys.intern(value)
+                values.append(value)
+            done[id(node)] = self.node(plain_class(node), *values)
+        return done[id(ast)]
+
+def intern_tree(ast, factory=None):
+    # ast with every repeated subtree shared, through factory or a new NodeFactory
+    if factory is None:
+        factory = NodeFactory()
+    return factory.intern(ast)
@@ -21,22 +21,24 @@ token_exprs = [
 (r'>',RESERVED),
 (r'!=',RESERVED),
 (r'=', RESERVED),
-(r'and', RESERVED),
-(r'or', RESERVED),
-(r'not', RESERVED),
-(r'if', RESERVED),
-(r'then', RESERVED),
-(r'else', RESERVED),
-(r'while', RESERVED),
-(r'do', RESERVED),
-(r'end', RESERVED),
-(r'for',RESERVED),
-(r'print', RESERVED),
-(r'scan', RESERVED),
 (r'[0-9]+', INT),
 (r'[A-Za-z][A-Za-z0-9_]*', ID),
 ]
 
+#Reserved words are lexed as identifiers and reclassified by the lexer through this table
+reserved_words = frozenset([
+'and', 'or', 'not',
+'if', 'then', 'else',
+'while', 'do', 'end',
+'for', 'print', 'scan',
+])
+keywords = dict((word, RESERVED) for word in reserved_words)
+
 def imp_lex(characters):
-	return lexer.lex(characters,token_exprs)
+	return lexer.lex(characters,token_exprs,keywords)
+
+def imp_lex_stream(fileobj, chunk_size=65536):
+	return lexer.lex_stream(fileobj, token_exprs, chunk_size, keywords)
 
+def imp_lex_buffer(characters):
+	return lexer.lex_buffer(characters, token_exprs, (RESERVED,), keywords)
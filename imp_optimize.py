@@ -0,0 +1,400 @@
+#!/usr/bin/python3
+
+from imp_ast import *
+
+'''
+An optimizer for IMP programs: a pipeline of passes, each rewriting the AST into an equivalent one that evaluates
+with less work. Each pass is a function taking a node whose children have already been rewritten and returning
+the node to use in its place; run_pass applies one to a whole tree, bottom up, and optimize runs the passes in
+order.
+
+fold_constants computes operators whose operands are all constants: (2 * 3) + x becomes 6 + x, 1 < 2 becomes
+BoolBexp(True), and not, and and or of constant conditions become constants too.
+
+simplify_identities removes operations that do nothing: x + 0, 0 + x, x - 0, x * 1, 1 * x and not not b become
+x and b, and a constant side of and and or is dropped (true and b is b) or decides the result (false and b is false).
+
+remove_dead_branches replaces an if whose condition is constant by the branch it takes, and drops a while whose
+condition is constant false.
+
+The optimized program must leave exactly the environment the original one does, which rules out a few rewrites
+that look harmless. / is never folded: 6 / 3 is the float 2.0, and 1 / 0 has to fail when it runs, not when it is
+optimized; x / 1 stays too, since it turns x into a float. x * 0 is not 0 when x is a float. And because eval
+evaluates both sides of and and or, a side is only dropped when it cannot raise, which means it contains no
+division.
+
+Three more passes work on while loops, where nearly all the time goes.
+
+close_counting_loops replaces a loop that only counts, like
+
+    while i < n do s := s + c; i := i + 1 end
+
+by the values it ends up with, computed without iterating:
+
+    if i < n then s := s + c * (n - i); i := n end
+
+It matches exactly this shape and leaves every other loop alone: the condition compares the counter with an
+expression the loop does not change, the counter is stepped by 1 towards it, and every other statement is an
+assignment x := x + e, x := x - e or x := e, with e reading nothing the loop assigns. Only programs without division
+are rewritten, where every value is an int (or an unassigned variable, which is 0): for a float counter the
+number of iterations would not be n - i.
+
+The other two add variables of their own. Their names start with $, which no IMP identifier can, and
+strip_temporaries removes them from the final environment.
+
+hoist_invariants computes each expression a loop evaluates over and over to the same value once, before the loop,
+into a temporary: an arithmetic subexpression is invariant when the loop body assigns none of the variables it
+reads. Only expressions without a division are hoisted, since the loop might not run at all.
+
+reduce_strength replaces a product i * k of a loop's induction variable i (assigned once per iteration, by
+i := i + c) and a constant k by a temporary that starts out as i * k and grows by c * k whenever i is stepped.
+
+    ast = optimize(ast)
+    ast.eval(env)
+    strip_temporaries(env)
+'''
+
+def rebuild(node, rewrite):
+    # node with every child replaced by rewrite(child)
+    if isinstance(node, BinopAexp):
+        return BinopAexp(node.op, rewrite(node.left), rewrite(node.right))
+    if isinstance(node, RelopBexp):
+        return RelopBexp(node.op, rewrite(node.left), rewrite(node.right))
+    if isinstance(node, AndBexp):
+        return AndBexp(rewrite(node.left), rewrite(node.right))
+    if isinstance(node, OrBexp):
+        return OrBexp(rewrite(node.left), rewrite(node.right))
+    if isinstance(node, NotBexp):
+        return NotBexp(rewrite(node.exp))
+    if isinstance(node, AssignStatement):
+        return AssignStatement(node.name, rewrite(node.aexp))
+    if isinstance(node, CompoundStatement):
+        return CompoundStatement(rewrite(node.first), rewrite(node.second))
+    if isinstance(node, BlockStatement):
+        return BlockStatement(tuple(rewrite(statement) for statement in node.statements))
+    if isinstance(node, IfStatement):
+        false_statement = rewrite(node.false_statement) if node.false_statement else None
+        return IfStatement(rewrite(node.condition), rewrite(node.true_statement), false_statement)
+    if isinstance(node, WhileStatement):
+        return WhileStatement(rewrite(node.condition), rewrite(node.body))
+    if isinstance(node, ForStatement):
+        return ForStatement(rewrite(node.condition), rewrite(node.body))
+    if isinstance(node, PrintStatement):
+        return PrintStatement(rewrite(node.body))
+    return node
+
+def run_pass(node, rewrite):
+    return rewrite(rebuild(node, lambda child: run_pass(child, rewrite)))
+
+def children(node):
+    found = []
+    for value in node._values():
+        if isinstance(value, Equality):
+            found.append(value)
+        elif isinstance(value, tuple): # the statements of a BlockStatement
+            found.extend(value)
+    return found
+
+def can_fail(node):
+    # Whether evaluating node can raise, which in IMP only a division can
+    if isinstance(node, BinopAexp) and node.op == '/':
+        return True
+    return any(can_fail(child) for child in children(node))
+
+# Constant folding
+
+folded_binops = {
+    '+': lambda l, r: l + r,
+    '-': lambda l, r: l - r,
+    '*': lambda l, r: l * r,
+}
+
+folded_relops = {
+    '<': lambda l, r: l < r,
+    '<=': lambda l, r: l <= r,
+    '>': lambda l, r: l > r,
+    '>=': lambda l, r: l >= r,
+    '=': lambda l, r: l == r,
+    '==': lambda l, r: l == r,
+    '!=': lambda l, r: l != r,
+}
+
+def fold_constants(node):
+    if isinstance(node, BinopAexp) and node.op in folded_binops:
+        if isinstance(node.left, IntAexp) and isinstance(node.right, IntAexp):
+            return IntAexp(folded_binops[node.op](node.left.i, node.right.i))
+    elif isinstance(node, RelopBexp) and node.op in folded_relops:
+        if isinstance(node.left, IntAexp) and isinstance(node.right, IntAexp):
+            return BoolBexp(folded_relops[node.op](node.left.i, node.right.i))
+    elif isinstance(node, NotBexp):
+        if isinstance(node.exp, BoolBexp):
+            return BoolBexp(not node.exp.value)
+    elif isinstance(node, (AndBexp, OrBexp)):
+        if isinstance(node.left, BoolBexp) and isinstance(node.right, BoolBexp):
+            if isinstance(node, AndBexp):
+                return BoolBexp(node.left.value and node.right.value)
+            return BoolBexp(node.left.value or node.right.value)
+    return node
+
+# Algebraic identities
+
+def is_constant(node, value):
+    return isinstance(node, IntAexp) and type(node.i) is int and node.i == value
+
+def simplify_identities(node):
+    if isinstance(node, BinopAexp):
+        if node.op == '+' and is_constant(node.right, 0) or node.op == '-' and is_constant(node.right, 0):
+            return node.left
+        if node.op == '+' and is_constant(node.left, 0):
+            return node.right
+        if node.op == '*' and is_constant(node.right, 1):
+            return node.left
+        if node.op == '*' and is_constant(node.left, 1):
+            return node.right
+    elif isinstance(node, NotBexp):
+        if isinstance(node.exp, NotBexp):
+            return node.exp.exp
+    elif isinstance(node, (AndBexp, OrBexp)):
+        # and: true and b is b, false and b is false; or: false or b is b, true or b is true
+        neutral = isinstance(node, AndBexp)
+        for constant, other in [(node.left, node.right), (node.right, node.left)]:
+            if isinstance(constant, BoolBexp) and not can_fail(other):
+                return other if constant.value == neutral else constant
+    return node
+
+# Dead branches
+
+def remove_dead_branches(node):
+    if isinstance(node, IfStatement) and isinstance(node.condition, BoolBexp):
+        if node.condition.value:
+            return node.true_statement
+        if node.false_statement:
+            return node.false_statement
+        return None
+    if isinstance(node, (WhileStatement, ForStatement)) and isinstance(node.condition, BoolBexp):
+        if not node.condition.value:
+            return None
+    if isinstance(node, CompoundStatement):
+        # A statement removed above is None here
+        if node.first is None:
+            return node.second
+        if node.second is None:
+            return node.first
+    if isinstance(node, BlockStatement) and None in node.statements:
+        statements = [statement for statement in node.statements if statement is not None]
+        return statement_sequence(statements) if statements else None
+    if isinstance(node, (IfStatement, WhileStatement, ForStatement)):
+        # A branch or body whose every statement was removed
+        if isinstance(node, IfStatement) and node.false_statement is None and node.true_statement is None:
+            return None
+        if isinstance(node, IfStatement) and node.true_statement is None:
+            return IfStatement(NotBexp(node.condition), node.false_statement, None)
+        if isinstance(node, IfStatement) or node.body is not None:
+            return node
+        return node.__class__(node.condition, skip())
+    return node
+
+def skip():
+    # A statement that does nothing, for a program or loop body whose every statement was removed
+    return IfStatement(BoolBexp(False), AssignStatement('_', IntAexp(0)), None)
+
+# Loops
+
+def assigned_variables(node, names=None):
+    if names is None:
+        names = set()
+    if isinstance(node, AssignStatement):
+        names.add(node.name)
+    for child in children(node):
+        assigned_variables(child, names)
+    return names
+
+def read_variables(node, names=None):
+    if names is None:
+        names = set()
+    if isinstance(node, VarAexp):
+        names.add(node.name)
+    for child in children(node):
+        read_variables(child, names)
+    return names
+
+def is_loop(node):
+    return isinstance(node, (WhileStatement, ForStatement))
+
+class Temporaries:
+    # Fresh variable names for values the loop passes compute once and keep; $ never starts an IMP identifier
+    def __init__(self, ast):
+        used = [name for name in assigned_variables(ast) if name.startswith(temporary_prefix)]
+        self.count = max([int(name[1:]) + 1 for name in used] or [0])
+    def new(self):
+        self.count += 1
+        return '%s%d' % (temporary_prefix, self.count - 1)
+
+temporary_prefix = '$'
+
+def strip_temporaries(env):
+    # Removes the temporaries of hoist_invariants and reduce_strength from a final environment
+    for name in [name for name in env if name.startswith(temporary_prefix)]:
+        del env[name]
+    return env
+
+def hoist_invariants(ast):
+    temporaries = Temporaries(ast)
+    def rewrite(node):
+        if not is_loop(node):
+            return node
+        written = assigned_variables(node.body)
+        hoisted = [] # (temporary, expression) pairs, each expression hoisted once however often it occurs
+        def replace(child):
+            if isinstance(child, BinopAexp) and not (read_variables(child) & written) and not can_fail(child):
+                for name, exp in hoisted:
+                    if exp == child:
+                        return VarAexp(name)
+                hoisted.append((temporaries.new(), child))
+                return VarAexp(hoisted[-1][0])
+            return rebuild(child, replace)
+        loop = node.__class__(replace(node.condition), replace(node.body))
+        if not hoisted:
+            return node
+        return statement_sequence([AssignStatement(name, exp) for name, exp in hoisted] + [loop])
+    return run_pass(ast, rewrite)
+
+def induction_step(statement, name):
+    # The constant step of an assignment name := name + c or name := name - c, or None
+    if isinstance(statement, AssignStatement) and statement.name == name:
+        exp = statement.aexp
+        if isinstance(exp, BinopAexp) and exp.op in ['+', '-'] and exp.left == VarAexp(name):
+            if isinstance(exp.right, IntAexp) and type(exp.right.i) is int:
+                return exp.right.i if exp.op == '+' else -exp.right.i
+    return None
+
+def induction_product(node):
+    # (variable, factor) when node is variable * constant or constant * variable
+    if isinstance(node, BinopAexp) and node.op == '*':
+        for variable, factor in [(node.left, node.right), (node.right, node.left)]:
+            if isinstance(variable, VarAexp) and isinstance(factor, IntAexp) and type(factor.i) is int:
+                return variable.name, factor.i
+    return None
+
+def count_products(node, counts):
+    product = induction_product(node)
+    if product:
+        counts[product] = counts.get(product, 0) + 1
+    for child in children(node):
+        count_products(child, counts)
+    return counts
+
+def reduce_strength(ast, min_uses=2):
+    # Only for programs without division: every value is then an int, and adding up the steps gives exactly the
+    # products. A single product is not worth it for the evaluators here, where the extra assignment each
+    # iteration costs about what the multiplication saves, so a product has to occur min_uses times.
+    if can_fail(ast):
+        return ast
+    temporaries = Temporaries(ast)
+    def rewrite(node):
+        if not is_loop(node):
+            return node
+        statements = sequence(node.body)
+        counts = count_products(node.condition, count_products(node.body, {}))
+        reduced = {} # (variable, factor) -> temporary
+        for (name, factor), uses in sorted(counts.items()):
+            steps = [i for i, statement in enumerate(statements) if induction_step(statement, name) is not None]
+            if uses >= min_uses and len(steps) == 1 and sum(1 for statement in statements
+                    if name in assigned_variables(statement)) == 1:
+                reduced[(name, factor)] = temporaries.new()
+        if not reduced:
+            return node
+        def replace(child):
+            product = induction_product(child)
+            if product in reduced:
+                return VarAexp(reduced[product])
+            return rebuild(child, replace)
+        body = []
+        for statement in statements:
+            body.append(replace(statement))
+            for (name, factor), temporary in sorted(reduced.items()):
+                step = induction_step(statement, name)
+                if step is not None:
+                    body.append(AssignStatement(temporary, BinopAexp('+', VarAexp(temporary), IntAexp(step * factor))))
+        setup = [AssignStatement(temporary, BinopAexp('*', VarAexp(name), IntAexp(factor)))
+                 for (name, factor), temporary in sorted(reduced.items())]
+        return statement_sequence(setup + [node.__class__(replace(node.condition), statement_sequence(body))])
+    return run_pass(ast, rewrite)
+
+# step of the counter and the number of iterations, given the counter and the bound, for each comparison
+counting_conditions = {
+    '<': (1, lambda i, n: BinopAexp('-', n, i)),
+    '<=': (1, lambda i, n: BinopAexp('-', BinopAexp('+', n, IntAexp(1)), i)),
+    '>': (-1, lambda i, n: BinopAexp('-', i, n)),
+    '>=': (-1, lambda i, n: BinopAexp('-', BinopAexp('+', i, IntAexp(1)), n)),
+}
+mirrored_relops = {'<': '>', '<=': '>=', '>': '<', '>=': '<='}
+
+def counting_candidates(condition):
+    # The ways to read condition as counter <comparison> bound, as (counter, comparison, bound)
+    candidates = []
+    if isinstance(condition, RelopBexp) and condition.op in counting_conditions:
+        if isinstance(condition.left, VarAexp):
+            candidates.append((condition.left.name, condition.op, condition.right))
+        if isinstance(condition.right, VarAexp):
+            candidates.append((condition.right.name, mirrored_relops[condition.op], condition.left))
+    return candidates
+
+def closed_form(statement, iterations, written):
+    # What statement amounts to after iterations runs of the loop, or None if it is not an accumulation
+    if not isinstance(statement, AssignStatement):
+        return None
+    exp = statement.aexp
+    if not read_variables(exp) & written:
+        return statement # x := e, the same value every time
+    if isinstance(exp, BinopAexp) and exp.op in ['+', '-'] and exp.left == VarAexp(statement.name):
+        if not read_variables(exp.right) & written:
+            return AssignStatement(statement.name, BinopAexp(exp.op, exp.left, BinopAexp('*', exp.right, iterations)))
+    return None
+
+def close_counting_loops(ast):
+    if can_fail(ast):
+        return ast
+    def rewrite(node):
+        if is_loop(node):
+            for counter, op, bound in counting_candidates(node.condition):
+                closed = close_loop(node, counter, op, bound)
+                if closed:
+                    return closed
+        return node
+    return run_pass(ast, rewrite)
+
+def close_loop(node, counter, op, bound):
+    # The closed form of the loop node counting counter towards bound, or None if it is not a counting loop
+    step, iterations = counting_conditions[op]
+    statements = sequence(node.body)
+    written = assigned_variables(node.body)
+    names = [statement.name for statement in statements if isinstance(statement, AssignStatement)]
+    if read_variables(bound) & written or len(set(names)) != len(statements):
+        return None
+    steps = [statement for statement in statements if induction_step(statement, counter) == step]
+    if len(steps) != 1:
+        return None
+    iterations = iterations(VarAexp(counter), bound)
+    closed = [closed_form(statement, iterations, written) for statement in statements if statement not in steps]
+    if None in closed:
+        return None
+    # The counter stops where the comparison first fails: at the bound for < and >, one past it for <= and >=
+    last = bound if op in ['<', '>'] else BinopAexp('+' if step > 0 else '-', bound, IntAexp(1))
+    return IfStatement(node.condition, statement_sequence(closed + [AssignStatement(counter, last)]), None)
+
+def rewrite_pass(rewrite):
+    # A pass applying a node rewrite to the whole tree
+    return lambda ast: run_pass(ast, rewrite)
+
+expression_passes = [rewrite_pass(fold_constants), rewrite_pass(simplify_identities),
+                     rewrite_pass(remove_dead_branches)]
+loop_passes = [close_counting_loops, hoist_invariants, reduce_strength]
+default_passes = expression_passes + loop_passes
+
+def optimize(ast, passes=default_passes):
+    for optimization in passes:
+        ast = optimization(ast)
+        if ast is None:
+            return skip()
+    return ast
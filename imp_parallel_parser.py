@@ -0,0 +1,132 @@
+#!/usr/bin/python3
+
+import gc
+import os
+import contextlib
+import concurrent.futures
+from imp_lexer import *
+from imp_parser import *
+from imp_ast import *
+from combinator import Result
+from lexer import TokenBuffer
+
+'''
+Parallel parsing for large programs. A big IMP file is mostly one long list of statements separated by ;, and
+stmt_list parses that list one statement after the other on a single core. But a ; outside every if and while
+block can only be a separator of that top level list, so the list can be cut there into chunks of whole
+statements without parsing anything: split_statements scans the tokens once, counting if and while as opening a
+block and end as closing one. imp_parse_parallel parses the chunks in worker processes and joins the statements
+they return into the one BlockStatement the serial parse builds.
+
+    result = imp_parse_parallel(tokens, workers=4)
+
+returns what imp_parse(tokens) would, a Result or None. A program that does not split cleanly (an end without a
+block, a block without an end) or that has a chunk that does not parse is handed to imp_parse as a whole, so
+errors come out exactly as in the serial parse.
+
+Workers get their chunk as source text when tokens is a TokenBuffer, and lex it again themselves, which is much
+cheaper to send to another process than the tokens; from a token list they get a slice of the list. They send back
+a list of statements, which the parent joins into one BlockStatement.
+
+Parsing and unpickling a chunk allocate hundreds of thousands of AST nodes and tokens, none of them in a reference
+cycle, and the cyclic garbage collector keeps traversing all of them as they pile up: over a quarter of the time of a
+chunk went into collections that never freed anything. The collector is switched off while a worker parses and
+while the parent takes in and joins the results.
+'''
+
+# how many chunks each worker gets, so that workers finishing early can take over the rest
+chunks_per_worker = 4
+
+def split_statements(tokens):
+    # The positions of the ; tokens separating the top level statements of tokens, or None if the blocks do not
+    # balance
+    separators = []
+    depth = 0
+    if isinstance(tokens, TokenBuffer):
+        # Tests the token codes directly instead of building a token for each position
+        codes = dict((tokens.code_table.get((text, RESERVED)), change) for text, change in
+                     [('if', 1), ('while', 1), ('end', -1), (';', 0)])
+        codes.pop(None, None)
+        for pos, code in enumerate(tokens.codes):
+            if code in codes:
+                change = codes[code]
+                if change == 0 and depth == 0:
+                    separators.append(pos)
+                depth += change
+                if depth < 0:
+                    return None
+    else:
+        for pos, (text, tag) in enumerate(tokens):
+            if tag == RESERVED:
+                if text == 'if' or text == 'while':
+                    depth += 1
+                elif text == 'end':
+                    depth -= 1
+                    if depth < 0:
+                        return None
+                elif text == ';' and depth == 0:
+                    separators.append(pos)
+    if depth != 0:
+        return None
+    return separators
+
+def chunk_bounds(tokens, separators, count):
+    # Cuts tokens at some of separators into at most count runs of whole statements of about the same number of
+    # tokens, as (start, end) pairs; the separators between chunks belong to none of them
+    size = len(tokens) // count + 1
+    bounds = []
+    start = 0
+    for separator in separators:
+        if separator - start >= size:
+            bounds.append((start, separator))
+            start = separator + 1
+    bounds.append((start, len(tokens)))
+    return bounds
+
+def chunk_source(tokens, start, end):
+    if isinstance(tokens, TokenBuffer):
+        if start == end:
+            return ''
+        return tokens.source[tokens.starts[start]:tokens.ends[end - 1]]
+    return list(tokens[start:end])
+
+@contextlib.contextmanager
+def collector_paused():
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+def parse_chunk(chunk, backend='combinator'):
+    # Runs in a worker: the statements of chunk, source text or a token list, or None if it does not parse
+    with collector_paused():
+        tokens = imp_lex(chunk) if isinstance(chunk, str) else chunk
+        result = imp_parse(tokens, backend=backend)
+        if not result:
+            return None
+        return sequence(result.value)
+
+def imp_parse_parallel(tokens, workers=None, backend='combinator', executor=None):
+    # Parses tokens like imp_parse(tokens, backend=backend), in worker processes; executor is a
+    # concurrent.futures executor to use instead of a new process pool
+    separators = split_statements(tokens)
+    if separators is None:
+        return imp_parse(tokens, backend=backend)
+    own_executor = executor is None
+    if own_executor:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+    try:
+        count = (workers or os.cpu_count() or 1) * chunks_per_worker
+        chunks = [chunk_source(tokens, start, end) for start, end in chunk_bounds(tokens, separators, count)]
+        with collector_paused():
+            parsed = list(executor.map(parse_chunk, chunks, [backend] * len(chunks)))
+            if None not in parsed:
+                return Result(statement_sequence([statement for statements in parsed for statement in statements]),
+                              len(tokens))
+    finally:
+        if own_executor:
+            executor.shutdown()
+    return imp_parse(tokens, backend=backend)
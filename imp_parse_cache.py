@@ -0,0 +1,114 @@
+#!/usr/bin/python3
+
+import os
+import hashlib
+import tempfile
+import imp_serialize
+from imp_ast import *
+from imp_lexer import *
+from imp_parser import *
+from imp_to_python import default_cache_dir as code_cache_dir
+
+'''
+A disk cache of parsed programs, so that running a file that has not changed since the last run skips lexing and
+parsing it:
+
+    ast = load(source)
+
+returns what imp_parse(imp_lex_buffer(source)).value would, or None if source does not parse, reading the AST from
+the cache when it is there and writing it there when it is not. parse is the function to parse with on a miss, for
+instance a parallel parse (see imp_parallel_parser); it gets the source and returns a Result or None.
+
+Each program is one file named after the key, a SHA-256 of the source, the grammar_version of imp_parser and the
+format the tree is written in, so a change to any of them simply misses. Trees are written with imp_serialize, which
+takes a third of the space pickle does and handles trees of any depth, and read back from a memory mapping of the
+file. Programs that do not parse are not cached.
+
+Files are written to a temporary file and renamed into place, so concurrent runs only ever see whole files, and two
+runs writing the same program write the same bytes. A file that cannot be read is a miss. The cache is bounded by
+max_size bytes: after every write the least recently used files are removed until the rest fit, where a hit marks
+its file as used by touching its modification time. A run racing another one's eviction at worst misses.
+
+The directory is cache_dir, or ast under the directory of imp_to_python's code cache ($IMP_CACHE_DIR or
+~/.cache/imp). A cache that cannot be written to is skipped.
+'''
+
+cache_format = 'imp_serialize-%d' % imp_serialize.format_version
+cache_suffix = '.ast'
+max_size = 256 * 1024 * 1024
+
+def cache_key(source):
+    digest = hashlib.sha256()
+    digest.update(grammar_version.encode())
+    digest.update(cache_format.encode())
+    digest.update(source.encode('utf-8'))
+    return digest.hexdigest()
+
+def default_cache_dir():
+    return os.path.join(code_cache_dir(), 'ast')
+
+def read_cached(directory, key):
+    path = os.path.join(directory, key + cache_suffix)
+    try:
+        with open(path, 'rb') as file:
+            ast = imp_serialize.load(file)
+        os.utime(path)
+    except (OSError, RuntimeError):
+        return None
+    return ast if isinstance(ast, Statement) else None
+
+def write_cached(directory, key, ast):
+    # Written to a temporary file and renamed into place, so concurrent runs never see half a file
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                imp_serialize.dump(ast, file)
+            os.replace(temporary, os.path.join(directory, key + cache_suffix))
+        except BaseException:
+            os.remove(temporary)
+            raise
+    except (OSError, RuntimeError):
+        pass
+
+def evict(directory, size=None):
+    # Removes the least recently used programs from directory until the rest take at most size bytes
+    size = max_size if size is None else size
+    entries = []
+    try:
+        with os.scandir(directory) as scan:
+            for entry in scan:
+                if entry.name.endswith(cache_suffix):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+    except OSError:
+        return
+    total = sum(entry_size for mtime, entry_size, path in entries)
+    for mtime, entry_size, path in sorted(entries):
+        if total <= size:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= entry_size
+
+def parse_serial(source):
+    return imp_parse(imp_lex_buffer(source))
+
+def load(source, parse=parse_serial, cache_dir=None, use_disk=True, size=None):
+    # The AST of source, or None if it does not parse
+    directory = cache_dir or default_cache_dir()
+    key = cache_key(source)
+    if use_disk:
+        ast = read_cached(directory, key)
+        if ast is not None:
+            return ast
+    result = parse(source)
+    if not result:
+        return None
+    if use_disk:
+        write_cached(directory, key, result.value)
+        evict(directory, size)
+    return result.value
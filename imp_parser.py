@@ -6,6 +6,7 @@ from imp_lexer import *
 from combinator import *
 from imp_ast import *
 from functools import *
+from imp_stack_parser import StackParser
 
 '''
 This is just a specialized version of the Reserved combinator using the RESERVED tag that all keyword tokens are tagged with. 
@@ -38,36 +39,76 @@ lambda argument_list: expression
 
 '''
 
+'''
+The grammar is built once and shared. Each rule function below is wrapped in lru_cache, so the first call builds
+its parser and every later call, from imp_parse or from a Lazy inside another rule, gets that same object back.
+A Lazy(stmt_list) therefore resolves to the one stmt_list parser instead of building a fresh sub-grammar for every
+if and while it appears in. None of the parsers keep any state between calls (the packrat memo table lives on the
+token list), so the shared grammar is safe to use from several threads at once. The whole grammar is built at the
+bottom of this module, at import time.
+'''
+
+#Bumped whenever the grammar or the AST it builds changes, which throws away every parse cached on disk (see
+#imp_parse_cache)
+grammar_version = '1'
+
 #Basic Parser
+@lru_cache(maxsize=None)
 def keyword(kw):
 	return Reserved(kw, RESERVED)
 num = Tag(INT)^(lambda i :int(i))
 id = Tag(ID)
 
-def imp_parse(tokens):
-	ast = parser()(tokens, 0)
+'''
+imp_parse parses in packrat mode unless memo is False: the tokens are wrapped, not copied, in a Packrat context
+carrying the memo table for this parse. The rule worth memoizing is aexp, which bexp_relop parses and then throws
+away whenever a condition starts with a parenthesis, only for bexp_group to parse it again one token further in.
+Each Memo adds a Python frame per nesting level, which is why the other rules are left alone. Without the Packrat
+context the Memo just passes through.
+
+backend picks the statement parser: 'combinator' tries assign_stmt, if_stmt and while_stmt in turn, 'll1' looks at
+the first token of the statement and goes straight to the right one (see ll1_stmt), and 'stack' is the
+non-recursive StackParser from imp_stack_parser for very deeply nested programs. All of them build the same AST.
+'''
+
+def imp_parse(tokens, memo=True, backend='combinator'):
+	if backend not in parser_backends:
+		raise RuntimeError('unknown parser backend: ' + backend)
+	if memo:
+		tokens = Packrat(tokens)
+	ast = parser_backends[backend]()(tokens, 0)
 	return ast
 
+@lru_cache(maxsize=None)
 def parser():
 	return Phrase(stmt_list())
 
 #Statements 
+#A statement list is one BlockStatement holding all of its statements (see imp_ast), or just the statement if there
+#is only one
+@lru_cache(maxsize=None)
 def stmt_list():
-	separator = keyword(';')^(lambda x: lambda l, r: CompoundStatement(l,r))
-	return Exp(stmt(), separator)
+	return stmt() + Rep(keyword(';') + stmt()) ^ process_stmt_list
+
+def process_stmt_list(parsed):
+	(first, rest) = parsed
+	return statement_sequence([first] + [statement for (_, statement) in rest])
 
+@lru_cache(maxsize=None)
 def stmt():
 	return assign_stmt() | \
 		   if_stmt() | \
 		   while_stmt()
 
+@lru_cache(maxsize=None)
 def assign_stmt():
     def process(parsed):
         ((name, _), exp) = parsed
         return AssignStatement(name, exp)
     return id + keyword(':=') + aexp() ^ process
 
-def if_stmt():
+@lru_cache(maxsize=None)
+def if_stmt(block=stmt_list):
     def process(parsed):
         (((((_, condition), _), true_stmt), false_parsed), _) = parsed
         if false_parsed:
@@ -76,19 +117,38 @@ def if_stmt():
             false_stmt = None
         return IfStatement(condition, true_stmt, false_stmt)
     return keyword('if') + bexp() + \
-           keyword('then') + Lazy(stmt_list) + \
-           Opt(keyword('else') + Lazy(stmt_list)) + \
+           keyword('then') + Lazy(block) + \
+           Opt(keyword('else') + Lazy(block)) + \
            keyword('end') ^ process
 
-def while_stmt():
+@lru_cache(maxsize=None)
+def while_stmt(block=stmt_list):
     def process(parsed):
         ((((_, condition), _), body), _) = parsed
         return WhileStatement(condition, body)
     return keyword('while') + bexp() + \
-           keyword('do') + Lazy(stmt_list) + \
+           keyword('do') + Lazy(block) + \
            keyword('end') ^ process
 
+# LL(1) statements: every statement is told apart by its first token (ID, if or while), so instead of trying the
+# alternatives in order ll1_stmt dispatches on that token through a table built from their FIRST sets. The bodies
+# of if and while are ll1_stmt_lists as well.
+@lru_cache(maxsize=None)
+def ll1_parser():
+	return Phrase(ll1_stmt_list())
+
+@lru_cache(maxsize=None)
+def ll1_stmt_list():
+	return ll1_stmt() + Rep(keyword(';') + ll1_stmt()) ^ process_stmt_list
+
+@lru_cache(maxsize=None)
+def ll1_stmt():
+	return Dispatch([assign_stmt(),
+	                 if_stmt(ll1_stmt_list),
+	                 while_stmt(ll1_stmt_list)])
+
 
+@lru_cache(maxsize=None)
 def for_stmt():
     def process(parsed):
         ((((_, condition), _), body), _) = parsed
@@ -99,38 +159,47 @@ def for_stmt():
 
 
 # Boolean expressions
+@lru_cache(maxsize=None)
 def bexp():
-    return precedence(bexp_term(),
-                      bexp_precedence_levels,
-                      process_logic)
+    return operator_precedence(bexp_term(),
+                               bexp_precedence_levels,
+                               process_logic)
 
+@lru_cache(maxsize=None)
 def bexp_term():
     return bexp_not()   | \
            bexp_relop() | \
            bexp_group()
 
+@lru_cache(maxsize=None)
 def bexp_not():
     return keyword('not') + Lazy(bexp_term) ^ (lambda parsed: NotBexp(parsed[1]))
 
+@lru_cache(maxsize=None)
 def bexp_relop():
     relops = ['<', '<=', '>', '>=', '=', '!=']
     return aexp() + any_operator_in_list(relops) + aexp() ^ process_relop
 
+@lru_cache(maxsize=None)
 def bexp_group():
     return keyword('(') + Lazy(bexp) + keyword(')') ^ process_group
 
 # Arithmetic expressions
+@lru_cache(maxsize=None)
 def aexp():
-    return precedence(aexp_term(),
-                      aexp_precedence_levels,
-                      process_binop)
+    return Memo(operator_precedence(aexp_term(),
+                                    aexp_precedence_levels,
+                                    process_binop))
 
+@lru_cache(maxsize=None)
 def aexp_term():
     return aexp_value() | aexp_group()
 
+@lru_cache(maxsize=None)
 def aexp_group():
     return keyword('(') + Lazy(aexp) + keyword(')') ^ process_group
            
+@lru_cache(maxsize=None)
 def aexp_value():
     return (num ^ (lambda i: IntAexp(i))) | \
            (id  ^ (lambda v: VarAexp(v)))
@@ -144,6 +213,10 @@ def precedence(value_parser, precedence_levels, combine):
         parser = parser * op_parser(precedence_level)
     return parser
 
+# The same thing as a single table-driven parser; this is what aexp and bexp use
+def operator_precedence(value_parser, precedence_levels, combine):
+    return OperatorPrecedence(value_parser, precedence_levels, combine, RESERVED)
+
 # Miscellaneous functions for binary and relational operators
 def process_binop(op):
     return lambda l, r: BinopAexp(op, l, r)
@@ -179,3 +252,16 @@ bexp_precedence_levels = [
     ['and'],
     ['or'],
 ]
+
+@lru_cache(maxsize=None)
+def stack_parser():
+    return StackParser()
+
+parser_backends = {
+    'combinator': parser,
+    'll1': ll1_parser,
+    'stack': stack_parser,
+}
+
+for build in parser_backends.values():
+    build()
@@ -0,0 +1,271 @@
+#!/usr/bin/python3
+
+import io
+import mmap
+from imp_ast import *
+from imp_parallel_parser import collector_paused
+
+'''
+A compact binary format for imp_ast trees, for saving parsed programs (see imp_parse_cache). Pickle writes the class
+of every node and calls back into Python to take each one apart and put it together again; here every node is a
+one-byte opcode followed by its fields, written in pre-order, so a tree is one flat run of bytes.
+
+    data = dumps(ast)            dump(ast, file)
+    ast = loads(data)            ast = load(file)
+
+loads takes anything that indexes to byte values: bytes, a bytearray, a memoryview or an mmap. load maps a file
+into memory when it can and decodes straight from the mapping, and reads it otherwise.
+
+The data starts with the magic bytes IMPA and the format_version. Then comes the root node:
+
+    INT zigzag-varint           VAR name                  BINOP_ADD ... BINOP_DIV left right
+    TRUE  FALSE                 AND left right            RELOP_LT ... RELOP_NE left right
+    OR left right               NOT exp                   ASSIGN name aexp
+    COMPOUND first second       BLOCK count statement...  IF condition true false
+    WHILE condition body        FOR condition body        PRINT body
+    NONE (a missing else)
+
+The operator of a BinopAexp or a RelopBexp is part of its opcode. Integers are varints, seven bits a byte with the
+high bit set on all but the last byte, and IntAexp values are zigzag-encoded first (0, -1, 1, -2, ... as 0, 1, 2,
+3, ...) so that small negative numbers stay short too. Integers of any size work. Names are interned as they come:
+a name is a varint, 0 for a name seen for the first time, which follows as a varint length and UTF-8 bytes and gets
+the next number, or the number of a name seen before. Writing and reading both walk the tree with an explicit
+stack, so a tree as deep as the stack parser builds is fine. As in imp_parallel_parser, the cyclic garbage collector
+is switched off while a tree is read: none of the nodes are in a cycle, and with the collector on, reading a large
+tree takes three times as long, most of it in collections that never free anything.
+
+Data that is not in this format raises RuntimeError. Nodes of other classes, such as the ones imp_slots resolves
+to, and IntAexp values that are not integers cannot be written and raise RuntimeError too.
+'''
+
+magic = b'IMPA'
+format_version = 1
+
+# Opcodes
+INT = 1
+VAR = 2
+TRUE = 3
+FALSE = 4
+AND = 5
+OR = 6
+NOT = 7
+ASSIGN = 8
+COMPOUND = 9
+BLOCK = 10
+IF = 11
+WHILE = 12
+FOR = 13
+PRINT = 14
+NONE = 15
+BINOP = 16 # BINOP + the index of the operator in binops
+RELOP = 32 # RELOP + the index of the operator in relops
+
+binops = ['+', '-', '*', '/']
+relops = ['<', '<=', '>', '>=', '=', '==', '!=']
+binop_codes = dict((op, BINOP + index) for index, op in enumerate(binops))
+relop_codes = dict((op, RELOP + index) for index, op in enumerate(relops))
+
+# The nodes with a fixed number of node children, and how many of them there are
+branch_codes = {AndBexp: AND, OrBexp: OR, NotBexp: NOT, CompoundStatement: COMPOUND, WhileStatement: WHILE,
+                ForStatement: FOR, PrintStatement: PRINT}
+
+class Encoder:
+    # Writes trees to out, any object with a write method, in chunks of about flush_size bytes
+    flush_size = 1 << 16
+
+    def __init__(self, out):
+        self.out = out
+        self.buffer = bytearray()
+        self.names = {} # name -> its number
+
+    def varint(self, value):
+        buffer = self.buffer
+        while value > 127:
+            buffer.append(value & 127 | 128)
+            value >>= 7
+        buffer.append(value)
+
+    def name(self, name):
+        number = self.names.get(name)
+        if number is not None:
+            self.varint(number)
+            return
+        self.names[name] = len(self.names) + 1
+        data = name.encode('utf-8')
+        self.buffer.append(0)
+        self.varint(len(data))
+        self.buffer += data
+
+    def tree(self, ast):
+        buffer = self.buffer
+        buffer += magic
+        buffer.append(format_version)
+        pending = [ast]
+        while pending:
+            node = pending.pop()
+            cls = node.__class__
+            # Interned nodes (see imp_intern) are written as the plain nodes they stand for
+            cls = getattr(cls, '_base', cls)
+            if cls is VarAexp:
+                buffer.append(VAR)
+                self.name(node.name)
+            elif cls is IntAexp:
+                value = node.i
+                if type(value) is not int:
+                    raise RuntimeError('cannot serialize IntAexp of %s' % type(value).__name__)
+                buffer.append(INT)
+                self.varint(value * 2 if value >= 0 else -value * 2 - 1)
+            elif cls is BinopAexp or cls is RelopBexp:
+                codes = binop_codes if cls is BinopAexp else relop_codes
+                if node.op not in codes:
+                    raise RuntimeError('unknown operator: ' + node.op)
+                buffer.append(codes[node.op])
+                pending.append(node.right)
+                pending.append(node.left)
+            elif cls is AssignStatement:
+                buffer.append(ASSIGN)
+                self.name(node.name)
+                pending.append(node.aexp)
+            elif cls is BlockStatement:
+                buffer.append(BLOCK)
+                self.varint(len(node.statements))
+                pending.extend(reversed(node.statements))
+            elif cls is IfStatement:
+                buffer.append(IF)
+                pending.append(node.false_statement)
+                pending.append(node.true_statement)
+                pending.append(node.condition)
+            elif cls in branch_codes:
+                buffer.append(branch_codes[cls])
+                pending.extend(reversed(node._values()))
+            elif cls is BoolBexp:
+                buffer.append(TRUE if node.value else FALSE)
+            elif node is None:
+                buffer.append(NONE)
+            else:
+                raise RuntimeError('cannot serialize %s' % cls.__name__)
+            if len(buffer) >= self.flush_size:
+                self.flush()
+        self.flush()
+
+    def flush(self):
+        self.out.write(self.buffer)
+        del self.buffer[:]
+
+def dump(ast, file):
+    Encoder(file).tree(ast)
+
+def dumps(ast):
+    out = io.BytesIO()
+    dump(ast, out)
+    return out.getvalue()
+
+# What each opcode with a fixed number of node children builds, by opcode: the class, its operator or None, and the
+# number of fields
+node_shapes = [None] * 256
+for code, cls, count in [(AND, AndBexp, 2), (OR, OrBexp, 2), (NOT, NotBexp, 1), (COMPOUND, CompoundStatement, 2),
+                         (IF, IfStatement, 3), (WHILE, WhileStatement, 2), (FOR, ForStatement, 2),
+                         (PRINT, PrintStatement, 1)]:
+    node_shapes[code] = (cls, None, count)
+for op, code in binop_codes.items():
+    node_shapes[code] = (BinopAexp, op, 3)
+for op, code in relop_codes.items():
+    node_shapes[code] = (RelopBexp, op, 3)
+
+def decode(data):
+    # The tree in data, which indexes to byte values
+    if bytes(data[:len(magic)]) != magic:
+        raise RuntimeError('not a serialized IMP program')
+    if data[len(magic)] != format_version:
+        raise RuntimeError('unknown serialization format version: %d' % data[len(magic)])
+    pos = len(magic) + 1
+    names = [None] # names[number]; 0 introduces a new name
+    # The nodes under construction, innermost last, as (class, fields so far, number of fields)
+    frames = []
+    push = frames.append
+    while True:
+        code = data[pos]
+        pos += 1
+        shape = node_shapes[code]
+        if shape is not None:
+            cls, op, count = shape
+            push((cls, [] if op is None else [op], count))
+            continue
+        if code == VAR or code == ASSIGN:
+            number = data[pos]
+            pos += 1
+            if number > 127:
+                number, pos = read_varint(data, pos - 1)
+            if number == 0:
+                length = data[pos]
+                pos += 1
+                if length > 127:
+                    length, pos = read_varint(data, pos - 1)
+                names.append(bytes(data[pos:pos + length]).decode('utf-8'))
+                pos += length
+                number = len(names) - 1
+            name = names[number]
+            if code == ASSIGN:
+                push((AssignStatement, [name], 2))
+                continue
+            node = VarAexp(name)
+        elif code == INT:
+            value = data[pos]
+            pos += 1
+            if value > 127:
+                value, pos = read_varint(data, pos - 1)
+            node = IntAexp(value >> 1 if not value & 1 else -(value >> 1) - 1)
+        elif code == BLOCK:
+            count, pos = read_varint(data, pos)
+            if count:
+                push((BlockStatement, [], count))
+                continue
+            node = BlockStatement(())
+        elif code == TRUE or code == FALSE:
+            node = BoolBexp(code == TRUE)
+        elif code == NONE:
+            node = None
+        else:
+            raise RuntimeError('unknown opcode %d at byte %d' % (code, pos - 1))
+        # node is complete: hand it to the node it belongs to, completing that one too if it was the last field
+        while frames:
+            cls, fields, count = frames[-1]
+            fields.append(node)
+            if len(fields) < count:
+                break
+            node = BlockStatement(tuple(fields)) if cls is BlockStatement else cls(*fields)
+            frames.pop()
+        else:
+            return node, pos
+
+def read_varint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 127) << shift
+        if byte < 128:
+            return value, pos
+        shift += 7
+
+def loads(data):
+    if isinstance(data, memoryview) and data.format != 'B':
+        data = data.cast('B')
+    try:
+        with collector_paused():
+            ast, end = decode(data)
+    except (IndexError, UnicodeDecodeError):
+        raise RuntimeError('truncated or corrupt serialized IMP program')
+    if end != len(data):
+        raise RuntimeError('trailing bytes after a serialized IMP program')
+    return ast
+
+def load(file):
+    try:
+        mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        # Not a file on disk, or an empty one, which cannot be mapped
+        return loads(file.read())
+    with mapping:
+        return loads(mapping)
@@ -0,0 +1,123 @@
+#!/usr/bin/python3
+
+from imp_ast import *
+
+'''
+Slot-resolved variables. eval keeps the variables in a dict, so every VarAexp.eval does a membership test and a
+lookup and every AssignStatement.eval hashes the name again. resolve gives every distinct variable of a program
+an integer slot and rewrites the AST to use it: VarAexp becomes SlotAexp and AssignStatement becomes
+SlotAssignStatement, which index a preallocated list instead. All the other nodes are kept as they are, since they
+only hand the environment on to their children.
+
+The list starts out with the values from the initial environment, and False in the slots of the variables it does
+not have. False is 0 in arithmetic and comparisons, so an unassigned variable still reads as 0, and every value
+the program assigns is a real number (a copy x := y and a print of a bare variable are resolved as y + 0), so the
+slots still holding False at the end are exactly the variables that were never assigned. as_dict turns the slots
+back into the dict eval would have left, for the final variable values imp.py prints.
+
+    program = resolve(ast)
+    slots = program.slots(env)
+    program.statement.eval(slots)
+    env = program.as_dict(slots)
+
+The slots are a plain list rather than an array('q'): values grow into arbitrary precision integers and / makes
+floats, neither of which fits a machine integer array, and reading an array boxes every value into a new int
+object while a list hands out the one it holds.
+'''
+
+class SlotAexp(Aexp):
+    __slots__ = ('name', 'slot')
+    def __init__(self, name, slot):
+        self.name = name
+        self.slot = slot
+    def eval(self, env):
+        return env[self.slot]
+
+class SlotAssignStatement(Statement):
+    __slots__ = ('name', 'slot', 'aexp')
+    def __init__(self, name, slot, aexp):
+        self.name = name
+        self.slot = slot
+        self.aexp = aexp
+    def eval(self, env):
+        env[self.slot] = self.aexp.eval(env)
+
+class ResolvedProgram:
+    def __init__(self, statement, names):
+        self.statement = statement
+        self.names = names # names[slot] is the variable in slot
+    def slots(self, env):
+        return [env.get(name, False) for name in self.names]
+    def as_dict(self, slots, env=None):
+        # Adds the assigned variables to env, a new dict by default
+        if env is None:
+            env = {}
+        for name, value in zip(self.names, slots):
+            if value is not False:
+                env[name] = value
+        return env
+    def eval(self, env):
+        # Runs the program on the dict env, like statement.eval would
+        slots = self.slots(env)
+        try:
+            self.statement.eval(slots)
+        finally:
+            self.as_dict(slots, env)
+
+class Resolver:
+    def __init__(self):
+        self.slots = {}
+        self.names = []
+
+    def slot(self, name):
+        if name not in self.slots:
+            self.slots[name] = len(self.names)
+            self.names.append(name)
+        return self.slots[name]
+
+    def value(self, node):
+        # An expression that is stored or printed; False must not escape from an unassigned variable
+        if isinstance(node, VarAexp):
+            return BinopAexp('+', self.aexp(node), IntAexp(0))
+        return self.aexp(node)
+
+    def aexp(self, node):
+        if isinstance(node, VarAexp):
+            return SlotAexp(node.name, self.slot(node.name))
+        if isinstance(node, BinopAexp):
+            return BinopAexp(node.op, self.aexp(node.left), self.aexp(node.right))
+        return node
+
+    def bexp(self, node):
+        if isinstance(node, RelopBexp):
+            return RelopBexp(node.op, self.aexp(node.left), self.aexp(node.right))
+        if isinstance(node, AndBexp):
+            return AndBexp(self.bexp(node.left), self.bexp(node.right))
+        if isinstance(node, OrBexp):
+            return OrBexp(self.bexp(node.left), self.bexp(node.right))
+        if isinstance(node, NotBexp):
+            return NotBexp(self.bexp(node.exp))
+        return node
+
+    def statement(self, node):
+        if isinstance(node, AssignStatement):
+            return SlotAssignStatement(node.name, self.slot(node.name), self.value(node.aexp))
+        if isinstance(node, CompoundStatement):
+            return CompoundStatement(self.statement(node.first), self.statement(node.second))
+        if isinstance(node, BlockStatement):
+            return BlockStatement(tuple(self.statement(statement) for statement in node.statements))
+        if isinstance(node, IfStatement):
+            false_statement = self.statement(node.false_statement) if node.false_statement else None
+            return IfStatement(self.bexp(node.condition), self.statement(node.true_statement), false_statement)
+        if isinstance(node, WhileStatement):
+            return WhileStatement(self.bexp(node.condition), self.statement(node.body))
+        if isinstance(node, ForStatement):
+            return ForStatement(self.bexp(node.condition), self.statement(node.body))
+        if isinstance(node, PrintStatement):
+            return PrintStatement(self.value(node.body))
+        raise RuntimeError('cannot resolve statement: %s' % node.__class__.__name__)
+
+def resolve(ast):
+    resolver = Resolver()
+    statement = resolver.statement(ast)
+    return ResolvedProgram(statement, resolver.names)
@@ -0,0 +1,188 @@
+#!/usr/bin/python3
+
+from imp_lexer import *
+from combinator import *
+from imp_ast import *
+
+'''
+The combinator parsers recurse through several Python frames for every level of nesting in the program, so a few
+hundred nested if/while blocks or parentheses are enough for a RecursionError. StackParser parses the same
+language without recursion: open blocks and pending operators are kept on explicit stacks, so nesting is limited
+only by memory. It is selected with imp_parse(tokens, backend='stack') and builds the same AST as the combinator
+parsers.
+
+Statements are handled a token at a time. An if or while pushes a frame for its block and statement parsing starts
+over inside it; when a statement list ends (no ; follows) the innermost frame is either given its else-block or
+closed by its end, and the finished if/while becomes a statement of the enclosing list.
+
+Expressions use operator precedence with an operand and an operator stack (shunting yard). Arithmetic and Boolean
+expressions are parsed together, because after an opening parenthesis in a condition there is no telling yet
+whether it groups an arithmetic or a Boolean expression. Every operand carries its kind, and building a node
+checks the kinds of its operands: + takes two arithmetic expressions, < two arithmetic ones giving a Boolean one,
+and takes two Boolean ones, and so on. A program the combinator grammar rejects always ends up with a kind
+mismatch or a token out of place here, and is rejected as well.
+'''
+
+AEXP = 'AEXP'
+BEXP = 'BEXP'
+
+# Binding strength of each operator, tighter operators have higher numbers. not is a prefix operator binding
+# looser than the relational operators (not a < b is not (a < b)) but tighter than and/or.
+binary_precedence = {
+    '*': 6, '/': 6,
+    '+': 5, '-': 5,
+    '<': 4, '<=': 4, '>': 4, '>=': 4, '=': 4, '!=': 4,
+    'and': 2,
+    'or': 1,
+}
+not_precedence = 3
+arithmetic_operators = frozenset(['*', '/', '+', '-'])
+relational_operators = frozenset(['<', '<=', '>', '>=', '=', '!='])
+
+class ParseError(Exception):
+    pass
+
+class StackParser(Parser):
+    def __call__(self, tokens, pos):
+        try:
+            ast = self.parse_program(tokens, pos)
+        except ParseError:
+            return None
+        return Result(ast, len(tokens))
+
+    def parse_program(self, tokens, pos):
+        blocks = [] # open if/while blocks, innermost last, as [kind, condition, then-statements, outer statements]
+        statements = None # the statements of the list being built in the innermost block
+        while True:
+            token = self.peek(tokens, pos)
+            if token == ('if', RESERVED) or token == ('while', RESERVED):
+                condition, pos = self.parse_expression(tokens, pos + 1, BEXP)
+                self.expect(tokens, pos, 'then' if token[0] == 'if' else 'do')
+                pos += 1
+                blocks.append([token[0], condition, None, statements])
+                statements = None
+                continue
+            statement, pos = self.parse_assignment(tokens, pos)
+            while True:
+                if statements is None:
+                    statements = []
+                statements.append(statement)
+                if self.peek(tokens, pos) == (';', RESERVED):
+                    pos += 1
+                    break
+                if not blocks:
+                    if pos != len(tokens):
+                        raise ParseError('unexpected token at %d' % pos)
+                    return statement_sequence(statements)
+                block = blocks[-1]
+                kind, condition, then_statements, outer = block
+                if kind == 'if' and then_statements is None and self.peek(tokens, pos) == ('else', RESERVED):
+                    block[2] = statements
+                    statements = None
+                    pos += 1
+                    break
+                self.expect(tokens, pos, 'end')
+                pos += 1
+                blocks.pop()
+                if kind == 'while':
+                    statement = WhileStatement(condition, statement_sequence(statements))
+                elif then_statements is None:
+                    statement = IfStatement(condition, statement_sequence(statements), None)
+                else:
+                    statement = IfStatement(condition, statement_sequence(then_statements),
+                                            statement_sequence(statements))
+                statements = outer
+
+    def parse_assignment(self, tokens, pos):
+        token = self.peek(tokens, pos)
+        if token is None or token[1] is not ID:
+            raise ParseError('statement expected at %d' % pos)
+        self.expect(tokens, pos + 1, ':=')
+        aexp, pos = self.parse_expression(tokens, pos + 2, AEXP)
+        return AssignStatement(token[0], aexp), pos
+
+    def parse_expression(self, tokens, pos, kind):
+        operands = [] # (node, kind) pairs
+        operators = [] # operator texts, '(' for an open parenthesis, 'not' for a pending not
+        open_parens = 0
+        expect_operand = True
+        while True:
+            token = self.peek(tokens, pos)
+            if expect_operand:
+                if token is None:
+                    raise ParseError('operand expected at end of input')
+                text, tag = token
+                if tag is INT:
+                    operands.append((IntAexp(int(text)), AEXP))
+                    expect_operand = False
+                elif tag is ID:
+                    operands.append((VarAexp(text), AEXP))
+                    expect_operand = False
+                elif token == ('(', RESERVED):
+                    operators.append('(')
+                    open_parens += 1
+                elif token == ('not', RESERVED) and kind is BEXP:
+                    operators.append('not')
+                else:
+                    raise ParseError('operand expected at %d' % pos)
+                pos += 1
+                continue
+            text = token[0] if token is not None and token[1] is RESERVED else None
+            if text in binary_precedence and (kind is BEXP or text in arithmetic_operators):
+                precedence = binary_precedence[text]
+                while operators and operators[-1] != '(' and self.precedence(operators[-1]) >= precedence:
+                    self.reduce(operands, operators.pop())
+                operators.append(text)
+                expect_operand = True
+                pos += 1
+            elif text == ')' and open_parens:
+                while operators[-1] != '(':
+                    self.reduce(operands, operators.pop())
+                operators.pop()
+                open_parens -= 1
+                pos += 1
+            else:
+                break
+        if open_parens:
+            raise ParseError('unclosed parenthesis')
+        while operators:
+            self.reduce(operands, operators.pop())
+        node, node_kind = operands.pop()
+        if node_kind is not kind:
+            raise ParseError('expression of the wrong kind')
+        return node, pos
+
+    def precedence(self, operator):
+        if operator == 'not':
+            return not_precedence
+        return binary_precedence[operator]
+
+    def reduce(self, operands, operator):
+        if operator == 'not':
+            exp, exp_kind = operands.pop()
+            if exp_kind is not BEXP:
+                raise ParseError('not needs a Boolean expression')
+            operands.append((NotBexp(exp), BEXP))
+            return
+        right, right_kind = operands.pop()
+        left, left_kind = operands.pop()
+        if operator in arithmetic_operators:
+            node, operand_kind, kind = BinopAexp(operator, left, right), AEXP, AEXP
+        elif operator in relational_operators:
+            node, operand_kind, kind = RelopBexp(operator, left, right), AEXP, BEXP
+        elif operator == 'and':
+            node, operand_kind, kind = AndBexp(left, right), BEXP, BEXP
+        else:
+            node, operand_kind, kind = OrBexp(left, right), BEXP, BEXP
+        if left_kind is not operand_kind or right_kind is not operand_kind:
+            raise ParseError('operands of the wrong kind for ' + operator)
+        operands.append((node, kind))
+
+    def peek(self, tokens, pos):
+        if pos < len(tokens):
+            return tokens[pos]
+        return None
+
+    def expect(self, tokens, pos, keyword):
+        if self.peek(tokens, pos) != (keyword, RESERVED):
+            raise ParseError('%s expected at %d' % (keyword, pos))
@@ -0,0 +1,225 @@
+#!/usr/bin/python3
+
+import os
+import hashlib
+import marshal
+import tempfile
+import importlib.util
+from imp_ast import *
+from imp_lexer import *
+from imp_parser import *
+from imp_closures import compile_closures
+from imp_optimize import optimize as optimize_ast, children
+
+'''
+Transpiling IMP to Python. translate turns an AST into the source of a Python function, compile_ast compiles it,
+and the program then runs as ordinary Python bytecode: every IMP variable is a local variable of the function,
+every operator is the Python operator, and every while loop a Python while loop.
+
+    n := 5; p := 1; while n > 0 do p := p * n; n := n - 1 end
+
+becomes
+
+    def imp_program(env):
+        v_n = env.get('n', False)
+        v_p = env.get('p', False)
+        try:
+            v_n = 5
+            v_p = 1
+            while (v_n > 0):
+                v_p = (v_p * v_n)
+                v_n = (v_n - 1)
+        finally:
+            if v_n is not False: env['n'] = v_n
+            if v_p is not False: env['p'] = v_p
+
+A variable that was never assigned reads as 0 but must not appear in the final environment, so it starts out as
+False (which is 0 in arithmetic and comparisons) and a copy x := y is compiled as y + 0, which makes every
+assigned value a real number. and and or become & and | on the Booleans of the conditions, which evaluates both
+sides just like AndBexp.eval and OrBexp.eval. The finally clause writes the variables back even when a division by
+zero stops the program, so the environment ends up as eval leaves it.
+
+CPython refuses functions with 20 or more nested blocks (the try counts as one), and very deeply nested
+expressions; compile_ast then raises RuntimeError, and run and load fall back to the closure engine.
+
+load(source) runs the whole pipeline from IMP source text to a callable, and caches the compiled code in memory and
+on disk, keyed by a hash of the source, so a script that has been run before skips lexing, parsing, translating and
+compiling altogether. The disk cache holds marshalled code objects, which are only readable by the Python version
+that wrote them, so the key includes its bytecode magic number. The directory is cache_dir, $IMP_CACHE_DIR, or
+~/.cache/imp; a cache that cannot be written to is skipped.
+'''
+
+translator_version = '2' # bump whenever the generated code or the optimizer changes
+
+def variable(name):
+    # The temporaries of imp_optimize start with $, which a Python identifier cannot contain
+    return 'v_' + name.replace('$', '__')
+
+binop_symbols = {'+': '+', '-': '-', '*': '*'}
+relop_symbols = {'<': '<', '<=': '<=', '>': '>', '>=': '>=', '=': '==', '==': '==', '!=': '!='}
+
+def aexp_source(node):
+    if isinstance(node, IntAexp):
+        return repr(node.i)
+    if isinstance(node, VarAexp):
+        return variable(node.name)
+    if isinstance(node, BinopAexp):
+        left, right = aexp_source(node.left), aexp_source(node.right)
+        if node.op == '/':
+            return '_divide(%s, %s)' % (left, right)
+        if node.op not in binop_symbols:
+            raise RuntimeError('unknown operator: ' + node.op)
+        return '(%s %s %s)' % (left, binop_symbols[node.op], right)
+    raise RuntimeError('cannot translate expression: %s' % node.__class__.__name__)
+
+def value_source(node):
+    # An expression whose value is stored or printed: a bare variable might still hold False
+    source = aexp_source(node)
+    if isinstance(node, VarAexp):
+        source += ' + 0'
+    return source
+
+def bexp_source(node):
+    if isinstance(node, RelopBexp):
+        if node.op not in relop_symbols:
+            raise RuntimeError('unknown operator: ' + node.op)
+        return '(%s %s %s)' % (aexp_source(node.left), relop_symbols[node.op], aexp_source(node.right))
+    if isinstance(node, AndBexp):
+        return '(%s & %s)' % (bexp_source(node.left), bexp_source(node.right))
+    if isinstance(node, OrBexp):
+        return '(%s | %s)' % (bexp_source(node.left), bexp_source(node.right))
+    if isinstance(node, NotBexp):
+        return '(not %s)' % bexp_source(node.exp)
+    if isinstance(node, BoolBexp):
+        return repr(bool(node.value))
+    raise RuntimeError('cannot translate condition: %s' % node.__class__.__name__)
+
+def statement_lines(node, indent, lines):
+    for node in sequence(node):
+        if isinstance(node, AssignStatement):
+            lines.append('%s%s = %s' % (indent, variable(node.name), value_source(node.aexp)))
+        elif isinstance(node, IfStatement):
+            lines.append('%sif %s:' % (indent, bexp_source(node.condition)))
+            statement_lines(node.true_statement, indent + '    ', lines)
+            if node.false_statement:
+                lines.append('%selse:' % indent)
+                statement_lines(node.false_statement, indent + '    ', lines)
+        elif isinstance(node, (WhileStatement, ForStatement)):
+            lines.append('%swhile %s:' % (indent, bexp_source(node.condition)))
+            statement_lines(node.body, indent + '    ', lines)
+        elif isinstance(node, PrintStatement):
+            lines.append('%sprint(%s)' % (indent, value_source(node.body)))
+        else:
+            raise RuntimeError('cannot translate statement: %s' % node.__class__.__name__)
+
+def variable_names(ast):
+    names = []
+    seen = set()
+    pending = [ast]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, (VarAexp, AssignStatement)) and node.name not in seen:
+            seen.add(node.name)
+            names.append(node.name)
+        pending.extend(reversed(children(node)))
+    return names
+
+def translate(ast):
+    names = variable_names(ast)
+    lines = ['def imp_program(env):']
+    for name in names:
+        lines.append('    %s = env.get(%r, False)' % (variable(name), name))
+    lines.append('    try:')
+    statement_lines(ast, '        ', lines)
+    lines.append('    finally:')
+    if not names:
+        lines.append('        pass')
+    for name in names:
+        lines.append('        if %s is not False: env[%r] = %s' % (variable(name), name, variable(name)))
+    return '\n'.join(lines) + '\n'
+
+def compile_ast(ast, filename='<imp>'):
+    # Returns the code object of a module defining imp_program
+    try:
+        return compile(translate(ast), filename, 'exec')
+    except (SyntaxError, RecursionError, MemoryError) as error:
+        raise RuntimeError('program too deeply nested to translate to Python: %s' % error)
+
+def divide(left_value, right_value):
+    try:
+        return left_value / right_value
+    except ZeroDivisionError:
+        print("Division by zero!")
+        raise
+
+def function(code):
+    namespace = {'_divide': divide}
+    exec(code, namespace)
+    return namespace['imp_program']
+
+def run(ast, env):
+    try:
+        code = compile_ast(ast)
+    except RuntimeError:
+        compile_closures(ast)(env)
+        return
+    function(code)(env)
+
+# Caching compiled programs by source
+
+memory_cache = {} # source key -> code object
+
+def source_key(source, optimize=False):
+    digest = hashlib.sha256()
+    digest.update(translator_version.encode())
+    digest.update(b'optimized' if optimize else b'plain')
+    digest.update(importlib.util.MAGIC_NUMBER)
+    digest.update(source.encode('utf-8'))
+    return digest.hexdigest()
+
+def default_cache_dir():
+    return os.environ.get('IMP_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'imp')
+
+def read_cached(directory, key):
+    try:
+        with open(os.path.join(directory, key + '.code'), 'rb') as file:
+            return marshal.load(file)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+
+def write_cached(directory, key, code):
+    # Written to a temporary file and renamed into place, so concurrent runs never see half a file
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                marshal.dump(code, file)
+            os.replace(temporary, os.path.join(directory, key + '.code'))
+        except BaseException:
+            os.remove(temporary)
+            raise
+    except OSError:
+        pass
+
+def load(source, cache_dir=None, use_disk=True, optimize=False):
+    # Returns the program in source as a function of the environment, or None if it does not parse. With optimize
+    # the program goes through imp_optimize before it is translated.
+    key = source_key(source, optimize)
+    code = memory_cache.get(key)
+    directory = cache_dir or default_cache_dir()
+    if code is None and use_disk:
+        code = read_cached(directory, key)
+    if code is None:
+        result = imp_parse(imp_lex_buffer(source))
+        if not result:
+            return None
+        ast = optimize_ast(result.value) if optimize else result.value
+        try:
+            code = compile_ast(ast)
+        except RuntimeError:
+            return compile_closures(ast)
+        if use_disk:
+            write_cached(directory, key, code)
+    memory_cache[key] = code
+    return function(code)
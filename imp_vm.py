@@ -0,0 +1,310 @@
+#!/usr/bin/python3
+
+from imp_ast import *
+from imp_optimize import can_fail, children
+
+'''
+A bytecode compiler and virtual machine for IMP, as a faster alternative to calling eval on the AST.
+
+The tree walker makes a Python method call for every node it evaluates and compares operator strings on every
+BinopAexp and RelopBexp. Here the AST is compiled once into a flat list of instructions, and run by a single loop
+that dispatches on integer opcodes. Every instruction is a tuple of the same width, an opcode and three operands
+(unused ones are 0), so the loop unpacks one instruction per step and jump targets are plain list indexes.
+
+The machine has no stack. All values live in one list of registers: first one register per variable of the
+program, then one per distinct integer constant (filled in before the program starts, so constants are read like
+variables), then scratch registers for the intermediate values of nested expressions. Every instruction names its
+operand and result registers directly, so  p := p * n  is the single instruction MUL p p n.
+
+Conditions are never turned into values. A relational operator compiles to a conditional jump, and not, and and or
+compile to the way those jumps are wired up, and therefore short-circuit. AndBexp.eval and OrBexp.eval evaluate
+both sides, which only makes a difference when the skipped side divides by zero; so a condition with a division
+in it first computes the operands of its divisions, to fail where eval would. A while loop is laid out with its
+test at the bottom, so each iteration runs exactly one jump.
+
+Variables that were never assigned read as 0 but must not show up in the final environment. Their registers start
+out holding False, which behaves as 0 in arithmetic and comparisons, and any arithmetic result or copy
+(MOVE adds 0) is a real int, so after the run the registers still holding False are exactly the unassigned
+variables.
+
+    code = compile_program(ast)
+    run(code, env)
+'''
+
+# Opcodes; each instruction is an (opcode, operand, operand, operand) tuple
+MOVE = 0 # MOVE dest src
+ADD = 1 # ADD dest left right
+SUB = 2
+MUL = 3
+DIV = 4
+JUMP = 5 # JUMP target
+JUMP_LT = 6 # JUMP_LT left right target: jump if left < right
+JUMP_LE = 7
+JUMP_GT = 8
+JUMP_GE = 9
+JUMP_EQ = 10
+JUMP_NE = 11
+PRINT = 12 # PRINT src
+HALT = 13
+
+opcode_names = ['MOVE', 'ADD', 'SUB', 'MUL', 'DIV', 'JUMP', 'JUMP_LT', 'JUMP_LE', 'JUMP_GT', 'JUMP_GE',
+                'JUMP_EQ', 'JUMP_NE', 'PRINT', 'HALT']
+operand_counts = [2, 3, 3, 3, 3, 1, 3, 3, 3, 3, 3, 3, 1, 0]
+
+binop_opcodes = {'+': ADD, '-': SUB, '*': MUL, '/': DIV}
+relop_jumps = {'<': JUMP_LT, '<=': JUMP_LE, '>': JUMP_GT, '>=': JUMP_GE, '=': JUMP_EQ, '==': JUMP_EQ, '!=': JUMP_NE}
+negated_relops = {'<': '>=', '<=': '>', '>': '<=', '>=': '<', '=': '!=', '==': '!=', '!=': '='}
+
+class Bytecode:
+    def __init__(self, code, names, constants, size):
+        self.code = code # list of instruction tuples
+        self.names = names # names[slot] is the variable held in register slot
+        self.constants = constants # register -> constant value
+        self.size = size # number of registers
+    def __repr__(self):
+        return ('Bytecode (%d instructions, %d registers)' % (len(self.code), self.size))
+
+class Compiler:
+    def __init__(self):
+        self.code = []
+        self.names = []
+        self.slots = {} # variable name -> register
+        self.constant_values = [] # constant values in order of first use
+        self.constant_slots = {} # (type, value) -> index into constant_values
+        self.temps = 0 # scratch registers in use by the statement being compiled
+        self.max_temps = 0
+
+    def compile(self, ast):
+        # Variables are numbered before any code is emitted so that constants and scratch registers can follow them
+        self.number_variables(ast)
+        self.statement(ast)
+        self.emit(HALT)
+        first_constant = len(self.names)
+        first_temp = first_constant + len(self.constant_values)
+        # Constant and scratch operands were emitted as negative placeholders; now that the number of variables
+        # and constants is known they become real register numbers
+        code = []
+        for op, a, b, c in self.code:
+            count = operand_counts[op]
+            if op == JUMP or op >= JUMP_LT and op <= JUMP_NE:
+                count -= 1 # the last operand of a jump is a code address
+            operands = [a, b, c]
+            for i in range(count):
+                operands[i] = self.register(operands[i], first_constant, first_temp)
+            code.append((op,) + tuple(operands))
+        constants = dict((first_constant + i, value) for i, value in enumerate(self.constant_values))
+        return Bytecode(code, list(self.names), constants, first_temp + self.max_temps)
+
+    def register(self, operand, first_constant, first_temp):
+        # operand >= 0: variable register; -1, -2, ...: constants; <= -1000000: scratch registers
+        if operand >= 0:
+            return operand
+        if operand > -1000000:
+            return first_constant - operand - 1
+        return first_temp - operand - 1000000
+
+    def number_variables(self, node):
+        if isinstance(node, (VarAexp, AssignStatement)):
+            self.variable(node.name)
+        for child in children(node):
+            self.number_variables(child)
+
+    def variable(self, name):
+        if name not in self.slots:
+            self.slots[name] = len(self.names)
+            self.names.append(name)
+        return self.slots[name]
+
+    def constant(self, value):
+        key = (type(value), value)
+        if key not in self.constant_slots:
+            self.constant_slots[key] = len(self.constant_values)
+            self.constant_values.append(value)
+        return -self.constant_slots[key] - 1
+
+    def temp(self):
+        self.temps += 1
+        self.max_temps = max(self.max_temps, self.temps)
+        return -1000000 - self.temps + 1
+
+    def emit(self, op, *operands):
+        # Returns the address of the instruction
+        self.code.append([op] + list(operands) + [0] * (3 - len(operands)))
+        return len(self.code) - 1
+
+    def label(self):
+        return len(self.code)
+
+    def patch(self, address, target):
+        # Sets the target of the jump at address
+        instruction = self.code[address]
+        instruction[operand_counts[instruction[0]]] = target
+
+    def statement(self, node):
+        self.temps = 0
+        if isinstance(node, AssignStatement):
+            dest = self.variable(node.name)
+            if isinstance(node.aexp, BinopAexp):
+                self.aexp(node.aexp, dest)
+            else:
+                self.emit(MOVE, dest, self.aexp(node.aexp))
+        elif isinstance(node, (CompoundStatement, BlockStatement)):
+            for statement in sequence(node):
+                self.statement(statement)
+        elif isinstance(node, IfStatement):
+            else_jumps = self.condition(node.condition, False)
+            self.statement(node.true_statement)
+            if node.false_statement:
+                end_jump = self.emit(JUMP, None)
+                self.patch_all(else_jumps, self.label())
+                self.statement(node.false_statement)
+                self.patch(end_jump, self.label())
+            else:
+                self.patch_all(else_jumps, self.label())
+        elif isinstance(node, (WhileStatement, ForStatement)):
+            test_jump = self.emit(JUMP, None)
+            body = self.label()
+            self.statement(node.body)
+            self.patch(test_jump, self.label())
+            self.temps = 0
+            self.patch_all(self.condition(node.condition, True), body)
+        elif isinstance(node, PrintStatement):
+            self.emit(PRINT, self.aexp(node.body))
+        else:
+            raise RuntimeError('cannot compile statement: %s' % node.__class__.__name__)
+
+    def aexp(self, node, dest=None):
+        # Emits the code computing node and returns the register holding its value
+        if isinstance(node, IntAexp):
+            return self.constant(node.i)
+        if isinstance(node, VarAexp):
+            return self.variable(node.name)
+        if isinstance(node, BinopAexp):
+            if node.op not in binop_opcodes:
+                raise RuntimeError('unknown operator: ' + node.op)
+            temps = self.temps
+            left = self.aexp(node.left)
+            right = self.aexp(node.right)
+            self.temps = temps
+            if dest is None:
+                dest = self.temp()
+            self.emit(binop_opcodes[node.op], dest, left, right)
+            return dest
+        raise RuntimeError('cannot compile expression: %s' % node.__class__.__name__)
+
+    def condition(self, node, jump_if):
+        if can_fail(node) and not isinstance(node, RelopBexp):
+            self.check_divisions(node)
+        return self.branch(node, jump_if)
+
+    def check_divisions(self, node):
+        # Computes every division in the condition and throws the result away, for the ZeroDivisionError
+        if isinstance(node, BinopAexp) and node.op == '/':
+            temps = self.temps
+            self.aexp(node)
+            self.temps = temps
+            return
+        for child in children(node):
+            self.check_divisions(child)
+
+    def branch(self, node, jump_if):
+        # Emits code that jumps when node evaluates to jump_if and falls through otherwise. Returns the addresses
+        # of the jumps, to be patched once the target is known.
+        if isinstance(node, RelopBexp):
+            op = node.op if jump_if else negated_relops.get(node.op)
+            if op not in relop_jumps:
+                raise RuntimeError('unknown operator: ' + node.op)
+            temps = self.temps
+            left = self.aexp(node.left)
+            right = self.aexp(node.right)
+            self.temps = temps
+            return [self.emit(relop_jumps[op], left, right, None)]
+        if isinstance(node, NotBexp):
+            return self.branch(node.exp, not jump_if)
+        if isinstance(node, BoolBexp):
+            return [self.emit(JUMP, None)] if bool(node.value) == jump_if else []
+        if isinstance(node, (AndBexp, OrBexp)):
+            if isinstance(node, AndBexp) == jump_if:
+                # and jumping when true / or jumping when false: both sides have to agree, so skip past the
+                # right side as soon as the left one disagrees
+                skip = self.branch(node.left, not jump_if)
+                jumps = self.branch(node.right, jump_if)
+                self.patch_all(skip, self.label())
+                return jumps
+            return self.branch(node.left, jump_if) + self.branch(node.right, jump_if)
+        raise RuntimeError('cannot compile condition: %s' % node.__class__.__name__)
+
+    def patch_all(self, addresses, target):
+        for address in addresses:
+            self.patch(address, target)
+
+def compile_program(ast):
+    return Compiler().compile(ast)
+
+def disassemble(bytecode):
+    lines = []
+    for pc, instruction in enumerate(bytecode.code):
+        operands = instruction[1:1 + operand_counts[instruction[0]]]
+        lines.append('%4d %-8s %s' % (pc, opcode_names[instruction[0]], ' '.join(str(operand) for operand in operands)))
+    return '\n'.join(lines)
+
+def run(bytecode, env):
+    registers = [False] * bytecode.size
+    for slot, name in enumerate(bytecode.names):
+        if name in env:
+            registers[slot] = env[name]
+    for slot, value in bytecode.constants.items():
+        registers[slot] = value
+    try:
+        execute(bytecode.code, registers)
+    finally:
+        # Also when a division by zero stops the program, to leave env as eval would
+        for slot, name in enumerate(bytecode.names):
+            if registers[slot] is not False:
+                env[name] = registers[slot]
+
+def execute(code, r):
+    # The dispatch loop. Opcodes are tested roughly in order of how often loops execute them.
+    pc = 0
+    while True:
+        op, a, b, c = code[pc]
+        if op == ADD:
+            r[a] = r[b] + r[c]
+            pc += 1
+        elif op == SUB:
+            r[a] = r[b] - r[c]
+            pc += 1
+        elif op == MUL:
+            r[a] = r[b] * r[c]
+            pc += 1
+        elif op == MOVE:
+            r[a] = r[b] + 0
+            pc += 1
+        elif op == JUMP_LT:
+            pc = c if r[a] < r[b] else pc + 1
+        elif op == JUMP_GT:
+            pc = c if r[a] > r[b] else pc + 1
+        elif op == JUMP_LE:
+            pc = c if r[a] <= r[b] else pc + 1
+        elif op == JUMP_GE:
+            pc = c if r[a] >= r[b] else pc + 1
+        elif op == JUMP_EQ:
+            pc = c if r[a] == r[b] else pc + 1
+        elif op == JUMP_NE:
+            pc = c if r[a] != r[b] else pc + 1
+        elif op == JUMP:
+            pc = a
+        elif op == DIV:
+            try:
+                r[a] = r[b] / r[c]
+            except ZeroDivisionError:
+                print("Division by zero!")
+                raise
+            pc += 1
+        elif op == PRINT:
+            print(r[a] + 0)
+            pc += 1
+        elif op == HALT:
+            return
+        else:
+            raise RuntimeError('unknown opcode %d at %d' % (op, pc))
@@ -2,25 +2,142 @@
 import lexer
 import sys
 import re
+from array import array
 
-def lex(characters, token_exprs):
+'''
+Instead of trying every token expression at every position, all of the expressions are joined into one
+alternation with a named group per expression, (?P<T0>...)|(?P<T1>...)|... , which is compiled once per
+token_exprs list. Alternation tries its branches left to right, so the first expression in the list that
+matches still wins, exactly as before. match.lastgroup tells us which branch matched, and therefore which tag
+the token gets.
+
+Words like if and while are not given expressions of their own. They are lexed by the identifier expression and then
+looked up in keywords, a dict from word to tag, which replaces the tag of any token whose text it contains. One
+hash lookup per token is cheaper than a failed regex per keyword, and a word is only a keyword if the whole
+identifier matches, so endx and order stay identifiers.
+'''
+
+compiled_exprs = {}
+
+def compile_token_exprs(token_exprs):
+	key = tuple(token_exprs)
+	if key not in compiled_exprs:
+		patterns = ['(?P<T%d>%s)' %(i, pattern) for i, (pattern, tag) in enumerate(token_exprs)]
+		tags = dict(('T%d' %i, tag) for i, (pattern, tag) in enumerate(token_exprs))
+		compiled_exprs[key] = (re.compile('|'.join(patterns)), tags)
+	return compiled_exprs[key]
+
+def lex(characters, token_exprs, keywords={}):
+	regex, tags = compile_token_exprs(token_exprs)
 	pos = 0
 	tokens = []
-	while pos<len(characters):
-		match = None
-		for token_expr in token_exprs:
-			pattern, tag = token_expr
-			regex = re.compile(pattern) #https://pymotw.com/2/re/
-			match = regex.match(characters,pos) #https://pymotw.com/2/re/
-			if match:
-				text = match.group(0)
-				if tag: 
-					token = (text,tag)
-					tokens.append(token) 
-				break 
-		if not match:
-			sys.stderr.write("Illegal character : %s\n" %characters[pos]) #throw an error
-			sys.exit(1) 
-		else :
-			pos = match.end(0)
-	return tokens
\ No newline at end of file
+	for match in regex.finditer(characters): #https://docs.python.org/3/library/re.html#re.Pattern.finditer
+		if match.start() != pos:
+			break
+		tag = tags[match.lastgroup]
+		if tag:
+			text = match.group()
+			token = (text, keywords.get(text, tag))
+			tokens.append(token)
+		pos = match.end()
+	if pos < len(characters):
+		sys.stderr.write("Illegal character : %s\n" %characters[pos]) #throw an error
+		sys.exit(1)
+	return tokens
+
+'''
+lex_stream is the generator version of lex for sources too big to hold in memory. The file is read chunk_size
+characters at a time and tokens are yielded as soon as they are known. A token that runs up to the end of the
+buffer might continue in the next chunk (an identifier, the < of <=, a comment), and a failed match at the end of
+the buffer might just be missing its second character (the : of :=), so in both cases the rest of the buffer is
+kept and matched again once more input has been read. partial_length is the longest start of a token that matches
+none of the expressions on its own (1 for IMP, the : of :=); a failed match with at least that many characters
+left in the buffer cannot be fixed by reading more, and is reported at once instead of dragging the rest of the
+file into the buffer.
+'''
+
+def lex_stream(fileobj, token_exprs, chunk_size=65536, keywords={}, partial_length=16):
+	regex, tags = compile_token_exprs(token_exprs)
+	buffer = ''
+	pos = 0
+	eof = False
+	while not eof:
+		chunk = fileobj.read(chunk_size)
+		eof = not chunk
+		buffer = buffer[pos:] + chunk
+		pos = 0
+		while pos < len(buffer):
+			match = regex.match(buffer, pos)
+			if not eof and (match.end() == len(buffer) if match else len(buffer) - pos <= partial_length):
+				break
+			if not match:
+				sys.stderr.write("Illegal character : %s\n" %buffer[pos])
+				sys.exit(1)
+			tag = tags[match.lastgroup]
+			if tag:
+				text = match.group()
+				yield (text, keywords.get(text, tag))
+			pos = match.end()
+
+'''
+A list of (text, tag) tuples costs a tuple and a string per token. TokenBuffer keeps the same tokens in three flat
+arrays instead: a one-byte code per token and the start and end offsets of its text in the source. Every tag gets
+a code, and so does every distinct text of an interned tag (the keywords and operators), whose (text, tag) tuple is
+built once and shared by all of its occurrences. Only identifiers and numbers are sliced out of the source, and
+only when they are looked at. tokens[pos] and len(tokens) behave like they do on the list, so the combinators
+can parse a TokenBuffer directly.
+'''
+
+class TokenBuffer:
+	def __init__(self, source):
+		self.source = source
+		self.codes = array('B')
+		self.starts = array('I')
+		self.ends = array('I')
+		self.tags = [] #code -> tag
+		self.interned = [] #code -> shared (text, tag) tuple, or None if the text is sliced from the source
+		self.code_table = {}
+	def code(self, text, tag, intern):
+		key = (text, tag) if intern else tag
+		if key not in self.code_table:
+			if len(self.tags) == 256:
+				raise RuntimeError('too many distinct token kinds for a TokenBuffer')
+			self.code_table[key] = len(self.tags)
+			self.tags.append(tag)
+			self.interned.append(key if intern else None)
+		return self.code_table[key]
+	def append(self, tag, start, end, intern=False):
+		text = self.source[start:end] if intern else None
+		self.codes.append(self.code(text, tag, intern))
+		self.starts.append(start)
+		self.ends.append(end)
+	def tag_codes(self, tag):
+		#all codes carrying tag, for scans that test self.codes directly instead of building tokens
+		return frozenset(code for code in range(len(self.tags)) if self.tags[code] is tag)
+	def __len__(self):
+		return len(self.codes)
+	def __getitem__(self, pos):
+		code = self.codes[pos]
+		token = self.interned[code]
+		if token is None:
+			token = (self.source[self.starts[pos]:self.ends[pos]], self.tags[code])
+		return token
+	def __repr__(self):
+		return ('TokenBuffer (%d tokens)' %len(self))
+
+def lex_buffer(characters, token_exprs, intern_tags=(), keywords={}):
+	regex, tags = compile_token_exprs(token_exprs)
+	tokens = TokenBuffer(characters)
+	pos = 0
+	for match in regex.finditer(characters):
+		if match.start() != pos:
+			break
+		tag = tags[match.lastgroup]
+		pos = match.end()
+		if tag:
+			tag = keywords.get(match.group(), tag)
+			tokens.append(tag, match.start(), pos, tag in intern_tags)
+	if pos < len(characters):
+		sys.stderr.write("Illegal character : %s\n" %characters[pos])
+		sys.exit(1)
+	return tokens
@@ -27,6 +27,6 @@ import sys
 import unittest
 
 if __name__ == '__main__':
-    test_names = ['test_lexer', 'test_combinators', 'test_imp_parser', 'test_eval']
+    test_names = ['test_lexer', 'test_combinators', 'test_imp_parser', 'test_eval', 'test_vm', 'test_closures', 'test_to_python', 'test_slots', 'test_optimize', 'test_batch', 'test_run_batch', 'test_parallel_parser', 'test_intern', 'test_parse_cache', 'test_serialize', 'test_incremental']
     suite = unittest.defaultTestLoader.loadTestsFromNames(test_names)
     result = unittest.TextTestRunner().run(suite)
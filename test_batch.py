@@ -0,0 +1,65 @@
+#!/usr/bin/python3
+import io
+import unittest
+import contextlib
+from imp_lexer import *
+from imp_parser import *
+from imp_batch import *
+from test_vm import EngineTests
+from test_optimize import RandomPrograms
+
+def parse(code):
+    return imp_parse(imp_lex(code)).value
+
+class TestBatch(EngineTests, unittest.TestCase):
+    # The engine tests, run as a batch of one
+    def execute(self, ast, env):
+        error = run_batch(ast, [env])[0]
+        if error:
+            raise error
+
+    def scalar_results(self, ast, envs):
+        results = []
+        for env in envs:
+            env = dict(env)
+            error = None
+            try:
+                ast.eval(env)
+            except ZeroDivisionError as e:
+                error = type(e)
+            results.append((env, error))
+        return results
+
+    def batch_test(self, code, envs):
+        ast = parse(code)
+        with contextlib.redirect_stdout(io.StringIO()):
+            expected = self.scalar_results(ast, envs)
+            envs = [dict(env) for env in envs]
+            errors = run_batch(ast, envs)
+        self.assertEquals(expected, [(env, type(error) if error else None) for env, error in zip(envs, errors)], code)
+
+    def test_sweep(self):
+        self.batch_test('p := 1; while n > 0 do p := p * n; n := n - 1 end', [{'n': n} for n in range(30)])
+
+    def test_divergent_branches(self):
+        code = ('i := 0; while i < n do if i - (i / 2) * 2 < 1 then e := e + i else o := o + i end; i := i + 1 end; '
+                'if e > o then w := 1 end')
+        self.batch_test(code, [{'n': n} for n in range(12)] + [{}])
+
+    def test_division_stops_lane(self):
+        self.batch_test('x := 1; y := 10 / n; z := y + 1', [{'n': 2}, {'n': 0}, {'n': 5}, {'n': 0}])
+        self.batch_test('i := 0; while i < 5 do x := x + 1 / (3 - i); i := i + 1 end', [{}, {'i': 4}, {'x': 1}])
+        self.batch_test('if 1 / n > 0 and 1 / (n - 1) > 0 then x := 1 end', [{'n': 0}, {'n': 1}, {'n': 2}])
+
+    def test_columns(self):
+        batch = BatchEvaluator({'n': [3, 0, 5]}, 3)
+        batch.run(parse('s := 0; while n > 0 do s := s + n; n := n - 1 end'))
+        self.assertEquals({'n': [0, 0, 0], 's': [6, 0, 15]}, batch.columns)
+        self.assertEquals({}, batch.errors)
+
+    def test_random_programs(self):
+        for seed in range(100):
+            generator = RandomPrograms(seed)
+            code = generator.statements(3)
+            envs = [{'x': generator.random.randint(-3, 3), 'y': generator.random.randint(-3, 3)} for i in range(8)]
+            self.batch_test(code, envs + [{}])
@@ -0,0 +1,25 @@
+#!/usr/bin/python3
+import unittest
+from imp_lexer import *
+from imp_parser import *
+from imp_closures import *
+from test_vm import EngineTests
+
+class TestClosures(EngineTests, unittest.TestCase):
+    def execute(self, ast, env):
+        compile_closures(ast)(env)
+
+    def test_specialized_operands(self):
+        for op in ['+', '-', '*', '<', '<=', '>', '>=', '=', '!=']:
+            for left, right in [('x', '3'), ('x', 'y'), ('3', 'x'), ('(x + 1)', '(y * 2)')]:
+                if op in ['+', '-', '*']:
+                    self.program_test('x := 7; y := 2; z := %s %s %s' % (left, op, right))
+                else:
+                    self.program_test('x := 7; y := 2; if %s %s %s then z := 1 else z := 2 end' % (left, op, right))
+
+    def test_long_sequence(self):
+        # CompoundStatement chains compile to a loop, so chains too long for eval still run
+        code = '; '.join('x%d := %d' % (i % 10, i) for i in range(5000))
+        env = {}
+        compile_closures(imp_parse(imp_lex(code)).value)(env)
+        self.assertEquals(dict(('x%d' % i, 4990 + i) for i in range(10)), env)
@@ -83,3 +83,52 @@ class TestCombinators(unittest.TestCase):
         parser = Phrase(id)
         self.combinator_test('x', parser, 'x')
 
+    def test_token_buffer(self):
+        tokens = imp_lex_buffer('x 12 if')
+        parser = id + integer + keyword('if')
+        result = parser(tokens, 0)
+        self.assertEqual((('x', '12'), 'if'), result.value)
+        self.assertEqual(3, result.pos)
+
+    def test_memo(self):
+        calls = []
+        def count(value):
+            calls.append(value)
+            return value
+        parser = Memo(id ^ count)
+        tokens = Packrat(imp_lex('x'))
+        self.assertEqual('x', parser(tokens, 0).value)
+        self.assertEqual('x', parser(tokens, 0).value)
+        self.assertEqual(['x'], calls)
+
+    def test_memo_without_packrat(self):
+        parser = Memo(id) + Memo(integer)
+        self.combinator_test('x 12', parser, ('x', '12'))
+
+    def test_memo_bounded(self):
+        tokens = Packrat(imp_lex('x y z'), max_entries=2)
+        parser = Rep(Memo(id))
+        self.assertEqual(['x', 'y', 'z'], parser(tokens, 0).value)
+        self.assertTrue(len(tokens.memo) <= 2)
+
+    def test_packrat_wraps_tokens(self):
+        buffer = imp_lex_buffer('x := 1')
+        tokens = Packrat(buffer)
+        self.assertIs(buffer, tokens.tokens)
+        self.assertEqual(3, len(tokens))
+        self.assertEqual(('x', ID), tokens[0])
+
+    def test_first(self):
+        parser = Opt(keyword('if')) + id | integer
+        self.assertEqual(set([('if', RESERVED), ID, INT]), parser.first())
+
+    def test_dispatch(self):
+        parser = Dispatch([keyword('if') + id, keyword('while') + id, integer])
+        self.combinator_test('if x', parser, ('if', 'x'))
+        self.combinator_test('while y', parser, ('while', 'y'))
+        self.combinator_test('12', parser, '12')
+        self.assertEqual(None, parser(imp_lex('x'), 0))
+
+    def test_dispatch_not_ll1(self):
+        with self.assertRaises(RuntimeError):
+            Dispatch([id + integer, id])
@@ -19,8 +19,19 @@ class TestEvaluation(unittest.TestCase):
     def test_compound(self):
         self.program_test('x := 1; y := 2', {'x': 1, 'y': 2})
 
+    def test_long_program(self):
+        # Far more statements than the recursion limit allows frames
+        self.program_test('; '.join(['x := x + 1'] * 20000), {'x': 20000})
+
     def test_if(self):
         self.program_test('if 1 < 2 then x := 1 else x := 2 end', {'x': 1})
 
     def test_while(self):
-        self.program_test('x := 10; y := 0; while x > 0 do y := y + 1 end', {'x': 0, 'y': 10})
+        self.program_test('x := 10; y := 0; while x > 0 do y := y + 1; x := x - 1 end', {'x': 0, 'y': 10})
+
+    def test_if_false(self):
+        self.program_test('if 2 < 1 then x := 1 else x := 2 end', {'x': 2})
+        self.program_test('if 2 < 1 then x := 1 end', {})
+
+    def test_equal(self):
+        self.program_test('if 1 = 1 then x := 1 else x := 2 end', {'x': 1})
@@ -1,6 +1,7 @@
 #!/usr/bin/python3
 
 
+import pickle
 import unittest
 from imp_lexer import *
 from imp_parser import *
@@ -23,6 +24,31 @@ class TestImpParser(unittest.TestCase):
         self.parser_test('2 * 3 + 4', parser, 10)
         self.parser_test('2 + 3 * 4', parser, 14)
 
+    def test_operator_precedence(self):
+        def combine(op):
+            if op == '*':
+                return lambda l, r: int(l) * int(r)
+            else:
+                return lambda l, r: int(l) + int(r)
+        levels = [['*'], ['+']]
+        parser = operator_precedence(num, levels, combine)
+        self.parser_test('2 * 3 + 4', parser, 10)
+        self.parser_test('2 + 3 * 4', parser, 14)
+
+    def test_operator_precedence_same_as_exp(self):
+        exp_aexp = precedence(aexp_term(), aexp_precedence_levels, process_binop)
+        exp_bexp = precedence(bexp_term(), bexp_precedence_levels, process_logic)
+        for code, parser, pratt in [('a + b * c - d / e - f', exp_aexp, aexp()),
+                                    ('(a - b) * c * d + e', exp_aexp, aexp()),
+                                    ('a + b *', exp_aexp, aexp()),
+                                    ('a < 1 or b < 2 and c < 3 or d < 4', exp_bexp, bexp()),
+                                    ('a < 1 and', exp_bexp, bexp())]:
+            tokens = imp_lex(code)
+            expected = parser(tokens, 0)
+            actual = pratt(tokens, 0)
+            self.assertEqual(expected.value, actual.value)
+            self.assertEqual(expected.pos, actual.pos)
+
     def test_aexp_num(self):
         self.parser_test('12', aexp(), IntAexp(12))
 
@@ -90,6 +116,139 @@ class TestImpParser(unittest.TestCase):
 
     def test_compound_stmt(self):
         code = 'x := 1; y := 2'
-        expected = CompoundStatement(AssignStatement('x', IntAexp(1)),
-                                     AssignStatement('y', IntAexp(2)))
+        expected = BlockStatement((AssignStatement('x', IntAexp(1)),
+                                   AssignStatement('y', IntAexp(2))))
         self.parser_test(code, stmt_list(), expected)
+
+    def test_packrat_same_ast(self):
+        code = 'if ((x < 1) and (y + 2 > (3))) or not z < 4 then a := (1 + 2) * 3 else while a > 0 do a := a - 1 end end'
+        tokens = imp_lex(code)
+        self.assertEqual(imp_parse(tokens, memo=False).value, imp_parse(tokens).value)
+
+    def test_grammar_built_once(self):
+        self.assertIs(parser(), parser())
+        self.assertIs(aexp(), aexp())
+        self.assertIs(keyword('if'), keyword('if'))
+
+# The statement tests of TestImpParser, parsed through imp_parse with every backend
+class TestStatementBackends(unittest.TestCase):
+    backends = ['combinator', 'll1', 'stack']
+
+    def statement_test(self, code, expected):
+        for backend in self.backends:
+            result = imp_parse(imp_lex(code), backend=backend)
+            self.assertNotEquals(None, result, backend)
+            self.assertEquals(expected, result.value, backend)
+
+    def test_assign_stmt(self):
+        self.statement_test('x := 1', AssignStatement('x', IntAexp(1)))
+
+    def test_if_stmt(self):
+        code = 'if 1 < 2 then x := 3 else x := 4 end'
+        expected = IfStatement(RelopBexp('<', IntAexp(1), IntAexp(2)),
+                               AssignStatement('x', IntAexp(3)),
+                               AssignStatement('x', IntAexp(4)))
+        self.statement_test(code, expected)
+
+    def test_while_stmt(self):
+        code = 'while 1 < 2 do x := 3 end'
+        expected = WhileStatement(RelopBexp('<', IntAexp(1), IntAexp(2)),
+                                  AssignStatement('x', IntAexp(3)))
+        self.statement_test(code, expected)
+
+    def test_compound_stmt(self):
+        code = 'x := 1; y := 2'
+        expected = BlockStatement((AssignStatement('x', IntAexp(1)),
+                                   AssignStatement('y', IntAexp(2))))
+        self.statement_test(code, expected)
+
+    def test_if_without_else(self):
+        code = 'if 1 < 2 then x := 3; y := 4 end'
+        expected = IfStatement(RelopBexp('<', IntAexp(1), IntAexp(2)),
+                               BlockStatement((AssignStatement('x', IntAexp(3)),
+                                               AssignStatement('y', IntAexp(4)))),
+                               None)
+        self.statement_test(code, expected)
+
+    def test_block_stmt(self):
+        # A list of statements parses to one flat BlockStatement
+        expected = BlockStatement((AssignStatement('x', IntAexp(1)), AssignStatement('y', IntAexp(2)),
+                                   AssignStatement('z', IntAexp(3))))
+        self.statement_test('x := 1; y := 2; z := 3', expected)
+
+    def test_normalize(self):
+        x, y, z = [AssignStatement(name, IntAexp(1)) for name in 'xyz']
+        chain = WhileStatement(BoolBexp(True), CompoundStatement(CompoundStatement(x, y), z))
+        self.assertEquals(WhileStatement(BoolBexp(True), BlockStatement((x, y, z))), normalize(chain))
+        self.assertEquals(x, normalize(BlockStatement((x,))))
+
+class TestLL1Backend(unittest.TestCase):
+    backend = 'll1'
+    programs = [
+        'x := 1',
+        'x := 1; y := 2',
+        'if 1 < 2 then x := 3 else x := 4 end',
+        'if 1 < 2 then x := 3 end',
+        'while 1 < 2 do x := 3 end',
+        'n := 5; p := 1; while n > 0 do p := p * n; if p > 10 then n := 0 else n := n - 1 end end',
+        'if (x + 1) * 2 < 3 and not (y < 1 or (z) >= 2) then x := (1) else x := 2 - 3 - 4 end',
+    ]
+
+    def test_same_ast(self):
+        for code in self.programs:
+            tokens = imp_lex(code)
+            expected = imp_parse(tokens)
+            actual = imp_parse(tokens, backend=self.backend)
+            self.assertNotEqual(None, actual)
+            self.assertEqual(expected.value, actual.value)
+
+    def test_parse_error(self):
+        for code in ['x := 1;', 'if 1 < 2 then x := 1', 'end', '12 := x', 'x := 1 < 2', 'if x then y := 1 end',
+                     'if (x < 1) < 2 then y := 1 end', 'x := (1', 'x := 1)', 'if 1 < 2 < 3 then y := 1 end']:
+            self.assertEqual(None, imp_parse(imp_lex(code), backend=self.backend))
+
+    def test_unknown_backend(self):
+        with self.assertRaises(RuntimeError):
+            imp_parse(imp_lex('x := 1'), backend='lalr')
+
+class TestStackBackend(TestLL1Backend):
+    backend = 'stack'
+
+    def test_deep_nesting(self):
+        depth = 5000
+        code = 'while x < 1 do ' * depth + 'x := ' + '(' * depth + '1' + ')' * depth + ' end' * depth
+        result = imp_parse(imp_lex(code), backend='stack')
+        self.assertNotEqual(None, result)
+        statement = result.value
+        for i in range(depth):
+            self.assertIsInstance(statement, WhileStatement)
+            statement = statement.body
+        self.assertEqual(AssignStatement('x', IntAexp(1)), statement)
+
+class TestNodes(unittest.TestCase):
+    code = 'n := 5; while n > 0 and not n = 3 do if n < 2 then p := p * n else p := 1 end; n := n - 1 end'
+
+    def test_fields(self):
+        for node in [BinopAexp('+', VarAexp('x'), IntAexp(1)),
+                     IfStatement(BoolBexp(True), PrintStatement(IntAexp(1)), None)]:
+            self.assertFalse(hasattr(node, '__dict__'))
+            self.assertEqual(tuple(getattr(node, field) for field in node._fields), node._values())
+        self.assertEqual(('op', 'left', 'right'), RelopBexp._fields)
+
+    def test_equality_and_hash(self):
+        first = imp_parse(imp_lex(self.code)).value
+        second = imp_parse(imp_lex(self.code)).value
+        self.assertIsNot(first, second)
+        self.assertEqual(first, second)
+        self.assertEqual(hash(first), hash(second))
+        self.assertEqual(1, len(set([first, second])))
+        self.assertNotEqual(BinopAexp('+', VarAexp('x'), IntAexp(1)), BinopAexp('-', VarAexp('x'), IntAexp(1)))
+        self.assertNotEqual(AndBexp(BoolBexp(True), BoolBexp(False)), OrBexp(BoolBexp(True), BoolBexp(False)))
+
+    def test_repr(self):
+        self.assertEqual('BlockStatement (AssignStatement (x, IntAexp (1)), AssignStatement (y, VarAexp (x)))',
+                         repr(imp_parse(imp_lex('x := 1; y := x')).value))
+
+    def test_pickle(self):
+        program = imp_parse(imp_lex(self.code)).value
+        self.assertEqual(program, pickle.loads(pickle.dumps(program)))
@@ -0,0 +1,193 @@
+#!/usr/bin/python3
+import io
+import random
+import contextlib
+import unittest
+import imp_incremental
+from imp_lexer import *
+from imp_parser import *
+from imp_incremental import *
+from test_optimize import RandomPrograms
+
+def full_parse(source):
+    result = imp_parse(imp_lex(source))
+    return result.value if result else None
+
+def lexes(source):
+    # Whether imp_lex takes source, which it reports by exiting if not
+    try:
+        with contextlib.redirect_stderr(io.StringIO()):
+            imp_lex(source)
+    except SystemExit:
+        return False
+    return True
+
+# Pieces of text that random edits insert, besides text copied from elsewhere in the program
+fragments = [';', '; ', ' end', 'end; ', 'while x < 1 do ', 'if y > 2 then ', ' else ', 'x := 1', ' + 2', '(', ')',
+             ' ', '\n', '# a comment; with a ;\n', '#', 'z', '7', ':=']
+
+class TestIncremental(unittest.TestCase):
+    def setUp(self):
+        # Small chunks, so that edits run across several of them
+        self.chunk_size = imp_incremental.chunk_size
+        imp_incremental.chunk_size = 4
+
+    def tearDown(self):
+        imp_incremental.chunk_size = self.chunk_size
+
+    def check(self, parsed):
+        if lexes(parsed.source):
+            self.assertEquals(full_parse(parsed.source), parsed.ast, parsed.source)
+            self.assertEquals(imp_lex(parsed.source), parsed.tokens)
+        else:
+            self.assertEquals(None, parsed.ast)
+        self.assertEquals([sum(segment.length for segment in chunk) for chunk in parsed.chunks], parsed.lengths)
+        self.assertEquals(len(parsed.source), sum(parsed.lengths))
+        self.assertTrue(all(parsed.chunks))
+
+    def random_edit(self, rand, parsed):
+        source = parsed.source
+        offset = rand.randint(0, len(source))
+        removed = min(rand.choice([0, 0, 1, 2, 5, 20]), len(source) - offset)
+        if rand.random() < 0.5:
+            inserted = rand.choice(fragments)
+        else:
+            start = rand.randint(0, len(source))
+            inserted = source[start:start + rand.randint(0, 40)]
+        return reparse(parsed, offset, removed, inserted)
+
+    def test_parse_source(self):
+        for seed in range(50):
+            self.check(parse_source(RandomPrograms(seed).statements(3)))
+
+    def test_random_edits(self):
+        for seed in range(20):
+            rand = random.Random(seed)
+            parsed = parse_source('\n'.join(RandomPrograms(seed).statements(2) + ';' for i in range(10)) + ' x := 0')
+            for i in range(100):
+                parsed = self.random_edit(rand, parsed)
+                self.check(parsed)
+
+    def test_unchanged_statements_reused(self):
+        source = '; '.join('x%d := %d' % (i, i) for i in range(20))
+        parsed = parse_source(source)
+        offset = source.index('x7 := 7') + len('x7 := ')
+        edited = reparse(parsed, offset, 1, '(y + 1)')
+        self.check(edited)
+        for i, (before, after) in enumerate(zip(parsed.ast.statements, edited.ast.statements)):
+            if i == 7:
+                self.assertEquals(AssignStatement('x7', BinopAexp('+', VarAexp('y'), IntAexp(1))), after)
+            else:
+                self.assertTrue(before is after)
+        self.assertTrue(parsed.chunks[0] is edited.chunks[0])
+        # The previous result is left as it was
+        self.assertEquals(full_parse(source), parsed.ast)
+
+    def test_edit_relexes_only_its_statements(self):
+        parsed = parse_source('; '.join('x%d := %d' % (i, i) for i in range(100)))
+        lexed = []
+        lex_segments = imp_incremental.lex_segments
+        def counting_lex_segments(source, pos, stop=None):
+            for segment in lex_segments(source, pos, stop):
+                lexed.append(segment)
+                yield segment
+        imp_incremental.lex_segments = counting_lex_segments
+        try:
+            # Joins two statements into one, which fails, then splits them again
+            offset = parsed.source.index('; x51')
+            joined = reparse(parsed, offset, 1, ' +')
+            self.assertEquals(1, len(lexed))
+            self.check(joined)
+            self.check(reparse(joined, offset, 2, ';'))
+            self.assertEquals(3, len(lexed))
+        finally:
+            imp_incremental.lex_segments = lex_segments
+
+    def test_open_block(self):
+        # A while without its end leaves a segment that is not balanced, and the program has no AST until the end is
+        # put back
+        source = 'x := 1; while x < 3 do x := x + 1 end; y := x; z := y'
+        parsed = parse_source(source)
+        offset = source.index(' end')
+        opened = reparse(parsed, offset, 4, '')
+        self.check(opened)
+        self.assertEquals(None, opened.ast)
+        self.assertEquals(1, opened.unbalanced)
+        # Closed at the end instead, the while takes in the statements after it
+        closed = reparse(opened, len(opened.source), 0, ' end')
+        self.check(closed)
+        self.assertEquals(2, len(closed.ast.statements))
+        self.check(reparse(opened, offset, 0, ' end'))
+        self.assertEquals(full_parse(source), reparse(opened, offset, 0, ' end').ast)
+
+    def test_blocks_across_segments(self):
+        # Each edit leaves a block open or closes one in a segment of its own; together they make a valid program
+        source = 'a := 1; b := 2; c := 3; d := 4; e := 5'
+        parsed = parse_source(source)
+        lexed = []
+        lex_segments = imp_incremental.lex_segments
+        def counting_lex_segments(source, pos, stop=None):
+            for segment in lex_segments(source, pos, stop):
+                lexed.append(segment)
+                yield segment
+        imp_incremental.lex_segments = counting_lex_segments
+        try:
+            for text, inserted in [('e := 5', ' end'), ('d := 4', ' end'), ('c := 3', 'if c > 1 then '),
+                                   ('a := 1', 'while a < 2 do ')]:
+                offset = parsed.source.index(text) + (len(text) if inserted.startswith(' end') else 0)
+                parsed = reparse(parsed, offset, 0, inserted)
+                self.check(parsed)
+            self.assertEquals(4, len(lexed))
+        finally:
+            imp_incremental.lex_segments = lex_segments
+        self.assertEquals(5, len(parsed.segments))
+        self.assertEquals(WhileStatement, parsed.ast.__class__)
+        self.assertEquals('while a < 2 do a := 1; b := 2; if c > 1 then c := 3; d := 4 end; e := 5 end',
+                          parsed.source)
+
+    def test_stray_end(self):
+        parsed = reparse(parse_source('x := 1; y := 2; z := 3'), 6, 0, ' end')
+        self.check(parsed)
+        self.assertEquals(None, parsed.ast)
+        self.check(reparse(parsed, 6, 4, ''))
+
+    def test_errors_recover(self):
+        parsed = parse_source('x := 1; y := 2')
+        broken = reparse(parsed, 12, 2, '')
+        self.assertEquals(None, broken.ast)
+        self.assertEquals(1, broken.errors)
+        fixed = reparse(broken, 12, 0, '3')
+        self.check(fixed)
+        self.assertEquals(0, fixed.errors)
+
+    def test_illegal_character(self):
+        parsed = reparse(parse_source('x := 1; y := 2'), 13, 0, '$')
+        self.assertEquals(None, parsed.ast)
+        self.assertEquals(imp_lex('x := 1; y := 2'), parsed.tokens)
+        self.check(parsed)
+        self.check(reparse(parsed, 13, 1, ''))
+
+    def test_comments_and_semicolons(self):
+        source = 'x := 1; # y := 2; z := 3;\nz := 4;\n'
+        parsed = parse_source(source)
+        self.check(parsed)
+        # A trailing ; does not parse
+        self.assertEquals(None, parsed.ast)
+        # Taking out the # makes the ; in the comment a cut
+        parsed = reparse(parsed, source.index('#'), 1, '')
+        self.check(reparse(parsed, len(parsed.source) - 2, 2, ''))
+        self.assertEquals(4, len(reparse(parsed, len(parsed.source) - 2, 2, '').ast.statements))
+
+    def test_empty(self):
+        parsed = parse_source('')
+        self.assertEquals(None, parsed.ast)
+        self.assertEquals([], parsed.tokens)
+        parsed = reparse(parsed, 0, 0, 'x := 1')
+        self.check(parsed)
+        self.check(reparse(parsed, 0, 6, ''))
+
+    def test_edit_out_of_range(self):
+        parsed = parse_source('x := 1')
+        for offset, removed in [(-1, 0), (7, 0), (3, 4)]:
+            with self.assertRaises(RuntimeError):
+                reparse(parsed, offset, removed, '')
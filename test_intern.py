@@ -0,0 +1,74 @@
+#!/usr/bin/python3
+import pickle
+import unittest
+import imp
+from imp_lexer import *
+from imp_parser import *
+from imp_intern import *
+from test_vm import EngineTests
+from test_optimize import RandomPrograms, run_program
+
+def parse(code, backend='combinator'):
+    return imp_parse(imp_lex(code), backend=backend).value
+
+class TestIntern(EngineTests, unittest.TestCase):
+    def execute(self, ast, env):
+        intern_tree(ast).eval(env)
+
+    def test_sharing(self):
+        factory = NodeFactory()
+        program = factory.intern(parse('x := y + 1; z := y + 1; x := y + 1'))
+        first, second, third = program.statements
+        self.assertIs(first.aexp, second.aexp)
+        self.assertIs(first, third)
+        self.assertIs(first.name, third.name)
+        # x := y + 1, z := y + 1, y + 1, y, 1 and the block
+        self.assertEqual(6, len(factory))
+
+    def test_node(self):
+        factory = NodeFactory()
+        one = factory.node(IntAexp, 1)
+        self.assertIs(one, factory.node(IntAexp, 1))
+        self.assertIsNot(one, factory.node(IntAexp, 1.0))
+        self.assertIs(factory.node(AssignStatement, 'x', one), factory.intern(AssignStatement('x', IntAexp(1))))
+        self.assertTrue(isinstance(one, IntAexp))
+        self.assertEqual('IntAexp (1)', repr(one))
+
+    def test_identity(self):
+        # Parsed twice and interned through one factory, a program is one object
+        factory = NodeFactory()
+        code = 'n := 5; p := 1; while n > 0 do p := p * n; n := n - 1 end'
+        self.assertIs(factory.intern(parse(code)), factory.intern(parse(code)))
+
+    def test_equality(self):
+        code = 'if x < 1 and not y = 2 then x := (x + 1) * 2 else while x > 0 do x := x - 1 end end'
+        plain = parse(code)
+        interned = intern_tree(plain)
+        self.assertEqual(plain, interned)
+        self.assertEqual(interned, plain)
+        self.assertEqual(hash(plain), hash(interned))
+        self.assertEqual(interned, intern_tree(plain))
+        self.assertNotEqual(interned, intern_tree(parse(code.replace('2', '3'))))
+        self.assertEqual({interned: 1}, {plain: 1})
+
+    def test_pickle(self):
+        program = intern_tree(parse('x := 1; while x < 10 do x := x + 1 end'))
+        loaded = pickle.loads(pickle.dumps(program))
+        self.assertEqual(program, loaded)
+        self.assertFalse(isinstance(loaded, Interned))
+
+    def test_deep_tree(self):
+        depth = 5000
+        code = 'while x < 1 do ' * depth + 'x := 1' + ' end' * depth
+        program = intern_tree(parse(code, backend='stack'))
+        for i in range(depth):
+            program = program.body
+        self.assertEqual(AssignStatement('x', IntAexp(1)), program)
+
+    def test_same_environment(self):
+        for seed in range(100):
+            code = RandomPrograms(seed).statements(3)
+            program = parse(code)
+            expected = run_program(program)
+            for name, engine in sorted(imp.engines.items()):
+                self.assertEqual(expected, run_program(intern_tree(program), engine), '%s: %s' % (name, code))
@@ -1,6 +1,8 @@
 #!/usr/bin/python3
 
+import io
 import unittest
+import imp_lexer
 from lexer import *
 
 KEYWORD = 'KEYWORD'
@@ -34,6 +36,78 @@ class TestLexer(unittest.TestCase):
     def test_id_space(self):
         self.lexer_test('abc def', [('abc', ID), ('def', ID)])
 
+    def test_first_expression_wins(self):
+        self.lexer_test('keywords', [('keyword', KEYWORD), ('s', ID)])
+
+    def test_comment(self):
+        self.lexer_test('abc # def\n12', [('abc', ID), ('12', INT)])
+
+    def test_illegal_character(self):
+        with self.assertRaises(SystemExit):
+            lex('abc $ def', token_exprs)
+
+class TestImpLexer(unittest.TestCase):
+    def test_keywords(self):
+        tokens = imp_lexer.imp_lex('if x then y else z end')
+        self.assertEqual([('if', imp_lexer.RESERVED), ('x', imp_lexer.ID),
+                          ('then', imp_lexer.RESERVED), ('y', imp_lexer.ID),
+                          ('else', imp_lexer.RESERVED), ('z', imp_lexer.ID),
+                          ('end', imp_lexer.RESERVED)], tokens)
+
+    def test_keyword_prefix_is_identifier(self):
+        tokens = imp_lexer.imp_lex('endx order do_it notify')
+        self.assertEqual([('endx', imp_lexer.ID), ('order', imp_lexer.ID),
+                          ('do_it', imp_lexer.ID), ('notify', imp_lexer.ID)], tokens)
+
+    def test_keyword_lookup_in_stream_and_buffer(self):
+        code = 'while endx do order := 1 end'
+        expected = imp_lexer.imp_lex(code)
+        self.assertEqual(expected, list(imp_lexer.imp_lex_stream(io.StringIO(code), 3)))
+        self.assertEqual(expected, list(imp_lexer.imp_lex_buffer(code)))
+
+class TestLexStream(unittest.TestCase):
+    code = 'n := 5; # count down\nwhile n >= 1 do\n  total_sum := total_sum + n;\n  n := n - 1\nend'
+
+    def test_same_as_lex(self):
+        expected = imp_lexer.imp_lex(self.code)
+        for chunk_size in [1, 2, 3, 5, 8, 13, 1024]:
+            actual = list(imp_lexer.imp_lex_stream(io.StringIO(self.code), chunk_size))
+            self.assertEqual(expected, actual)
+
+    def test_empty(self):
+        self.assertEqual([], list(lex_stream(io.StringIO(''), token_exprs, 4)))
+
+    def test_illegal_character(self):
+        with self.assertRaises(SystemExit):
+            list(lex_stream(io.StringIO('abc $ def'), token_exprs, 2))
+
+    def test_illegal_character_reported_early(self):
+        # The rest of the file is not read once the illegal character is followed by enough input
+        source = io.StringIO('abc $ ' + 'def ' * 10000)
+        with self.assertRaises(SystemExit):
+            list(lex_stream(source, token_exprs, 64))
+        self.assertTrue(source.tell() <= 128)
+
+class TestTokenBuffer(unittest.TestCase):
+    code = TestLexStream.code
+
+    def test_same_as_lex(self):
+        tokens = imp_lexer.imp_lex_buffer(self.code)
+        expected = imp_lexer.imp_lex(self.code)
+        self.assertEqual(len(expected), len(tokens))
+        self.assertEqual(expected, list(tokens))
+        self.assertEqual(expected[-1], tokens[-1])
+
+    def test_keywords_shared(self):
+        tokens = imp_lexer.imp_lex_buffer('x := 1; y := 2')
+        self.assertIs(tokens[1], tokens[5])
+        self.assertIs(imp_lexer.ID, tokens[0][1])
+
+    def test_index_error(self):
+        tokens = lex_buffer('abc', token_exprs)
+        with self.assertRaises(IndexError):
+            tokens[1]
+
 
 '''
 The unittest module provides a rich set of tools for constructing and running tests. 
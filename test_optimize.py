@@ -0,0 +1,254 @@
+#!/usr/bin/python3
+import io
+import random
+import unittest
+import contextlib
+import imp
+from imp_lexer import *
+from imp_parser import *
+from imp_optimize import *
+
+def parse(code):
+    return imp_parse(imp_lex(code)).value
+
+def run_program(ast, run=lambda ast, env: ast.eval(env)):
+    # Final environment, and the exception the program stopped with if any
+    env = {}
+    error = None
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            run(ast, env)
+        except ZeroDivisionError as e:
+            error = type(e)
+    return env, error
+
+def literal(value):
+    # IMP has no negative literals
+    return str(value) if value >= 0 else '0 - %d' % -value
+
+class RandomPrograms:
+    # Small random programs over a few variables, with constants that invite folding and loops that always end.
+    # Expressions inside a loop also read its counter, so the loop passes find induction variables.
+    def __init__(self, seed, divide=True):
+        self.random = random.Random(seed)
+        self.loops = 0
+        self.counters = []
+        self.operators = ['+', '-', '*', '*', '+', '/'] if divide else ['+', '-', '*', '*', '+']
+
+    def aexp(self, depth):
+        choice = self.random.random()
+        if depth == 0 or choice < 0.3:
+            if self.random.random() < 0.5:
+                return str(self.random.choice([0, 1, 2, 3, 7]))
+            return self.random.choice(['x', 'y', 'z'] + self.counters)
+        op = self.random.choice(self.operators)
+        return '(%s %s %s)' % (self.aexp(depth - 1), op, self.aexp(depth - 1))
+
+    def bexp(self, depth):
+        choice = self.random.random()
+        if depth == 0 or choice < 0.4:
+            op = self.random.choice(['<', '<=', '>', '>=', '=', '!='])
+            return '%s %s %s' % (self.aexp(2), op, self.aexp(2))
+        if choice < 0.6:
+            return 'not (%s)' % self.bexp(depth - 1)
+        op = self.random.choice(['and', 'or'])
+        return '(%s) %s (%s)' % (self.bexp(depth - 1), op, self.bexp(depth - 1))
+
+    def statement(self, depth):
+        choice = self.random.random()
+        if depth == 0 or choice < 0.5:
+            return '%s := %s' % (self.random.choice(['x', 'y', 'z']), self.aexp(3))
+        if choice < 0.8:
+            code = 'if %s then %s' % (self.bexp(2), self.statements(depth - 1))
+            if self.random.random() < 0.5:
+                code += ' else %s' % self.statements(depth - 1)
+            return code + ' end'
+        self.loops += 1
+        counter = 'i%d' % self.loops
+        self.counters.append(counter)
+        code = '%s := 0; while %s < 3 and (%s) do %s; %s := %s + 1 end' % (
+            counter, counter, self.bexp(1), self.statements(depth - 1), counter, counter)
+        self.counters.pop()
+        return code
+
+    def statements(self, depth):
+        return '; '.join(self.statement(depth) for i in range(self.random.randint(1, 3)))
+
+# Loops close_counting_loops replaces, run after i := <start>; n := <bound>
+counting_loops = [
+    'while i < n do i := i + 1 end',
+    'while i < n do s := s + 3; i := i + 1 end',
+    'while i <= n do s := s - 2 * n; i := i + 1; t := t + s0 end',
+    'while n > i do i := i + 1; s := s + (n - 7); p := n * 4 end',
+    'while i > n do s := s + 5; i := i - 1 end',
+    'while i >= n - 2 do i := i - 1; s := s - 1 end',
+    's := 1; while i < n * 2 do s := s + n; i := i + 1 end; s := s * 2',
+    'while i < n do i := i + 1 end; while i < n + 3 do s := s + 2; i := i + 1 end',
+]
+
+# Loops that look like counting loops but are not
+not_counting_loops = [
+    'i := 0; n := 10; while i < n do s := s + i; i := i + 1 end',
+    'i := 0; n := 10; while i < n do i := i + 2 end',
+    'i := 0; n := 10; while i < n do i := i + 1; n := n - 1 end',
+    'i := 0; n := 10; while i < n do s := s * 2; i := i + 1 end',
+    'i := 0; n := 10; while i < n do s := s + 1; s := s + 1; i := i + 1 end',
+    'i := 0; n := 10; while i < n do i := i + 1; if i > 3 then s := 1 end end',
+    'i := 0; n := 10; while i < n do i := i + 1; s := i end',
+    'i := 0; n := 10; while i < n and s < 5 do s := s + 1; i := i + 1 end',
+    'i := 0; n := 10; while i != n do i := i + 1 end',
+    'i := 0; n := 10; while i < n do s := s + 1; i := i + 1 end; x := n / 2',
+    'i := 10; n := 0; while i < n do i := i - 1 end',
+]
+
+class TestOptimize(unittest.TestCase):
+    def optimize_test(self, code, expected):
+        self.assertEquals(normalize(expected), normalize(optimize(parse(code))))
+
+    def test_fold_constants(self):
+        self.optimize_test('x := (2 * 3) + x * 1', AssignStatement('x', BinopAexp('+', IntAexp(6), VarAexp('x'))))
+        self.optimize_test('x := 2 - 3 * 4 + y', AssignStatement('x', BinopAexp('+', IntAexp(-10), VarAexp('y'))))
+
+    def test_division_not_folded(self):
+        self.optimize_test('x := 6 / 3', AssignStatement('x', BinopAexp('/', IntAexp(6), IntAexp(3))))
+        self.optimize_test('x := y / 1', AssignStatement('x', BinopAexp('/', VarAexp('y'), IntAexp(1))))
+
+    def test_identities(self):
+        self.optimize_test('x := 0 + (y - 0) * 1 + 1 * (z + 0)',
+                           AssignStatement('x', BinopAexp('+', VarAexp('y'), VarAexp('z'))))
+        self.optimize_test('x := y * 0', AssignStatement('x', BinopAexp('*', VarAexp('y'), IntAexp(0))))
+
+    def test_not_not(self):
+        self.optimize_test('if not not x < 1 then y := 1 end',
+                           IfStatement(RelopBexp('<', VarAexp('x'), IntAexp(1)), AssignStatement('y', IntAexp(1)), None))
+
+    def test_constant_logic(self):
+        self.optimize_test('if 1 < 2 and x < 1 then y := 1 end',
+                           IfStatement(RelopBexp('<', VarAexp('x'), IntAexp(1)), AssignStatement('y', IntAexp(1)), None))
+        self.optimize_test('if x < 1 or not 1 > 2 then y := 1 end', AssignStatement('y', IntAexp(1)))
+
+    def test_division_kept_in_logic(self):
+        # eval evaluates both sides, so x / 0 must still raise
+        code = 'if 1 > 2 and x / 0 < 1 then y := 1 end'
+        optimized = optimize(parse(code))
+        self.assertEquals(run_program(parse(code)), run_program(optimized))
+        self.assertEquals(ZeroDivisionError, run_program(optimized)[1])
+
+    def test_dead_branches(self):
+        self.optimize_test('if not (1 < 2) then x := 1 else x := 2 end', AssignStatement('x', IntAexp(2)))
+        self.optimize_test('x := 1; if 2 < 1 then x := 2 end; y := 3',
+                           CompoundStatement(AssignStatement('x', IntAexp(1)), AssignStatement('y', IntAexp(3))))
+        self.optimize_test('x := 1; while 2 < 1 do x := 2 end', AssignStatement('x', IntAexp(1)))
+        self.optimize_test('if x < 1 then if 1 > 2 then y := 1 end else y := 2 end',
+                           IfStatement(NotBexp(RelopBexp('<', VarAexp('x'), IntAexp(1))),
+                                       AssignStatement('y', IntAexp(2)), None))
+
+    def test_everything_removed(self):
+        program = optimize(parse('if 1 > 2 then x := 1 end'))
+        self.assertEquals(({}, None), run_program(program))
+
+    def test_same_environment(self):
+        # Optimized programs leave the same environment as the originals, under every engine
+        for seed in range(300):
+            code = RandomPrograms(seed).statements(3)
+            program = parse(code)
+            optimized = optimize(program)
+            expected = run_program(program)
+            for name, engine in sorted(imp.engines.items()):
+                env, error = run_program(optimized, engine)
+                self.assertEquals(expected, (strip_temporaries(env), error), '%s: %s' % (name, code))
+
+    def test_loop_passes_same_environment(self):
+        # Without division, so that reduce_strength runs too
+        reduced = 0
+        for seed in range(300):
+            code = RandomPrograms(seed, divide=False).statements(3)
+            program = parse(code)
+            optimized = optimize(program)
+            reduced += repr(optimized) != repr(optimize(program, expression_passes + [hoist_invariants]))
+            expected = run_program(program)
+            for name, engine in sorted(imp.engines.items()):
+                env, error = run_program(optimized, engine)
+                self.assertEquals(expected, (strip_temporaries(env), error), '%s: %s' % (name, code))
+        self.assertTrue(reduced > 0)
+
+    def test_hoist_invariants(self):
+        self.optimize_test('while i < n * 2 do x := x + a * b + i; i := i + 1 end',
+                           CompoundStatement(
+                               CompoundStatement(AssignStatement('$0', BinopAexp('*', VarAexp('n'), IntAexp(2))),
+                                                 AssignStatement('$1', BinopAexp('*', VarAexp('a'), VarAexp('b')))),
+                               WhileStatement(RelopBexp('<', VarAexp('i'), VarAexp('$0')),
+                                              CompoundStatement(
+                                                  AssignStatement('x', BinopAexp('+', BinopAexp('+', VarAexp('x'),
+                                                                                    VarAexp('$1')), VarAexp('i'))),
+                                                  AssignStatement('i', BinopAexp('+', VarAexp('i'), IntAexp(1)))))))
+
+    def test_hoist_once(self):
+        # The same expression twice gets one temporary, and expressions reading a variable the loop writes stay
+        program = optimize(parse('while i < 3 do x := a * b + i; y := a * b; i := i + 1 end'))
+        self.assertEquals(AssignStatement('$0', BinopAexp('*', VarAexp('a'), VarAexp('b'))), program.statements[0])
+        program = optimize(parse('while i < 3 do x := a * b + i; a := a + 1; i := i + 1 end'))
+        self.assertTrue(isinstance(program, WhileStatement))
+
+    def test_division_not_hoisted(self):
+        # The loop does not run, so 1 / x must not either
+        code = 'while 1 < x do y := 1 / x end'
+        self.assertEquals(parse(code), optimize(parse(code)))
+
+    def test_hoist_nested_loops(self):
+        code = 'i := 0; while i < 4 do j := 0; while j < 3 do s := s + i * n + m * 5; j := j + 1 end; i := i + 1 end'
+        self.assertEquals(run_program(parse(code)), (strip_temporaries(run_program(optimize(parse(code)))[0]), None))
+        # m * 5 leaves both loops, i * n only the inner one
+        outer = normalize(optimize(parse(code))).statements
+        self.assertEquals(AssignStatement('$2', BinopAexp('*', VarAexp('m'), IntAexp(5))), outer[1])
+        self.assertEquals(AssignStatement('$0', BinopAexp('*', VarAexp('i'), VarAexp('n'))),
+                          outer[2].body.statements[1])
+
+    def test_reduce_strength(self):
+        self.optimize_test('while i < 10 do x := x + i * 3; y := y + 3 * i; i := i + 2 end',
+                           CompoundStatement(
+                               AssignStatement('$0', BinopAexp('*', VarAexp('i'), IntAexp(3))),
+                               WhileStatement(RelopBexp('<', VarAexp('i'), IntAexp(10)), CompoundStatement(
+                                   CompoundStatement(CompoundStatement(
+                                       AssignStatement('x', BinopAexp('+', VarAexp('x'), VarAexp('$0'))),
+                                       AssignStatement('y', BinopAexp('+', VarAexp('y'), VarAexp('$0')))),
+                                       AssignStatement('i', BinopAexp('+', VarAexp('i'), IntAexp(2)))),
+                                   AssignStatement('$0', BinopAexp('+', VarAexp('$0'), IntAexp(6)))))))
+
+    def test_strength_not_reduced(self):
+        # A single use, an induction variable assigned twice, and a program that divides are all left alone
+        for code in ['while i < 10 do x := x + i * 3; i := i + 1 end',
+                     'while i < 10 do x := x + i * 3 + i * 3; i := i + 1; if x > 5 then i := i + 1 end end',
+                     'while i < 10 do x := x + i * 3 + i * 3; i := i + 1 end; y := x / 2']:
+            self.assertEquals(parse(code), optimize(parse(code)))
+
+    def test_close_counting_loop(self):
+        self.optimize_test('while i < n do s := s + 3; i := i + 1 end',
+                           IfStatement(RelopBexp('<', VarAexp('i'), VarAexp('n')), CompoundStatement(
+                               AssignStatement('s', BinopAexp('+', VarAexp('s'), BinopAexp('*', IntAexp(3),
+                                   BinopAexp('-', VarAexp('n'), VarAexp('i'))))),
+                               AssignStatement('i', VarAexp('n'))), None))
+
+    def test_counting_loops_closed(self):
+        # Every loop in counting_loops is rewritten, and leaves the same environment for every start and bound
+        for code in counting_loops:
+            program = parse(code)
+            optimized = optimize(program)
+            self.assertFalse('While' in repr(optimized), code)
+            for start, bound in [(0, 10), (3, 3), (7, 2), (-5, 4), (12, -3), (0, 0)]:
+                prefix = 'i := %s; n := %s; ' % (literal(start), literal(bound))
+                expected = run_program(parse(prefix + code))
+                for name, engine in sorted(imp.engines.items()):
+                    env, error = run_program(optimize(parse(prefix + code)), engine)
+                    self.assertEquals(expected, (strip_temporaries(env), error), '%s: %s%s' % (name, prefix, code))
+
+    def test_counting_loops_kept(self):
+        for code in not_counting_loops:
+            program = parse(code)
+            self.assertTrue('While' in repr(optimize(program)), code)
+            for name, engine in sorted(imp.engines.items()):
+                env, error = run_program(optimize(program), engine)
+                self.assertEquals(run_program(program), (strip_temporaries(env), error), '%s: %s' % (name, code))
+
+    def test_strip_temporaries(self):
+        self.assertEquals({'x': 1}, strip_temporaries({'x': 1, '$0': 2, '$12': 3}))
@@ -0,0 +1,54 @@
+#!/usr/bin/python3
+import unittest
+import concurrent.futures
+from imp_lexer import *
+from imp_parser import *
+from imp_parallel_parser import *
+from bench_parser import statement_program
+
+class TestParallelParser(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.executor = concurrent.futures.ProcessPoolExecutor(max_workers=2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.executor.shutdown()
+
+    def parallel_test(self, code, workers=2):
+        for tokens in [imp_lex(code), imp_lex_buffer(code)]:
+            expected = imp_parse(tokens)
+            result = imp_parse_parallel(tokens, workers, executor=self.executor)
+            if not expected:
+                self.assertEquals(None, result, code)
+            else:
+                self.assertEquals(len(tokens), result.pos)
+                self.assertEquals(expected.value, result.value, code)
+
+    def test_split_statements(self):
+        code = 'x := 1; while x > 0 do x := x - 1; if x < 2 then y := 1; z := 2 end end; y := 2'
+        for tokens in [imp_lex(code), imp_lex_buffer(code)]:
+            self.assertEquals([3, 29], split_statements(tokens))
+        for code in ['x := 1; end', 'while x > 0 do x := 1']:
+            self.assertEquals(None, split_statements(imp_lex(code)))
+
+    def test_chunk_bounds(self):
+        tokens = imp_lex('a := 1; b := 2; c := 3; d := 4')
+        self.assertEquals([(0, 11), (12, 15)], chunk_bounds(tokens, [3, 7, 11], 2))
+        self.assertEquals([(0, 7), (8, 15)], chunk_bounds(tokens, [3, 7, 11], 3))
+        self.assertEquals([(0, 15)], chunk_bounds(tokens, [3, 7, 11], 1))
+
+    def test_same_as_serial(self):
+        for count in [1, 2, 7, 100, 1000]:
+            self.parallel_test(statement_program(count))
+            self.parallel_test(statement_program(count), workers=5)
+
+    def test_errors(self):
+        for code in ['', 'x := 1;', 'x := 1;; y := 2', 'x := 1; y := ; z := 3', 'x := 1; end; y := 2',
+                     'x := 1; while x > 0 do y := 1; z := 2']:
+            self.parallel_test(code)
+
+    def test_long_program(self):
+        code = statement_program(20000)
+        result = imp_parse_parallel(imp_lex_buffer(code), 2, executor=self.executor)
+        self.assertEquals(imp_parse(imp_lex_buffer(code)).value, result.value)
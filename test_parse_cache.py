@@ -0,0 +1,118 @@
+#!/usr/bin/python3
+import os
+import shutil
+import tempfile
+import unittest
+import imp
+import imp_parse_cache
+from imp_lexer import *
+from imp_parser import *
+
+class TestParseCache(unittest.TestCase):
+    source = 'n := 5; p := 1; while n > 0 do p := p * n; n := n - 1 end'
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.parsed = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def parse(self, source):
+        # imp_parse_cache.parse_serial, counting the parses
+        self.parsed.append(source)
+        return imp_parse_cache.parse_serial(source)
+
+    def load(self, source, **options):
+        return imp_parse_cache.load(source, self.parse, self.directory, **options)
+
+    def cached_files(self):
+        return sorted(name for name in os.listdir(self.directory) if name.endswith(imp_parse_cache.cache_suffix))
+
+    def test_cached(self):
+        expected = imp_parse(imp_lex(self.source)).value
+        self.assertEquals(expected, self.load(self.source))
+        self.assertEquals([imp_parse_cache.cache_key(self.source) + '.ast'], self.cached_files())
+        # The second load reads the cache and does not parse
+        self.assertEquals(expected, self.load(self.source))
+        self.assertEquals([self.source], self.parsed)
+
+    def test_changed_source(self):
+        self.load(self.source)
+        changed = self.source.replace('5', '3')
+        self.assertEquals(imp_parse(imp_lex(changed)).value, self.load(changed))
+        self.assertEquals(2, len(self.cached_files()))
+
+    def test_grammar_version(self):
+        key = imp_parse_cache.cache_key(self.source)
+        version = imp_parse_cache.grammar_version
+        imp_parse_cache.grammar_version = version + '.1'
+        try:
+            self.assertNotEquals(key, imp_parse_cache.cache_key(self.source))
+        finally:
+            imp_parse_cache.grammar_version = version
+
+    def test_no_cache(self):
+        self.load(self.source, use_disk=False)
+        self.load(self.source, use_disk=False)
+        self.assertEquals(2, len(self.parsed))
+        self.assertEquals([], os.listdir(self.directory))
+
+    def test_parse_error(self):
+        self.assertEquals(None, self.load('x := '))
+        self.assertEquals([], self.cached_files())
+
+    def test_corrupt_cache_file(self):
+        for data in [b'', b'\x00garbage', b'IMPA\x01\x02']:
+            with open(os.path.join(self.directory, imp_parse_cache.cache_key(self.source) + '.ast'), 'wb') as file:
+                file.write(data)
+            self.assertEquals(imp_parse(imp_lex(self.source)).value, self.load(self.source))
+        self.assertEquals(3, len(self.parsed))
+
+    def test_deep_program(self):
+        depth = 5000
+        code = 'while x < 1 do ' * depth + 'x := 1' + ' end' * depth
+        parse = lambda source: imp_parse(imp_lex(source), backend='stack')
+        imp_parse_cache.load(code, parse, self.directory)
+        self.assertEquals(1, len(self.cached_files()))
+        program = imp_parse_cache.load(code, self.parse, self.directory)
+        self.assertEquals([], self.parsed)
+        for i in range(depth):
+            program = program.body
+        self.assertEquals(AssignStatement('x', IntAexp(1)), program)
+
+    def test_least_recently_used_evicted(self):
+        sources = ['x := %d' % i for i in range(4)]
+        for i, source in enumerate(sources):
+            self.load(source)
+            # Spread the modification times, which is what the files are ordered by
+            path = os.path.join(self.directory, imp_parse_cache.cache_key(source) + '.ast')
+            os.utime(path, ns=(i * 10 ** 9, i * 10 ** 9))
+        # Reading the oldest makes it the most recently used
+        self.load(sources[0])
+        size = os.path.getsize(os.path.join(self.directory, self.cached_files()[0]))
+        imp_parse_cache.evict(self.directory, size * 2)
+        kept = [imp_parse_cache.cache_key(source) + '.ast' for source in [sources[0], sources[3]]]
+        self.assertEquals(sorted(kept), self.cached_files())
+        self.assertEquals(4, len(self.parsed))
+
+    def test_size_bound(self):
+        for i in range(10):
+            self.load('x := %d' % i, size=200)
+        total = sum(os.path.getsize(os.path.join(self.directory, name)) for name in self.cached_files())
+        self.assertTrue(0 < total <= 200)
+
+    def test_run_text(self):
+        cache_dir = os.environ.get('IMP_CACHE_DIR')
+        os.environ['IMP_CACHE_DIR'] = self.directory
+        try:
+            for use_cache in [False, True, True]:
+                env = {}
+                self.assertTrue(imp.run_text(self.source, env, use_cache=use_cache))
+                self.assertEquals({'n': 0, 'p': 120}, env)
+            self.assertEquals(1, len(os.listdir(os.path.join(self.directory, 'ast'))))
+        finally:
+            if cache_dir is None:
+                del os.environ['IMP_CACHE_DIR']
+            else:
+                os.environ['IMP_CACHE_DIR'] = cache_dir
@@ -0,0 +1,95 @@
+#!/usr/bin/python3
+import io
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import imp
+
+programs = {
+    'factorial.imp': 'n := 5; p := 1; while n > 0 do p := p * n; n := n - 1 end',
+    'division.imp': 'x := 1; y := x / 0',
+    'syntax.imp': 'x := ',
+    'loop.imp': 'x := 0; while 1 < 2 do x := x + 1 end',
+    'nested/copy.imp': 'x := 3; y := x',
+    'notes.txt': 'not a program',
+}
+
+overflow = 'x := 10; i := 0; while i < 400 do x := x * 10; i := i + 1 end; y := x / 3'
+
+class Unpicklable(str):
+    # A filename that cannot be sent to a worker process
+    def __reduce__(self):
+        raise TypeError('cannot pickle this filename')
+
+class TestRunBatch(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        # Keeps the python engine's code cache out of the home directory; workers inherit the environment
+        self.cache_dir = os.environ.get('IMP_CACHE_DIR')
+        os.environ['IMP_CACHE_DIR'] = os.path.join(self.directory, 'cache')
+        for name, code in programs.items():
+            os.makedirs(os.path.dirname(os.path.join(self.directory, name)), exist_ok=True)
+            with open(os.path.join(self.directory, name), 'w') as file:
+                file.write(code)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        if self.cache_dir is None:
+            del os.environ['IMP_CACHE_DIR']
+        else:
+            os.environ['IMP_CACHE_DIR'] = self.cache_dir
+
+    def run_batch(self, filenames, **options):
+        out = io.StringIO()
+        failures = imp.run_batch(filenames, out, **options)
+        results = dict((os.path.relpath(result['file'], self.directory), result)
+                       for result in map(json.loads, out.getvalue().splitlines()))
+        return failures, results
+
+    def test_directory(self):
+        filenames = imp.batch_files(self.directory)
+        self.assertEquals(['copy.imp', 'division.imp', 'factorial.imp', 'loop.imp', 'syntax.imp'],
+                          sorted(os.path.basename(name) for name in filenames))
+        failures, results = self.run_batch(filenames, workers=2, timeout=0.5)
+        self.assertEquals(3, failures)
+        self.assertEquals({'n': 0, 'p': 120}, results['factorial.imp']['env'])
+        self.assertEquals({'x': 3, 'y': 3}, results[os.path.join('nested', 'copy.imp')]['env'])
+        self.assertEquals('division by zero', results['division.imp']['error'])
+        self.assertEquals({'x': 1}, results['division.imp']['env'])
+        self.assertEquals('Division by zero!\n', results['division.imp']['output'])
+        self.assertEquals('parse error', results['syntax.imp']['error'])
+        self.assertEquals('timed out', results['loop.imp']['error'])
+        self.assertFalse('error' in results['factorial.imp'])
+
+    def test_other_exceptions(self):
+        filename = os.path.join(self.directory, 'overflow.imp')
+        with open(filename, 'w') as file:
+            file.write(overflow)
+        good = os.path.join(self.directory, 'factorial.imp')
+        failures, results = self.run_batch([filename, good], workers=2)
+        self.assertEquals(1, failures)
+        self.assertEquals({'n': 0, 'p': 120}, results['factorial.imp']['env'])
+        self.assertTrue(results['overflow.imp']['error'].startswith('OverflowError: '))
+        self.assertEquals({'x': 10 ** 401, 'i': 400}, results['overflow.imp']['env'])
+
+    def test_job_not_sent(self):
+        good = os.path.join(self.directory, 'factorial.imp')
+        failures, results = self.run_batch([Unpicklable(os.path.join(self.directory, 'copy.imp')), good], workers=1)
+        self.assertEquals(1, failures)
+        self.assertEquals({'n': 0, 'p': 120}, results['factorial.imp']['env'])
+        self.assertEquals('TypeError: cannot pickle this filename', results['copy.imp']['error'])
+        self.assertFalse('env' in results['copy.imp'])
+
+    def test_manifest(self):
+        manifest = os.path.join(self.directory, 'manifest')
+        with open(manifest, 'w') as file:
+            file.write('# programs to run\nfactorial.imp\n\nnested/copy.imp\n')
+        filenames = imp.batch_files(manifest)
+        self.assertEquals([os.path.join(self.directory, 'factorial.imp'),
+                           os.path.join(self.directory, 'nested/copy.imp')], filenames)
+        for engine in sorted(imp.engines):
+            failures, results = self.run_batch(filenames, engine=engine, optimize=True, workers=1)
+            self.assertEquals(0, failures)
+            self.assertEquals({'n': 0, 'p': 120}, results['factorial.imp']['env'])
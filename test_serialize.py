@@ -0,0 +1,123 @@
+#!/usr/bin/python3
+import io
+import os
+import mmap
+import pickle
+import tempfile
+import unittest
+from imp_lexer import *
+from imp_parser import *
+from imp_serialize import *
+from imp_intern import intern_tree
+from imp_slots import SlotAexp
+from imp_optimize import optimize
+from test_optimize import RandomPrograms
+
+def parse(code, backend='combinator'):
+    return imp_parse(imp_lex(code), backend=backend).value
+
+# Every node class, operator and kind of field
+every_node = BlockStatement((
+    AssignStatement('x', BinopAexp('+', IntAexp(0), BinopAexp('-', IntAexp(-1), IntAexp(2 ** 100)))),
+    AssignStatement('y', BinopAexp('*', VarAexp('x'), BinopAexp('/', IntAexp(-(2 ** 70)), IntAexp(127)))),
+    IfStatement(AndBexp(RelopBexp('<', VarAexp('x'), IntAexp(128)),
+                        NotBexp(RelopBexp('<=', IntAexp(1), VarAexp('y')))),
+                CompoundStatement(PrintStatement(VarAexp('x')), BlockStatement(())), None),
+    IfStatement(OrBexp(RelopBexp('>', VarAexp('y'), VarAexp('x')), BoolBexp(False)),
+                WhileStatement(RelopBexp('>=', VarAexp('x'), IntAexp(1)), AssignStatement('x', IntAexp(0))),
+                ForStatement(BoolBexp(True), AssignStatement('y', IntAexp(1)))),
+    WhileStatement(AndBexp(RelopBexp('=', VarAexp('x'), IntAexp(1)), RelopBexp('==', VarAexp('x'), IntAexp(1))),
+                   AssignStatement('z', VarAexp('x'))),
+    IfStatement(RelopBexp('!=', VarAexp('x'), IntAexp(1)), AssignStatement('variäble', IntAexp(1)), None),
+))
+
+class TestSerialize(unittest.TestCase):
+    def round_trip(self, ast):
+        data = dumps(ast)
+        self.assertEqual(ast, loads(data))
+        return data
+
+    def test_every_node(self):
+        self.round_trip(every_node)
+        self.assertEqual(every_node.statements[0], loads(dumps(every_node.statements[0])))
+
+    def test_random_programs(self):
+        for seed in range(200):
+            program = parse(RandomPrograms(seed).statements(3))
+            self.round_trip(program)
+            # Optimized programs have negative literals, Boolean constants and temporaries
+            self.round_trip(optimize(program))
+
+    def test_names_written_once(self):
+        data = self.round_trip(parse('counter := counter + 1; counter := counter * counter'))
+        self.assertEqual(1, data.count(b'counter'))
+
+    def test_small_values(self):
+        # An assignment of a small literal to a known name is four bytes, and x := 0 - 1 seven
+        data = self.round_trip(parse('x := 1; x := 63; x := 0 - 1'))
+        self.assertEqual(len(magic) + 1 + 2 + (4 + 2) + 4 + 7, len(data))
+
+    def test_deep_tree(self):
+        depth = 5000
+        code = 'while x < 1 do ' * depth + 'x := ' + '(' * depth + '1' + ' + 1)' * depth + ' end' * depth
+        # Too deep to compare with ==, which recurses, so compared by writing it out again
+        data = dumps(parse(code, backend='stack'))
+        program = loads(data)
+        self.assertEqual(data, dumps(program))
+        for i in range(depth):
+            program = program.body
+        self.assertTrue(isinstance(program, AssignStatement))
+
+    def test_interned(self):
+        program = intern_tree(parse('x := y + 1; z := y + 1'))
+        self.assertEqual(dumps(parse('x := y + 1; z := y + 1')), self.round_trip(program))
+
+    def test_buffers(self):
+        data = dumps(every_node)
+        self.assertEqual(every_node, loads(bytearray(data)))
+        self.assertEqual(every_node, loads(memoryview(data)))
+        self.assertEqual(every_node, loads(memoryview(bytearray(data)).cast('b')))
+        self.assertEqual(every_node, load(io.BytesIO(data)))
+
+    def test_file(self):
+        handle, filename = tempfile.mkstemp()
+        try:
+            with os.fdopen(handle, 'wb') as file:
+                dump(every_node, file)
+            with open(filename, 'rb') as file:
+                self.assertEqual(every_node, load(file))
+            with open(filename, 'rb') as file:
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+                    self.assertEqual(every_node, loads(mapping))
+        finally:
+            os.remove(filename)
+
+    def test_streamed_in_chunks(self):
+        # Long programs are written out as they are encoded, not all at once
+        class Chunks:
+            def __init__(self):
+                self.chunks = []
+            def write(self, data):
+                self.chunks.append(bytes(data))
+        out = Chunks()
+        program = parse('; '.join('x%d := %d' % (i, i) for i in range(20000)))
+        dump(program, out)
+        self.assertTrue(len(out.chunks) > 1)
+        self.assertEqual(program, loads(b''.join(out.chunks)))
+
+    def test_smaller_than_pickle(self):
+        program = parse('; '.join('x%d := y * (x%d + %d)' % (i % 10, i % 7, i) for i in range(1000)))
+        self.assertTrue(len(dumps(program)) * 2 < len(pickle.dumps(program, pickle.HIGHEST_PROTOCOL)))
+
+    def test_corrupt_data(self):
+        data = dumps(every_node)
+        wrong_version = data[:4] + bytes([format_version + 1]) + data[5:]
+        for corrupt in [b'', b'PICKLE', wrong_version, data[:-3], data + b'\x00', data[:5] + b'\xff']:
+            with self.assertRaises(RuntimeError):
+                loads(corrupt)
+
+    def test_unsupported_nodes(self):
+        for node in [AssignStatement('x', SlotAexp('y', 0)), AssignStatement('x', IntAexp(1.5)),
+                     AssignStatement('x', BinopAexp('%', IntAexp(1), IntAexp(2)))]:
+            with self.assertRaises(RuntimeError):
+                dumps(node)
@@ -0,0 +1,24 @@
+#!/usr/bin/python3
+import unittest
+from imp_lexer import *
+from imp_parser import *
+from imp_slots import *
+from test_vm import EngineTests
+
+class TestSlots(EngineTests, unittest.TestCase):
+    def execute(self, ast, env):
+        resolve(ast).eval(env)
+
+    def test_resolve(self):
+        program = resolve(imp_parse(imp_lex('x := y; y := x + 1')).value)
+        self.assertEquals(['x', 'y'], program.names)
+        expected = CompoundStatement(SlotAssignStatement('x', 0, BinopAexp('+', SlotAexp('y', 1), IntAexp(0))),
+                                     SlotAssignStatement('y', 1, BinopAexp('+', SlotAexp('x', 0), IntAexp(1))))
+        self.assertEquals(normalize(expected), program.statement)
+
+    def test_dict_view(self):
+        program = resolve(imp_parse(imp_lex('if y > 0 then x := 1 else z := y end')).value)
+        slots = program.slots({'y': 0, 'w': 4})
+        self.assertEquals([False, 0, False], slots)
+        program.statement.eval(slots)
+        self.assertEquals({'y': 0, 'z': 0}, program.as_dict(slots))
@@ -0,0 +1,80 @@
+#!/usr/bin/python3
+import os
+import shutil
+import tempfile
+import unittest
+import imp_to_python
+from imp_lexer import *
+from imp_parser import *
+from test_vm import EngineTests
+
+class TestToPython(EngineTests, unittest.TestCase):
+    def execute(self, ast, env):
+        imp_to_python.run(ast, env)
+
+    def test_division_by_zero_keeps_assignments(self):
+        program = imp_parse(imp_lex('x := 1; y := x / 0')).value
+        env = {}
+        with self.assertRaises(ZeroDivisionError):
+            imp_to_python.run(program, env)
+        self.assertEquals({'x': 1}, env)
+
+    def test_locals(self):
+        source = imp_to_python.translate(imp_parse(imp_lex('x := y')).value)
+        self.assertIn("v_x = env.get('x', False)", source)
+        self.assertIn('v_x = v_y + 0', source)
+
+    def test_deep_nesting_falls_back(self):
+        depth = 30
+        code = 'while x < 1 do ' * depth + 'x := 1' + ' end' * depth
+        program = imp_parse(imp_lex(code)).value
+        with self.assertRaises(RuntimeError):
+            imp_to_python.compile_ast(program)
+        self.program_test(code, {'x': 1})
+
+class TestCodeCache(unittest.TestCase):
+    source = 'n := 5; p := 1; while n > 0 do p := p * n; n := n - 1 end'
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        imp_to_python.memory_cache.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        imp_to_python.memory_cache.clear()
+
+    def run_source(self, source):
+        env = {}
+        imp_to_python.load(source, self.directory)(env)
+        return env
+
+    def test_cached_in_memory_and_on_disk(self):
+        self.assertEquals({'n': 0, 'p': 120}, self.run_source(self.source))
+        key = imp_to_python.source_key(self.source)
+        self.assertIn(key, imp_to_python.memory_cache)
+        self.assertEquals([key + '.code'], os.listdir(self.directory))
+
+    def test_loaded_from_disk(self):
+        self.run_source(self.source)
+        imp_to_python.memory_cache.clear()
+        # A cached program is not parsed again: with the parser broken it still runs
+        parse = imp_to_python.imp_parse
+        imp_to_python.imp_parse = None
+        try:
+            self.assertEquals({'n': 0, 'p': 120}, self.run_source(self.source))
+        finally:
+            imp_to_python.imp_parse = parse
+
+    def test_changed_source(self):
+        self.run_source(self.source)
+        self.assertEquals({'n': 0, 'p': 6}, self.run_source(self.source.replace('5', '3')))
+        self.assertEquals(2, len(os.listdir(self.directory)))
+
+    def test_corrupt_cache_file(self):
+        key = imp_to_python.source_key(self.source)
+        with open(os.path.join(self.directory, key + '.code'), 'wb') as file:
+            file.write(b'\x00garbage')
+        self.assertEquals({'n': 0, 'p': 120}, self.run_source(self.source))
+
+    def test_parse_error(self):
+        self.assertEquals(None, imp_to_python.load('x := ', self.directory))
@@ -0,0 +1,108 @@
+#!/usr/bin/python3
+import io
+import unittest
+import contextlib
+from imp_lexer import *
+from imp_parser import *
+from imp_vm import *
+
+# Programs every engine must run to the same final environment as the tree walker; mixed into a TestCase that
+# defines execute(ast, env) for the engine under test
+class EngineTests:
+    def program_test(self, code, expected_env=None, env=None):
+        result = imp_parse(imp_lex(code))
+        self.assertNotEquals(None, result)
+        program = result.value
+        tree_env = dict(env or {})
+        program.eval(tree_env)
+        engine_env = dict(env or {})
+        self.execute(program, engine_env)
+        self.assertEquals(tree_env, engine_env)
+        if expected_env is not None:
+            self.assertEquals(expected_env, engine_env)
+
+    def test_assign(self):
+        self.program_test('x := 1', {'x': 1})
+
+    def test_copy(self):
+        self.program_test('x := 1; y := x; x := 2', {'x': 2, 'y': 1})
+
+    def test_unassigned_variable(self):
+        self.program_test('x := y + 1', {'x': 1})
+        self.program_test('x := y', {'x': 0})
+        self.program_test('if y < 1 then x := 1 end', {'x': 1})
+
+    def test_initial_env(self):
+        self.program_test('x := x * 2', {'x': 42}, {'x': 21})
+
+    def test_arithmetic(self):
+        self.program_test('x := 2 + 3 * 4 - (5 - 1) * 2; y := x * (x + 1) - x / 2')
+
+    def test_nested_operands(self):
+        self.program_test('a := 3; b := 4; a := (a + b) * (a - b) + a * (b - (a + 1))')
+
+    def test_if(self):
+        self.program_test('if 1 < 2 then x := 1 else x := 2 end', {'x': 1})
+        self.program_test('if 2 < 1 then x := 1 else x := 2 end', {'x': 2})
+        self.program_test('if 2 < 1 then x := 1 end', {})
+
+    def test_relops(self):
+        for op in ['<', '<=', '>', '>=', '=', '!=']:
+            for left, right in [(1, 2), (2, 2), (3, 2)]:
+                self.program_test('if %d %s %d then x := 1 else x := 2 end' % (left, op, right))
+                self.program_test('if not %d %s %d then x := 1 else x := 2 end' % (left, op, right))
+
+    def test_logic(self):
+        conditions = ['a < 1 and b < 1', 'a < 1 or b < 1', 'not (a < 1 and b < 1)', 'not (a < 1 or b < 1)',
+                      'a < 1 and b < 1 or c < 1', 'a < 1 or b < 1 and c < 1', '(a < 1 or b < 1) and c < 1',
+                      'not not a < 1 and not (b < 1 or not c < 1)']
+        for condition in conditions:
+            for a in [0, 1]:
+                for b in [0, 1]:
+                    for c in [0, 1]:
+                        self.program_test('a := %d; b := %d; c := %d; if %s then x := 1 else x := 2 end' %
+                                          (a, b, c, condition))
+                        # a flips and i counts up every iteration, so every loop ends after at most three
+                        self.program_test('a := %d; b := %d; c := %d; i := 0; '
+                                          'while i < 3 and (%s) do i := i + 1; a := 1 - a; c := c + b end' %
+                                          (a, b, c, condition))
+
+    def test_while(self):
+        self.program_test('x := 10; y := 0; while x > 0 do y := y + 1; x := x - 1 end', {'x': 0, 'y': 10})
+        self.program_test('x := 0; while x > 0 do x := x - 1 end', {'x': 0})
+
+    def test_factorial(self):
+        self.program_test('n := 5; p := 1; while n > 0 do p := p * n; n := n - 1 end', {'n': 0, 'p': 120})
+
+    def test_nested_loops(self):
+        self.program_test('i := 0; s := 0; while i < 5 do j := 0; while j < i do s := s + i * j; j := j + 1 end; '
+                          'i := i + 1 end')
+
+    def test_division_by_zero(self):
+        program = imp_parse(imp_lex('x := 1 / 0')).value
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            with self.assertRaises(ZeroDivisionError):
+                self.execute(program, {})
+        self.assertEquals('Division by zero!\n', output.getvalue())
+
+    def test_print(self):
+        program = PrintStatement(BinopAexp('+', VarAexp('x'), IntAexp(1)))
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.execute(program, {'x': 41})
+        self.assertEquals('42\n', output.getvalue())
+
+class TestVM(EngineTests, unittest.TestCase):
+    def execute(self, ast, env):
+        run(compile_program(ast), env)
+
+    def test_registers(self):
+        # p := p * n compiles to a single MUL straight into p's register
+        code = compile_program(imp_parse(imp_lex('p := p * n')).value)
+        self.assertEquals([(MUL, 0, 0, 1), (HALT, 0, 0, 0)], code.code)
+        self.assertEquals(['p', 'n'], code.names)
+
+    def test_constants_shared(self):
+        code = compile_program(imp_parse(imp_lex('x := 1; y := 1; z := 2')).value)
+        self.assertEquals({3: 1, 4: 2}, code.constants)